@@ -0,0 +1,706 @@
+"""FastAPI inference service (no Streamlit, no torch/torchvision).
+
+Run it on its own and point the Streamlit UI (app.py) at it::
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+    python api.py                     # same, honours API_HOST / API_PORT
+"""
+import numpy as np
+import os
+import time
+from fastapi import FastAPI, File, UploadFile, Form, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from typing import List, Optional
+import asyncio
+from batching import MicroBatcher
+from executors import Overloaded, preprocess_pool, inference_pool
+from hotreload import ModelStore, VersionedTask
+from common.registry import EMBEDDING_OUTPUT, EMBEDDINGS, run_session
+from workerpool import INFERENCE_PROCESSES, InferenceWorkerPool
+from common.postprocess import TOP_K, top_k
+from tta import MAX_VIEWS, TTA_VIEWS, augment, summarize, view_maps
+from common.preprocessing import (
+    FAST_MODE_CONFIDENCE, FAST_MODE_SIZE, INPUT_SIZE, decode_image, preprocess_image, to_chw,
+)
+from common.archives import read_archive
+from batch_inference import assign_tasks, predict_many
+from common.forms import read_image_form
+from streaming import UploadStreamingResponse, stream_predictions
+from common.validation import InvalidImage, check_content_length
+from cache import PredictionCache, file_hash
+from similarity import IVF_NPROBE, EmbeddingsDisabled, SimilarityIndex
+from jobs import JobRunner, make_broker
+from gradcam import GRADCAM_FORMATS, GRADCAM_SIZE, GradCamEngine
+from common.metrics import InstrumentationMiddleware, current_trace, metrics
+from common.negotiation import CATALOG_MAX_AGE, VARY, etag, etag_matches, render, response_format
+
+# Create FastAPI app for API endpoints
+app = FastAPI()
+
+# Configure CORS to allow requests from your React app
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # For development, you can restrict this to your React app's URL in production
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Request counts, latency histograms, stage timings and optional Server-Timing headers
+app.add_middleware(InstrumentationMiddleware)
+
+# Validated model information (tasks also answer to their aliases) and the lazily
+# built, warmed sessions for it, LRU-evicted under MODEL_MEMORY_BUDGET_MB. Changes to
+# model_info.json or the model files are picked up and swapped in as a new version.
+model_store = ModelStore()
+
+# With INFERENCE_PROCESSES > 0, inference runs in separate worker processes and
+# this process keeps only I/O and decoding
+worker_pool = InferenceWorkerPool(model_store.current.model_info) if INFERENCE_PROCESSES > 0 else None
+model_store.worker_pool = worker_pool
+
+# Colour-mapped Grad-CAM heatmaps, memory-mapped once at startup
+gradcam_engine = GradCamEngine(model_store.current.model_info)
+
+@app.on_event("startup")
+def load_models():
+    if worker_pool is not None:
+        worker_pool.start()
+    else:
+        model_store.current.registry.start()
+    try:
+        gradcam_engine.load()
+    except Exception as e:
+        print(f"Error loading Grad-CAM heatmaps: {str(e)}")
+    # Build the TTA index maps now rather than on the first tta request
+    view_maps(3, INPUT_SIZE, INPUT_SIZE)
+    model_store.start()
+
+@app.on_event("shutdown")
+def stop_workers():
+    model_store.stop()
+    if worker_pool is not None:
+        worker_pool.close()
+
+# After a model swap: drop cached results of changed tasks and reload the heatmaps
+def on_model_swap(old, new):
+    global gradcam_engine
+    for task in new.changed:
+        prediction_cache.invalidate(task)
+    engine = GradCamEngine(new.model_info)
+    engine.load()
+    gradcam_engine = engine
+
+model_store.on_swap(on_model_swap)
+
+# Run the model on an (N, C, H, W) batch and return the raw logits (or another output)
+def run_model(model, image_tensor, output_name=None):
+    return run_session(model, image_tensor, output_name)
+
+# Turn a batch of logits into one API response per row, tagged with the model version
+def format_predictions(task, logits, version=None, temperature=None):
+    version = version or model_store.current
+    catalog = version.catalog
+    if temperature is None:
+        temperature = catalog.temperature(task)
+    topk = top_k(logits, min(TOP_K, catalog.num_classes(task)), temperature)
+    results = []
+    for row in range(len(topk.classes)):
+        if not topk.finite[row]:
+            results.append({"error": "Model returned non-finite logits"})
+            continue
+        candidates = []
+        for class_id, probability in zip(topk.classes[row].tolist(), topk.probabilities[row].tolist()):
+            class_info = catalog.class_info(task, class_id)
+            candidates.append({"prediction": class_id, "class_name": class_info['class'], "confidence": probability * 100})
+        best = candidates[0]
+        results.append({
+            "prediction": best["prediction"],
+            "confidence": best["confidence"],
+            "class_name": best["class_name"],
+            "class_desc": catalog.class_info(task, best["prediction"])['desc'],
+            "top_k": candidates,
+            "model_version": version.number,
+        })
+    return results
+
+# Turn the logits of a single image into the API response
+def format_prediction(task, logits, version=None, temperature=None):
+    result = format_predictions(task, logits, version, temperature)[0]
+    if "error" in result:
+        raise ValueError(result["error"])
+    return result
+
+# Average the logits of the TTA views into one response with an uncertainty score
+def format_tta(task, logits, version=None):
+    version = version or model_store.current
+    summary = summarize(logits, version.catalog.temperature(task))
+    # The averaged log-probabilities are already calibrated
+    result = format_prediction(task, summary.log_probs[np.newaxis], version, temperature=1.0)
+    result["tta"] = {
+        "views": summary.views,
+        "uncertainty": summary.uncertainty,
+        "agreement": summary.agreement,
+        "probabilities": np.exp(summary.log_probs).tolist(),
+    }
+    return result
+
+# TTA request option: true/1/yes/on for TTA_VIEWS views, a view count, or off
+def parse_tta(value):
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return 0
+    if value in ("1", "true", "yes", "on"):
+        return TTA_VIEWS
+    if value.isdigit() and 2 <= int(value) <= MAX_VIEWS:
+        return int(value)
+    raise ValueError(f"tta must be true/false or a view count from 2 to {MAX_VIEWS}")
+
+# Declared input (channels, size, dtype) of the model serving `task` in `version`;
+# loads the model on first use, so call it from a pool thread
+def input_spec(task, version):
+    if worker_pool is not None:
+        return worker_pool.input_spec(task, version.number)
+    return version.registry.input_spec(task)
+
+# Side of the low-resolution first pass, or None when fast mode is off or the model's
+# spatial dimensions are fixed
+def fast_mode_size(spec):
+    if FAST_MODE_SIZE and spec.dynamic and FAST_MODE_SIZE < min(spec.size(INPUT_SIZE)):
+        return FAST_MODE_SIZE
+    return None
+
+# Decode and preprocess on a pool thread straight to the model's declared input (or to
+# the fast-mode size), reporting the size used (None: native) and both stage timings
+def decode_and_preprocess(image_bytes, task, version, fast=False):
+    spec = input_spec(task, version)
+    size = fast_mode_size(spec) if fast else None
+    started = time.perf_counter()
+    image = decode_image(image_bytes, size or spec.size(INPUT_SIZE), grayscale=spec.channels == 1)
+    decoded = time.perf_counter()
+    image_tensor = to_chw(image, channels=spec.channels, dtype=spec.dtype)
+    return image_tensor, size, (decoded - started) * 1000.0, (time.perf_counter() - decoded) * 1000.0
+
+# Preprocess an upload on the decode pool and record the decode/preprocess stages
+async def preprocess_upload(image_bytes, task, version, fast=False):
+    trace = current_trace()
+    image_tensor, size, decode_ms, preprocess_ms = await asyncio.get_running_loop().run_in_executor(
+        preprocess_pool, decode_and_preprocess, image_bytes, task, version, fast
+    )
+    trace.add("decode", decode_ms)
+    trace.add("preprocess", preprocess_ms)
+    return image_tensor, size
+
+# Grad-CAM overlays are drawn on a GRADCAM_SIZE RGB image, whatever the model's input is
+def gradcam_input(image_bytes, image_tensor):
+    if image_tensor.shape[1:] == (3, GRADCAM_SIZE, GRADCAM_SIZE) and image_tensor.dtype == np.float32:
+        return image_tensor
+    return preprocess_image(image_bytes, GRADCAM_SIZE)
+
+# Perform prediction
+def predict(task, model, image_tensor):
+    return format_prediction(task, run_model(model, image_tensor))
+
+# Batched inference entry point; micro-batches are keyed by VersionedTask so they run
+# on the version their requests started on, other callers get the current version
+def run_batch(task, batch, output_name=None):
+    if isinstance(task, VersionedTask):
+        task, version = task.task, model_store.get(task.version)
+    else:
+        version = model_store.current
+    if worker_pool is not None:
+        return worker_pool.run_batch(task, batch, version.number, output_name)
+    return run_model(version.registry.get(task), batch, output_name)
+
+# run_batch, format_predictions and input_spec pinned to one serving version
+def pinned(version):
+    return (
+        lambda task, batch: run_batch(VersionedTask(task, version.number), batch),
+        lambda task, logits: format_predictions(task, logits, version),
+        lambda task: input_spec(task, version),
+    )
+
+# Coalesce concurrent /predict requests per task into single ONNX calls
+batcher = MicroBatcher(run_batch, executor=inference_pool)
+
+# Once a version has drained, stop its micro-batch workers and drop its queues
+model_store.on_retire(
+    lambda number: batcher.discard(lambda task: isinstance(task, VersionedTask) and task.version == number)
+)
+
+# Results keyed on image hash + task + model file hash; hits carry the serving model_version
+prediction_cache = PredictionCache(
+    lambda task: model_store.current.registry.model_path(task), model_version=lambda: model_store.current.number
+)
+
+# Background classification of /jobs submissions (JOBS_BROKER picks the storage)
+job_runner = JobRunner(make_broker(), lambda: pinned(model_store.current), prediction_cache)
+
+# Encode a response as the client negotiated (compact, MessagePack, compressed), counting
+# the bytes sent; large bodies (batches, Grad-CAM overlays) are rendered on the decode pool
+def negotiated(payload, fmt, status_code=200, headers=None):
+    response = render(payload, fmt, status_code, headers)
+    metrics.inc("response_bytes_total", len(response.body), media_type=fmt.media_type,
+                encoding=response.headers.get("content-encoding", "identity"))
+    return response
+
+async def negotiated_in_pool(payload, fmt):
+    return await asyncio.get_running_loop().run_in_executor(preprocess_pool, negotiated, payload, fmt)
+
+# Public catalog and its ETag, built once per serving version
+catalog_documents = {}
+
+def catalog_document(version):
+    cached = catalog_documents.get(version.number)
+    if cached is None:
+        document = version.catalog.describe()
+        cached = (document, etag(document))
+        catalog_documents.clear()
+        catalog_documents[version.number] = cached
+    return cached
+
+# Per-task embedding stores for similar-case search (EMBEDDINGS=1)
+similarity_index = SimilarityIndex()
+
+# Embedding store of the model `task` is served with in `version`
+def similarity_store(task, version):
+    model_name = version.catalog[task]["model_name"]
+    return similarity_index.store(model_name, file_hash(version.registry.model_path(task)))
+
+# Decode, preprocess and embed one upload with the model of `task`
+async def embed_upload(task, version, image):
+    if not EMBEDDINGS:
+        raise EmbeddingsDisabled("Similar-case search is disabled; start the server with EMBEDDINGS=1")
+    loop = asyncio.get_running_loop()
+    trace = current_trace()
+    trace.task = task
+    with trace.stage("upload_read"):
+        image_bytes = await image.read()
+    image_tensor, _ = await preprocess_upload(image_bytes, task, version)
+    with trace.stage("inference"):
+        embedding = await loop.run_in_executor(
+            inference_pool, run_batch, VersionedTask(task, version.number), image_tensor, EMBEDDING_OUTPUT
+        )
+    return embedding
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    await job_runner.stop()
+
+# Export component histograms and refresh model/cache gauges on every scrape
+metrics.describe("microbatch_size", "histogram", "Requests coalesced per ONNX call")
+metrics.describe("microbatch_queue_wait_ms", "histogram", "Time requests wait in the micro-batcher")
+metrics.describe("executor_queue_wait_ms", "histogram", "Time jobs wait for a pool thread")
+metrics.describe("executor_run_time_ms", "histogram", "Time jobs run on a pool thread")
+metrics.describe("executor_pending", "gauge", "Jobs queued or running per pool")
+metrics.describe("model_load_ms", "gauge", "InferenceSession creation time per task")
+metrics.describe("model_warmup_ms", "gauge", "Warmup inference time per task")
+metrics.describe("model_version", "gauge", "Serving model version (bumped by every hot reload)")
+metrics.describe("model_ready", "gauge", "1 when the task's model is loaded and warm")
+metrics.describe("worker_utilization", "gauge", "Share of time each inference worker spends running sessions")
+metrics.describe("worker_in_flight", "gauge", "Batches queued on each inference worker")
+metrics.describe("worker_rows_total", "counter", "Images run by each inference worker")
+metrics.describe("model_memory_bytes", "gauge", "Memory attributed to each task's session when last loaded")
+metrics.describe("model_memory_used_bytes", "gauge", "Memory attributed to currently loaded sessions")
+metrics.describe("model_evictions_total", "counter", "Sessions evicted to stay within the memory budget")
+metrics.describe("prediction_cache_events_total", "counter", "Prediction cache hits, misses and evictions")
+metrics.describe("prediction_cache_entries", "gauge", "Entries in the in-process prediction cache")
+metrics.describe("fast_mode_total", "counter", "Fast-mode predictions kept at low resolution or escalated")
+metrics.describe("response_bytes_total", "counter", "Negotiated response body bytes by media type and encoding")
+metrics.attach("microbatch_size", batcher.batch_size_hist)
+metrics.attach("microbatch_queue_wait_ms", batcher.queue_wait_hist)
+for pool in (preprocess_pool, inference_pool):
+    metrics.attach("executor_queue_wait_ms", pool.queue_wait_hist, pool=pool.name)
+    metrics.attach("executor_run_time_ms", pool.run_time_hist, pool=pool.name)
+
+def collect_metrics(registry_):
+    for pool in (preprocess_pool, inference_pool):
+        registry_.set("executor_pending", pool.stats()["pending"], pool=pool.name)
+    registry = model_store.current.registry
+    registry_.set("model_version", model_store.current.number)
+    for task, status in registry.status()["models"].items():
+        registry_.set("model_ready", int(status["state"] == "ready"), task=task)
+        if "load_ms" in status:
+            registry_.set("model_load_ms", status["load_ms"], task=task)
+            registry_.set("model_warmup_ms", status["warmup_ms"], task=task)
+            registry_.set("model_memory_bytes", status["memory_bytes"], task=task)
+    registry_.set("model_memory_used_bytes", registry.memory_used())
+    if worker_pool is not None:
+        for worker in worker_pool.stats()["workers"]:
+            registry_.set("worker_utilization", worker["utilization"], worker=worker["index"])
+            registry_.set("worker_in_flight", worker["in_flight"], worker=worker["index"])
+            registry_.set("worker_rows_total", worker["rows"], worker=worker["index"])
+    registry_.set("model_evictions_total", registry.evictions)
+    cache_stats = prediction_cache.stats()
+    for event in ("memory_hits", "disk_hits", "misses", "evictions", "expirations", "invalidations"):
+        registry_.set("prediction_cache_events_total", cache_stats[event], event=event)
+    registry_.set("prediction_cache_entries", cache_stats["entries"])
+
+metrics.on_collect(collect_metrics)
+
+# Multipart form accepted by /predict (parsed by hand, so documented here)
+PREDICT_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["image"],
+            "properties": {
+                "image": {"type": "string", "format": "binary"},
+                "task": {"type": "string"},
+                "grad_cam": {"type": "string", "enum": sorted(GRADCAM_FORMATS)},
+                "tta": {"type": "string", "description": f"true, or a view count up to {MAX_VIEWS}"},
+            },
+        }}},
+    },
+}
+
+# FastAPI endpoint for prediction
+# Pass grad_cam=png|webp to also get the Grad-CAM overlay as a data URL, and tta=true
+# (or a view count) to average flipped/rotated/cropped views run as one batch.
+# The upload is validated while it streams in (size cap, format and dimensions from
+# the header, task as soon as its field arrives); `task` may also be sent as a query
+# parameter so an unknown task is rejected before any of the body is read.
+# ?compact=true (or Prefer: return=minimal) leaves out the class texts, see /catalog;
+# Accept: application/msgpack and Accept-Encoding: br/gzip are honoured too.
+@app.post("/predict", openapi_extra=PREDICT_FORM)
+async def predict_api(request: Request, task: Optional[str] = None):
+    trace = current_trace()
+    version = model_store.current
+    catalog = version.catalog
+    fmt = response_format(request)
+
+    # Unknown tasks are rejected with a 400, like on the other endpoints
+    def resolve_task(name):
+        canonical = catalog.canonical(name)
+        if canonical is None:
+            raise InvalidImage(f"Unknown task type: {name}")
+        return canonical
+
+    try:
+        check_content_length(request.headers)
+        if task is not None:
+            task = resolve_task(task)
+
+        # Read image file
+        with trace.stage("upload_read"):
+            fields, image_bytes = await read_image_form(request, resolve_task)
+        task = task or fields.get("task")
+        if task is None:
+            raise InvalidImage("Missing 'task'")
+        grad_cam = fields.get("grad_cam")
+        if grad_cam is not None and grad_cam not in GRADCAM_FORMATS:
+            raise ValueError(f"grad_cam must be one of {sorted(GRADCAM_FORMATS)}")
+        tta = parse_tta(fields.get("tta"))
+        trace.task = task
+        
+        # Re-uploads of the same image are answered from the cache (TTA results are not cached)
+        loop = asyncio.get_running_loop()
+        cache_key, result = None, None
+        if not tta:
+            with trace.stage("cache_lookup"):
+                cache_key, result = await loop.run_in_executor(preprocess_pool, prediction_cache.lookup, task, image_bytes)
+        if result is not None and grad_cam is None:
+            return negotiated(result, fmt)
+
+        # Preprocess on the decode pool, then queue for batched inference. In fast mode a
+        # new image is first classified at FAST_MODE_SIZE px
+        image_tensor, fast_size = await preprocess_upload(image_bytes, task, version, fast=result is None and not tta)
+        if tta:
+            # All views in one batch, straight to the inference pool rather than the micro-batcher
+            with trace.stage("augment"):
+                views = await loop.run_in_executor(preprocess_pool, augment, image_tensor, tta)
+            with trace.stage("inference"):
+                logits = await loop.run_in_executor(
+                    inference_pool, run_batch, VersionedTask(task, version.number), views
+                )
+            with trace.stage("postprocess"):
+                result = format_tta(task, logits, version)
+        elif result is None:
+            with trace.stage("inference"):
+                logits = await batcher.submit(VersionedTask(task, version.number, fast_size), image_tensor)
+            with trace.stage("postprocess"):
+                result = format_prediction(task, logits, version)
+            if fast_size:
+                # Keep the low-resolution answer when it is confident, otherwise redo it at full size
+                escalated = result["confidence"] < FAST_MODE_CONFIDENCE
+                metrics.inc("fast_mode_total", outcome="escalated" if escalated else "accepted")
+                if escalated:
+                    image_tensor, _ = await preprocess_upload(image_bytes, task, version)
+                    with trace.stage("inference"):
+                        logits = await batcher.submit(VersionedTask(task, version.number), image_tensor)
+                    with trace.stage("postprocess"):
+                        result = format_prediction(task, logits, version)
+                result = {**result, "fast_mode": {"size": fast_size, "escalated": escalated}}
+            prediction_cache.put(cache_key, result)
+
+        if grad_cam is not None:
+            with trace.stage("grad_cam"):
+                overlay = await loop.run_in_executor(
+                    preprocess_pool, lambda: gradcam_engine.render(
+                        catalog[task]["model_name"], result["prediction"], gradcam_input(image_bytes, image_tensor),
+                        grad_cam,
+                    ),
+                )
+            result = {**result, "grad_cam": overlay}
+        
+        with trace.stage("serialize"):
+            if grad_cam is not None:
+                return await negotiated_in_pool(result, fmt)
+            return negotiated(result, fmt)
+    except InvalidImage as e:
+        trace.error = True
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    except Overloaded as e:
+        trace.error = True
+        return JSONResponse(
+            status_code=503,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except Exception as e:
+        trace.error = True
+        return {"error": str(e)}
+
+# Batch endpoint: many images (or a zip/tar archive), each tagged with a task.
+# Send one `tasks` value for all images or one per image, in upload order.
+# The response is negotiated like /predict; large ones are worth compressing.
+@app.post("/predict/batch")
+async def predict_batch_api(
+    request: Request,
+    tasks: List[str] = Form(...),
+    images: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+):
+    try:
+        with current_trace().stage("upload_read"):
+            items = [(image.filename, await image.read()) for image in images or []]
+            if archive is not None:
+                items.extend(read_archive(await archive.read()))
+        if not items:
+            raise ValueError("No images submitted")
+        item_tasks = assign_tasks(tasks, len(items))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    version = model_store.current
+    results = [None] * len(items)
+    async for index, result in predict_many(items, item_tasks, *pinned(version), version.catalog, prediction_cache):
+        results[index] = result
+    return await negotiated_in_pool({"results": results}, response_format(request))
+
+# Streaming batch endpoint: one NDJSON line per image as soon as it is classified.
+# The multipart body is parsed lazily; a `task` field applies to the images after it.
+# Lines are always JSON; ?compact=true (or Prefer: return=minimal) leaves out the class texts.
+@app.post("/predict/batch/stream")
+async def predict_batch_stream_api(request: Request):
+    version = model_store.current
+    return UploadStreamingResponse(stream_predictions(
+        request, *pinned(version), version.catalog, prediction_cache, compact=response_format(request).compact
+    ))
+
+# Asynchronous bulk classification: same form as /predict/batch, answered at once with a job id
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    tasks: List[str] = Form(...),
+    images: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+):
+    try:
+        with current_trace().stage("upload_read"):
+            items = [(image.filename, await image.read()) for image in images or []]
+            if archive is not None:
+                items.extend(read_archive(await archive.read()))
+        if not items:
+            raise ValueError("No images submitted")
+        item_tasks = assign_tasks(tasks, len(items))
+        catalog = model_store.current.catalog
+        unknown = sorted({task for task in item_tasks if task not in catalog})
+        if unknown:
+            raise ValueError(f"Unknown task type: {', '.join(unknown)}")
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    job_id = await job_runner.submit([
+        (filename, catalog.resolve(task), image_bytes)
+        for (filename, image_bytes), task in zip(items, item_tasks)
+    ])
+    return {
+        "id": job_id,
+        "total": len(items),
+        "status_url": f"/jobs/{job_id}",
+        "results_url": f"/jobs/{job_id}/results",
+    }
+
+# Job progress: queued/running/finished plus per-state item counts
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    status = await asyncio.get_running_loop().run_in_executor(None, job_runner.broker.status, job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job: {job_id}"})
+    return status
+
+# Results of the job's finished items in upload order (partial while the job is running)
+@app.get("/jobs/{job_id}/results")
+async def job_results(request: Request, job_id: str):
+    loop = asyncio.get_running_loop()
+    status = await loop.run_in_executor(None, job_runner.broker.status, job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job: {job_id}"})
+    results = await loop.run_in_executor(None, job_runner.broker.results, job_id)
+    payload = {"id": job_id, "state": status["state"], "results": results}
+    return await negotiated_in_pool(payload, response_format(request))
+
+# Names, aliases and class texts of every task, for clients of compact results. Send the
+# ETag back in If-None-Match to revalidate, e.g. when results show a new model_version.
+@app.get("/catalog")
+async def catalog_api(request: Request):
+    document, tag = catalog_document(model_store.current)
+    headers = {"ETag": tag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers={**headers, "Vary": VARY})
+    return negotiated(document, response_format(request)._replace(compact=False), headers=headers)
+
+# Add a reference case to the similar-case index of `task`
+# (case_id defaults to the upload's filename)
+@app.post("/similar/cases")
+async def add_similar_case(
+    task: str = Form(...),
+    image: UploadFile = File(...),
+    case_id: Optional[str] = Form(None),
+):
+    version = model_store.current
+    try:
+        if task not in version.catalog:
+            raise ValueError(f"Unknown task type: {task}")
+        task = version.catalog.resolve(task)
+        embedding = await embed_upload(task, version, image)
+        store = similarity_store(task, version)
+        case_id = case_id or image.filename
+        row = await asyncio.get_running_loop().run_in_executor(None, store.add, embedding, [case_id])
+        return {"task": task, "case_id": case_id, "row": row[0], "cases": len(store)}
+    except InvalidImage as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    except EmbeddingsDisabled as e:
+        return JSONResponse(status_code=501, content={"error": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return {"error": str(e)}
+
+# The `k` indexed cases most similar to the upload (cosine similarity of embeddings).
+# approximate=true searches the IVF-PQ index, probing `nprobe` lists; exact otherwise.
+@app.post("/similar")
+async def similar_cases(
+    task: str = Form(...),
+    image: UploadFile = File(...),
+    k: int = Form(10),
+    approximate: bool = Form(False),
+    nprobe: int = Form(IVF_NPROBE),
+):
+    version = model_store.current
+    try:
+        if task not in version.catalog:
+            raise ValueError(f"Unknown task type: {task}")
+        task = version.catalog.resolve(task)
+        if not 1 <= k <= 1000:
+            raise ValueError("k must be between 1 and 1000")
+        embedding = await embed_upload(task, version, image)
+        store = similarity_store(task, version)
+        with current_trace().stage("search"):
+            neighbours = await asyncio.get_running_loop().run_in_executor(
+                None, store.search, embedding, k, approximate, max(1, nprobe)
+            )
+        return {
+            "task": task,
+            "model_version": version.number,
+            "cases": len(store),
+            "neighbours": [{"case_id": case_id, "similarity": score} for case_id, score in neighbours],
+        }
+    except InvalidImage as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    except EmbeddingsDisabled as e:
+        return JSONResponse(status_code=501, content={"error": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return {"error": str(e)}
+
+# Vectors, dimensionality and approximate-index state per embedding store
+@app.get("/stats/similar")
+async def similar_stats():
+    return similarity_index.stats()
+
+# Readiness probe: 503 until startup preloading has finished without errors
+@app.get("/ready")
+async def ready():
+    status = worker_pool.stats() if worker_pool is not None else model_store.current.registry.status()
+    status["model_version"] = model_store.current.number
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+# Batch-size and queue-wait histograms for tuning the micro-batcher
+@app.get("/stats/batching")
+async def batching_stats():
+    return batcher.stats()
+
+# Queue depth, queue-wait and run-time histograms for the decode and inference pools
+@app.get("/stats/executors")
+async def executor_stats():
+    return {
+        "preprocess": preprocess_pool.stats(),
+        "inference": inference_pool.stats(),
+    }
+
+# Prometheus metrics for requests, stages, models, batching, pools and the cache
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Per-model state, load times and memory, the session budget and evictions, and hot reloads
+@app.get("/stats/models")
+async def model_stats():
+    return {**model_store.current.registry.status(), "serving": model_store.status()}
+
+# Reload model_info.json and the models now instead of waiting for the watcher
+@app.post("/models/reload")
+async def reload_models():
+    version = await asyncio.get_running_loop().run_in_executor(None, model_store.reload)
+    status = model_store.status()
+    return JSONResponse(status_code=200 if version is not None else 500, content=status)
+
+# Per-process state and utilization of the inference worker pool
+@app.get("/stats/workers")
+async def worker_stats():
+    if worker_pool is None:
+        return {"processes": 0}
+    return worker_pool.stats()
+
+# Chunks, items and retries handled by the job runner
+@app.get("/stats/jobs")
+async def job_stats():
+    return job_runner.stats()
+
+# Hit/miss/eviction counters for the prediction cache
+@app.get("/stats/cache")
+async def cache_stats():
+    return prediction_cache.stats()
+
+# Drop cached predictions after a model swap (all tasks unless `task` is given)
+@app.post("/cache/invalidate")
+async def invalidate_cache(task: Optional[str] = Form(None)):
+    catalog = model_store.current.catalog
+    if task is not None:
+        if task not in catalog:
+            return JSONResponse(status_code=400, content={"error": f"Unknown task type: {task}"})
+        task = catalog.resolve(task)
+    return {"task": task, "invalidated": prediction_cache.invalidate(task)}
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.environ.get("API_HOST", "0.0.0.0"), port=int(os.environ.get("API_PORT", "8000")))
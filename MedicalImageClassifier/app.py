@@ -179,95 +179,98 @@
 
 
 
-import streamlit as st
-import onnxruntime as ort
-import numpy as np
-from PIL import Image
-import json
-import cv2
-from torchvision import transforms
+import atexit
+import base64
 import os
+import subprocess
+import sys
 import time
-from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
-import io
-from starlette.staticfiles import StaticFiles
-
-# Create FastAPI app for API endpoints
-app = FastAPI()
-
-# Configure CORS to allow requests from your React app
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # For development, you can restrict this to your React app's URL in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Load model information
-with open('utils/model_info.json', 'r') as f:
-    model_info = json.load(f)
-
-task_list = ["Select"]
-for task in model_info:
-    task_list.append(task)
-
-# Load models at the start of the app
-@st.cache_resource
-def load_model(model_path):
-    return ort.InferenceSession(model_path)
-
-# Preprocess image for the model
-def preprocess_image(image_bytes, input_size=224):
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    transform = transforms.Compose([
-        transforms.Resize((input_size, input_size)),
-        transforms.ToTensor(),
-    ])
-    transformed_image = transform(image)
-    return transformed_image.unsqueeze(0).numpy()
-
-# Perform prediction
-def predict(task, model, image_tensor):
-    input_name = model.get_inputs()[0].name
-    output_name = model.get_outputs()[0].name
-
-    outputs = model.run([output_name], {input_name: image_tensor})
-    probabilities = np.exp(outputs[0]) / np.sum(np.exp(outputs[0]), axis=1, keepdims=True)
-    predicted_class = np.argmax(probabilities, axis=1).item()
-    confidence = probabilities[0, predicted_class].item() * 100
-
-    predicted_class_name = model_info[task]["class_info"][str(predicted_class)]['class']
-    predicted_class_desc = model_info[task]["class_info"][str(predicted_class)]['desc']
-
-    result = {
-        "prediction": predicted_class,
-        "confidence": confidence,
-        "class_name": predicted_class_name,
-        "class_desc": predicted_class_desc,
-    }
 
-    return result
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from catalog import Catalog
+
+# The Streamlit UI is a thin client of the inference API (api.py), which runs in
+# its own process. Set API_URL to use an existing deployment; otherwise one is
+# started next to the UI on API_PORT.
+API_URL = os.environ.get("API_URL", "")
+API_PORT = int(os.environ.get("API_PORT", "8000"))
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", "60"))
+API_START_TIMEOUT = float(os.environ.get("API_START_TIMEOUT", "60"))
+
+# Task names for the sidebar; no models are loaded in the UI process
+catalog = Catalog.load()
+task_list = ["Select"] + list(catalog)
 
-# FastAPI endpoint for prediction
-@app.post("/predict")
-async def predict_api(image: UploadFile = File(...), task: str = Form(...)):
+# One pooled keep-alive HTTP session shared by all reruns and browser sessions
+@st.cache_resource
+def api_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Terminate and reap the api.py started by api_base_url
+def stop_api(process, timeout=10):
+    if process.poll() is not None:
+        return
+    process.terminate()
     try:
-        # Read image file
-        image_bytes = await image.read()
-        
-        # Load the selected model
-        model = load_model(f"{model_info[task]['model_path']}")
-        
-        # Preprocess image and make prediction
-        image_tensor = preprocess_image(image_bytes)
-        result = predict(task, model, image_tensor, )
-        
-        return result
-    except Exception as e:
-        return {"error": str(e)}
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+# Base URL of the API, starting api.py once per UI server when API_URL is unset;
+# returns once its /ready answers 200 (models loaded)
+@st.cache_resource
+def api_base_url():
+    if API_URL:
+        return API_URL.rstrip("/")
+
+    base_url = f"http://127.0.0.1:{API_PORT}"
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(app_dir, "api.py")],
+        cwd=app_dir,
+        env={**os.environ, "API_HOST": "127.0.0.1", "API_PORT": str(API_PORT)},
+    )
+    # The API lives as long as the UI server
+    atexit.register(stop_api, process)
+    deadline = time.monotonic() + API_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"api.py exited with status {process.returncode} while starting")
+        try:
+            if api_session().get(f"{base_url}/ready", timeout=1).status_code == 200:
+                return base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    # Failures are not cached, so the next call starts a fresh API
+    stop_api(process)
+    raise RuntimeError(f"The API at {base_url} was not ready after {API_START_TIMEOUT:g}s (API_START_TIMEOUT)")
+
+# Send one image to the API's /predict endpoint
+def classify(image_bytes, filename, task, grad_cam):
+    data = {"task": task}
+    if grad_cam:
+        data["grad_cam"] = "png"
+    response = api_session().post(
+        f"{api_base_url()}/predict",
+        files={"image": (filename, image_bytes)},
+        data=data,
+        timeout=API_TIMEOUT,
+    )
+    if response.status_code == 503:
+        raise RuntimeError(f"The server is busy, retry in {response.headers.get('Retry-After', '1')}s")
+    result = response.json()
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
 
 # Streamlit UI (separate from the API)
 def main():
@@ -297,36 +300,24 @@ def main():
     result_placeholder = st.empty()
 
     if classify_button and uploaded_file:
-        # UI version of classification
+        if task == "Select":
+            error_placeholder.error("Please select a task")
+            return
         try:
-            # Load the selected model
-            model = load_model(f"{model_info[task]['model_path']}")
-            
-            # Preprocess image and make prediction
-            image_bytes = uploaded_file.read()
-            image_tensor = preprocess_image(image_bytes)
-            result = predict(task, model, image_tensor)
-            
+            result = classify(uploaded_file.getvalue(), uploaded_file.name, task, generate_grad_cam_checkbox)
+
             with result_placeholder.container():
                 st.markdown("### Prediction Results")
                 st.write(f"**Prediction:** {result['class_name']}")
                 st.write(f"**Confidence:** {result['confidence']:.2f}%")
                 st.write(f"**Description:** {result['class_desc']}")
-                
+                if result.get("grad_cam"):
+                    overlay = base64.b64decode(result["grad_cam"].split(",", 1)[1])
+                    st.image(overlay, caption="Grad-CAM", width=224)
+
         except Exception as e:
             error_placeholder.error(f"An error occurred: {e}")
 
-# Run Streamlit UI when run directly
+# Run Streamlit UI (`streamlit run app.py`)
 if __name__ == "__main__":
-    # Run FastAPI with uvicorn on port 8501 (same as Streamlit's default)
-    import threading
-    
-    # Start FastAPI in a separate thread
-    def run_api():
-        uvicorn.run(app, host="0.0.0.0", port=8501)
-    
-    api_thread = threading.Thread(target=run_api, daemon=True)
-    api_thread.start()
-    
-    # Run Streamlit UI
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,156 @@
+"""Multi-image inference for /predict/batch.
+
+Items are grouped by task and split into chunks of ``BATCH_CHUNK_SIZE``.
+Every chunk is preprocessed straight into one preallocated NCHW array of
+the shape and dtype the task's model declares and sent through a single
+batched ``InferenceSession.run`` call. Failures are
+reported per item so one bad file never fails the whole request.
+"""
+import asyncio
+import contextlib
+import os
+
+import numpy as np
+
+from common.preprocessing import INPUT_SIZE, preprocess_image
+from executors import inference_pool, preprocess_pool
+
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "32"))
+
+
+def assign_tasks(tasks, count):
+    """Expand the submitted task list to one task per item."""
+    if len(tasks) == 1:
+        return tasks * count
+    if len(tasks) != count:
+        expected = "1 task value" if count == 1 else f"1 or {count} task values"
+        raise ValueError(f"Expected {expected}, got {len(tasks)}")
+    return list(tasks)
+
+
+def preprocess_chunk(images, out):
+    """Preprocess each image into its row of ``out``; returns an error string (or None) per image."""
+    errors = []
+    for row, image_bytes in enumerate(images):
+        try:
+            preprocess_image(image_bytes, out=out[row:row + 1])
+            errors.append(None)
+        except Exception as e:
+            errors.append(f"Error processing image: {str(e)}")
+    return errors
+
+
+async def predict_chunk(task, chunk, run_batch, format_predictions, input_spec, limiter=None, cache=None):
+    """Preprocess and run one same-task chunk of ``(index, filename, image_bytes)``.
+
+    Returns ``{index: result}``. ``input_spec(task)`` gives the model's
+    declared input (``registry.InputSpec``) the chunk is preprocessed to. ``limiter`` (an ``asyncio.Semaphore``) bounds
+    how many chunks are preprocessing at once. With a ``PredictionCache``,
+    cached images skip preprocessing and inference.
+    """
+    loop = asyncio.get_running_loop()
+    results = {}
+
+    keys = {}
+    if cache is not None:
+        try:
+            lookups = await loop.run_in_executor(
+                preprocess_pool, lambda: [cache.lookup(task, image_bytes) for _, _, image_bytes in chunk]
+            )
+        except Exception:
+            # A cache failure only costs the shortcut, never the prediction
+            lookups = [(None, None)] * len(chunk)
+        misses = []
+        for entry, (key, cached) in zip(chunk, lookups):
+            if cached is None:
+                keys[entry[0]] = key
+                misses.append(entry)
+            else:
+                results[entry[0]] = {"index": entry[0], "filename": entry[1], "task": task, **cached}
+        chunk = misses
+        if not chunk:
+            return results
+
+    async with limiter or contextlib.nullcontext():
+        try:
+            spec = await loop.run_in_executor(preprocess_pool, input_spec, task)
+            batch = np.empty((len(chunk), spec.channels, *spec.size(INPUT_SIZE)), dtype=spec.dtype)
+            errors = await loop.run_in_executor(
+                preprocess_pool, preprocess_chunk, [image_bytes for _, _, image_bytes in chunk], batch
+            )
+        except Exception as e:
+            errors = [str(e)] * len(chunk)
+
+    rows = [row for row, error in enumerate(errors) if error is None]
+    for row, error in enumerate(errors):
+        if error is not None:
+            results[chunk[row][0]] = item_error(chunk[row], task, error)
+    if not rows:
+        return results
+
+    try:
+        logits = await loop.run_in_executor(
+            inference_pool, run_batch, task, batch if len(rows) == len(chunk) else batch[rows]
+        )
+    except Exception as e:
+        # Overload or a failed worker, not a bad image: the same items may succeed later
+        for row in rows:
+            results[chunk[row][0]] = item_error(chunk[row], task, str(e), retryable=True)
+        return results
+
+    # Softmax and top-k run once over the whole chunk
+    try:
+        predictions = format_predictions(task, logits)
+    except Exception as e:
+        predictions = [{"error": str(e)}] * len(rows)
+    for row, prediction in zip(rows, predictions):
+        index, filename, _ = chunk[row]
+        if "error" in prediction:
+            results[index] = item_error(chunk[row], task, prediction["error"])
+            continue
+        if keys.get(index) is not None:
+            cache.put(keys[index], prediction)
+        results[index] = {"index": index, "filename": filename, "task": task, **prediction}
+    return results
+
+
+async def predict_many(items, item_tasks, run_batch, format_predictions, input_spec, catalog, cache=None):
+    """Yield ``(index, result)`` pairs as each chunk finishes.
+
+    ``items`` is a list of ``(filename, image_bytes)``; results carry the
+    item's ``index`` so callers can restore input order. Task aliases are
+    resolved through ``catalog``.
+    """
+    groups = {}
+    for index, name in enumerate(item_tasks):
+        entry = (index, *items[index])
+        task = catalog.canonical(name)
+        if task is not None:
+            groups.setdefault(task, []).append(entry)
+        else:
+            yield index, item_error(entry, name, f"Unknown task type: {name}")
+
+    # Keep at most one chunk per preprocessing worker in flight
+    limiter = asyncio.Semaphore(preprocess_pool.max_workers)
+    chunks = [
+        predict_chunk(
+            task, entries[start:start + BATCH_CHUNK_SIZE], run_batch, format_predictions, input_spec, limiter, cache
+        )
+        for task, entries in groups.items()
+        for start in range(0, len(entries), BATCH_CHUNK_SIZE)
+    ]
+    for finished in asyncio.as_completed(chunks):
+        for index, result in (await finished).items():
+            result.pop("retryable", None)
+            yield index, result
+
+
+def item_error(entry, task, message, retryable=False):
+    """Per-item error result. ``retryable`` marks failures worth another attempt
+    (see ``JobRunner``); callers pop the flag before returning or storing a result.
+    """
+    index, filename = entry[0], entry[1]
+    result = {"index": index, "filename": filename, "task": task, "error": message}
+    if retryable:
+        result["retryable"] = True
+    return result
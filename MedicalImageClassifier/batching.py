@@ -0,0 +1,145 @@
+"""Request-coalescing micro-batcher for ONNX inference.
+
+Concurrent /predict calls for the same task are collected for up to
+``max_wait_ms`` (or until ``max_batch_size`` requests are queued), stacked
+into a single NCHW batch and sent through one ``InferenceSession.run`` call.
+Each waiting request then receives its own row of the output.
+"""
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from common.metrics import Histogram
+from executors import Overloaded
+
+MAX_BATCH_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", "16"))
+MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "5"))
+MAX_QUEUE = int(os.environ.get("MICROBATCH_MAX_QUEUE", "256"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+QUEUE_WAIT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+class MicroBatcher:
+    """Coalesce single-image inference requests into per-task batches.
+
+    ``run_batch(task, batch)`` is called with an ``(N, C, H, W)`` array and
+    must return the model output for all ``N`` rows. It runs on ``executor``
+    (the loop's default executor when ``None``) so the event loop is never
+    blocked by inference. At most ``max_queue`` requests may wait per task;
+    further submissions raise ``executors.Overloaded``. Tasks that will not be
+    submitted again (e.g. a retired model version) are dropped with
+    ``discard``.
+    """
+
+    def __init__(self, run_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, executor=None,
+                 max_queue=MAX_QUEUE):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(1, int(max_queue))
+        self.executor = executor
+        self.batch_size_hist = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_hist = Histogram(QUEUE_WAIT_BUCKETS_MS)
+        self._queues = {}
+        self._workers = {}
+        self._loop = None
+
+    async def submit(self, task, image_tensor):
+        """Queue one ``(1, C, H, W)`` tensor and wait for its ``(1, num_classes)`` output."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            self._queue_for(task).put_nowait((image_tensor, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise Overloaded(f"batching[{task}]")
+        return await future
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_queue": self.max_queue,
+            "queue_depth": {str(task): queue.qsize() for task, queue in self._queues.items()},
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+        }
+
+    def discard(self, predicate):
+        """Stop the workers and drop the queues of every task for which ``predicate(task)`` is true.
+
+        Safe to call from any thread. Batches already running still complete;
+        requests still queued fail with ``executors.Overloaded``.
+        """
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._discard, predicate)
+
+    def _discard(self, predicate):
+        for task in [task for task in self._queues if predicate(task)]:
+            del self._queues[task]
+            self._workers.pop(task).cancel()
+
+    def _queue_for(self, task):
+        queue = self._queues.get(task)
+        if queue is None:
+            self._loop = asyncio.get_running_loop()
+            queue = self._queues[task] = asyncio.Queue(self.max_queue)
+            self._workers[task] = self._loop.create_task(self._worker(task, queue))
+        return queue
+
+    async def _worker(self, task, queue):
+        loop = asyncio.get_running_loop()
+        items = []
+        try:
+            while True:
+                items = [await queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(items) < self.max_batch_size:
+                    # Take whatever is already queued before waiting on the clock
+                    if not queue.empty():
+                        items.append(queue.get_nowait())
+                        continue
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        items.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                batch, items = items, []
+                # Shielded so a discard never abandons a batch that is already running
+                await asyncio.shield(self._dispatch(task, batch))
+        finally:
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(Overloaded(f"batching[{task}]"))
+
+    async def _dispatch(self, task, items):
+        # Drop requests whose callers have already gone away
+        items = [item for item in items if not item[1].done()]
+        if not items:
+            return
+
+        started = time.perf_counter()
+        for _, _, enqueued in items:
+            self.queue_wait_hist.observe((started - enqueued) * 1000.0)
+        self.batch_size_hist.observe(len(items))
+
+        batch = np.concatenate([tensor for tensor, _, _ in items], axis=0)
+        loop = asyncio.get_running_loop()
+        try:
+            outputs = await loop.run_in_executor(self.executor, self.run_batch, task, batch)
+        except Exception as e:
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for row, (_, future, _) in enumerate(items):
+            if not future.done():
+                future.set_result(outputs[row:row + 1])
@@ -0,0 +1,182 @@
+"""Cold-start profile and budget check for the API entry points.
+
+For each entry point (``api`` is MedicalImageClassifier/api.py, ``main`` is
+the repository's mock main.py) this reports:
+
+* an ``-X importtime`` summary of ``import <module>``. It gives the total,
+  the slowest top-level imports, and any heavy module that should only load
+  in the mode that needs it (torch, cv2, streamlit, onnxruntime, ...).
+* time to first prediction. The server is started as a fresh process and
+  ``/predict`` is retried until it answers, so process start, imports, the
+  startup hooks and the first model load are all counted.
+
+It exits non-zero when a budget is exceeded or a heavy module is imported:
+
+    python benchmarks/bench_coldstart.py
+    python benchmarks/bench_coldstart.py --entry api --first-prediction-budget-ms 3000
+    INFERENCE_PROCESSES=2 python benchmarks/bench_coldstart.py --entry api
+
+The server inherits the environment, so any serving mode can be profiled.
+Each measurement is the best of ``--runs`` fresh processes.
+"""
+import argparse
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from PIL import Image
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(APP_DIR)
+
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "1500"))
+FIRST_PREDICTION_BUDGET_MS = float(os.environ.get("FIRST_PREDICTION_BUDGET_MS", "5000"))
+
+# Modules no entry point may import just by being imported
+HEAVY_MODULES = ("torch", "torchvision", "cv2", "streamlit", "requests", "onnx", "onnxruntime")
+
+
+def entry_points():
+    with open(os.environ.get("MODEL_INFO_PATH", os.path.join(APP_DIR, "utils", "model_info.json"))) as f:
+        api_task = next(iter(json.load(f)))
+    # (directory, module, task used for the first prediction)
+    return {
+        "api": (APP_DIR, "api", api_task),
+        "main": (ROOT_DIR, "main", "pneumonia"),
+    }
+
+
+def import_profile(directory, module):
+    """``(total_ms, {top-level module: cumulative ms}, {imported module: cumulative ms})``"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=directory, capture_output=True, text=True, check=True,
+    )
+    top_level, imported = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        imported[name] = int(cumulative) / 1000.0
+        if depth == 1:
+            top_level[name] = int(cumulative) / 1000.0
+    return imported[module], top_level, imported
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def multipart(fields, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+        f"Content-Type: image/png\r\n\r\n".encode() + content + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def first_prediction(directory, module, task, image, timeout):
+    """Milliseconds from process start to the first listening socket and the first prediction."""
+    port = free_port()
+    body, content_type = multipart({"task": task}, "coldstart.png", image)
+    env = {**os.environ, "API_HOST": "127.0.0.1", "API_PORT": str(port), "MODEL_WATCH_INTERVAL": "0"}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, f"{module}.py"], cwd=directory, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    listening_ms = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"{module}.py exited with status {process.returncode}")
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}/predict", data=body, headers={"Content-Type": content_type}
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    result = json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                # Busy or still loading: the server is up, the prediction is not ready yet
+                listening_ms = listening_ms or (time.perf_counter() - started) * 1000.0
+                if e.code not in (500, 503):
+                    raise RuntimeError(f"/predict answered {e.code}: {e.read()[:200]!r}")
+                time.sleep(0.01)
+                continue
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+                continue
+            listening_ms = listening_ms or (time.perf_counter() - started) * 1000.0
+            if "prediction" in result:
+                return listening_ms, (time.perf_counter() - started) * 1000.0
+            time.sleep(0.01)
+        raise RuntimeError(f"No prediction from {module}.py within {timeout:g}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start profile with an import-time budget")
+    parser.add_argument("--entry", choices=["api", "main"], nargs="+", default=["api", "main"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--first-prediction-budget-ms", type=float, default=FIRST_PREDICTION_BUDGET_MS)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), (120, 80, 60)).save(buffer, format="PNG")
+    image = buffer.getvalue()
+
+    failures = []
+    report = {}
+    for entry in args.entry:
+        directory, module, task = entry_points()[entry]
+        profiles = [import_profile(directory, module) for _ in range(args.runs)]
+        import_ms, top_level, imported = min(profiles, key=lambda profile: profile[0])
+        heavy = {name: imported[name] for name in HEAVY_MODULES if name in imported}
+        timings = [first_prediction(directory, module, task, image, args.timeout) for _ in range(args.runs)]
+        listening_ms = min(timing[0] for timing in timings)
+        first_prediction_ms = min(timing[1] for timing in timings)
+        report[entry] = {
+            "import_ms": import_ms,
+            "slowest_imports_ms": dict(sorted(top_level.items(), key=lambda item: -item[1])[:args.top]),
+            "heavy_imports_ms": heavy,
+            "listening_ms": listening_ms,
+            "first_prediction_ms": first_prediction_ms,
+        }
+        if import_ms > args.import_budget_ms:
+            failures.append(f"{entry}: import took {import_ms:.0f} ms (budget {args.import_budget_ms:g} ms)")
+        if first_prediction_ms > args.first_prediction_budget_ms:
+            failures.append(f"{entry}: first prediction after {first_prediction_ms:.0f} ms "
+                            f"(budget {args.first_prediction_budget_ms:g} ms)")
+        if heavy:
+            failures.append(f"{entry}: imports {', '.join(sorted(heavy))} at module level")
+
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
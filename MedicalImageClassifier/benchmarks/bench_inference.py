@@ -0,0 +1,213 @@
+"""Reproducible inference benchmark: per-stage timings and /predict load sweep.
+
+Runs fully offline against tiny synthetic ONNX models and generated images
+(see tools/synthetic.py), so it works without the LFS model files:
+
+* stages: decode, preprocess_image, model inference, softmax/argmax
+  post-processing and JSON serialisation, timed individually;
+* endpoint: the full /predict route driven in-process through the ASGI app
+  (httpx.ASGITransport) at each level of a concurrency sweep.
+
+Latency percentiles (p50/p95/p99), requests per second and peak RSS are
+written as JSON so runs from different commits can be compared:
+
+    python benchmarks/bench_inference.py --output before.json
+    python benchmarks/bench_inference.py --output after.json --compare before.json
+
+``--compare`` exits non-zero when any p95 regresses by more than
+``--max-regression`` percent. Requires httpx for the endpoint sweep.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "tools"))
+
+import synthetic  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(timings_ms):
+    timings = np.asarray(timings_ms)
+    summary = {f"p{p}_ms": float(np.percentile(timings, p)) for p in PERCENTILES}
+    summary.update(mean_ms=float(timings.mean()), count=int(timings.size))
+    return summary
+
+
+def time_calls(fn, iterations, warmup=3):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return summarize(timings)
+
+
+def bench_stages(api, task, images, iterations):
+    model = api.model_store.current.registry.get(task)
+    image_bytes = images[0]
+    image_tensor = api.preprocess_image(image_bytes)
+    logits = api.run_model(model, image_tensor)
+    result = api.format_prediction(task, logits)
+    return {
+        "decode": time_calls(lambda: Image.open(io.BytesIO(image_bytes)).convert("RGB").load(), iterations),
+        "preprocess_image": time_calls(lambda: api.preprocess_image(image_bytes), iterations),
+        "predict": time_calls(lambda: api.run_model(model, image_tensor), iterations),
+        "postprocess": time_calls(lambda: api.format_prediction(task, logits), iterations),
+        "serialize": time_calls(lambda: json.dumps(result), iterations),
+    }
+
+
+async def bench_sweep(api, task, images, levels, requests_per_level):
+    # One event loop for the whole sweep: the micro-batcher's queues live on it
+    return [await bench_endpoint(api, task, images, level, requests_per_level) for level in levels]
+
+
+async def bench_endpoint(api, task, images, concurrency, requests_per_level):
+    import httpx
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = asyncio.Queue()
+        for i in range(requests_per_level):
+            queue.put_nowait(images[i % len(images)])
+        timings, errors = [], 0
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                image_bytes = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.post(
+                    "/predict", files={"image": ("bench.png", image_bytes)}, data={"task": task}
+                )
+                timings.append((time.perf_counter() - started) * 1000.0)
+                if response.status_code != 200 or "error" in response.json():
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(timings),
+        "errors": errors,
+        "rps": len(timings) / elapsed,
+        **summarize(timings),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=APP_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path, max_regression):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+
+    def check(name, new, old):
+        change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100.0 if old["p95_ms"] else 0.0
+        print(f"{name:<28} p95 {old['p95_ms']:9.3f} -> {new['p95_ms']:9.3f} ms ({change:+.1f}%)")
+        if change > max_regression:
+            regressions.append(name)
+
+    for stage, stats in current["stages"].items():
+        if stage in baseline.get("stages", {}):
+            check(f"stage:{stage}", stats, baseline["stages"][stage])
+    old_levels = {level["concurrency"]: level for level in baseline.get("endpoint", [])}
+    for level in current["endpoint"]:
+        if level["concurrency"] in old_levels:
+            check(f"endpoint:c{level['concurrency']}", level, old_levels[level["concurrency"]])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline inference benchmark")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per stage")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma-separated concurrency sweep")
+    parser.add_argument("--requests", type=int, default=256, help="requests per concurrency level")
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results JSON from an earlier run")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed p95 increase in percent")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output) if args.output else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    with open(os.path.join(APP_DIR, "utils", "model_info.json")) as f:
+        model_info = json.load(f)
+    os.makedirs(os.path.join(workdir, "utils"))
+    synthetic.build(workdir, model_info, images_per_class=1)
+    os.replace(os.path.join(workdir, "model_info.json"), os.path.join(workdir, "utils", "model_info.json"))
+
+    # Point api.py at the synthetic models; the cache is disabled so every request
+    # pays for real inference
+    os.environ["MODEL_INFO_PATH"] = os.path.join(workdir, "utils", "model_info.json")
+    os.environ.setdefault("PREDICTION_CACHE_SIZE", "0")
+    os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+    os.chdir(workdir)
+    import onnxruntime
+    import api
+
+    task = next(iter(model_info))
+    api.model_store.current.registry.load_all()
+    images = [synthetic.make_image((args.image_size, args.image_size), seed=i) for i in range(32)]
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "onnxruntime": onnxruntime.__version__,
+            "cpu_count": os.cpu_count(),
+            "task": task,
+            "image_size": args.image_size,
+        },
+        "stages": bench_stages(api, task, images, args.iterations),
+        "endpoint": asyncio.run(bench_sweep(
+            api, task, images, [int(level) for level in args.concurrency.split(",")], args.requests
+        )),
+    }
+    # ru_maxrss is reported in KiB on Linux
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    output = json.dumps(results, indent=2)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if compare_path:
+        regressions = compare(results, compare_path, args.max_regression)
+        if regressions:
+            print(f"FAIL: p95 regressed more than {args.max_regression}% in {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Bytes on the wire and render time of negotiated batch responses (common/negotiation.py).
+
+Builds ``--results`` predictions from random logits with the real catalog
+texts (the same ``format_predictions`` the API uses), so the results vary
+like real traffic does, and renders them as every combination of full or
+compact, JSON or MessagePack, and identity, gzip or brotli:
+
+    python benchmarks/bench_negotiation.py --results 1000
+
+MessagePack and brotli are skipped when their packages are not installed.
+The one-off ``/catalog`` download that compact clients need is reported
+too.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from common import negotiation  # noqa: E402
+from catalog import Catalog  # noqa: E402
+from common.negotiation import JSON, MSGPACK, ResponseFormat, render  # noqa: E402
+from common.postprocess import TOP_K, top_k  # noqa: E402
+
+
+def make_results(catalog, count, seed=0):
+    """``/predict/batch`` items shaped like api.format_predictions output."""
+    rng = np.random.default_rng(seed)
+    tasks = list(catalog)
+    results = []
+    for index in range(count):
+        task = tasks[index % len(tasks)]
+        logits = rng.normal(0, 2, (1, catalog.num_classes(task))).astype(np.float32)
+        topk = top_k(logits, min(TOP_K, catalog.num_classes(task)))
+        candidates = [
+            {"prediction": class_id, "class_name": catalog.class_info(task, class_id)["class"],
+             "confidence": probability * 100}
+            for class_id, probability in zip(topk.classes[0].tolist(), topk.probabilities[0].tolist())
+        ]
+        best = candidates[0]
+        results.append({
+            "index": index,
+            "filename": f"image_{index:05d}.png",
+            "task": task,
+            "prediction": best["prediction"],
+            "confidence": best["confidence"],
+            "class_name": best["class_name"],
+            "class_desc": catalog.class_info(task, best["prediction"])["desc"],
+            "top_k": candidates,
+            "model_version": 1,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Negotiated response size and render time")
+    parser.add_argument("--results", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    catalog = Catalog.load()
+    payload = {"results": make_results(catalog, args.results)}
+    media_types = [JSON] + ([MSGPACK] if negotiation.msgpack is not None else [])
+    encodings = [None, "gzip"] + (["br"] if negotiation.brotli is not None else [])
+
+    rows = []
+    baseline = None
+    for compact in (False, True):
+        for media_type in media_types:
+            for encoding in encodings:
+                fmt = ResponseFormat(compact, media_type, encoding)
+                size = len(render(payload, fmt).body)
+                ms = min(timeit.repeat(lambda: render(payload, fmt), number=1, repeat=args.repeat)) * 1000.0
+                baseline = baseline or size
+                rows.append({
+                    "format": f"{'compact' if compact else 'full'} {media_type.split('/')[1]} {encoding or 'identity'}",
+                    "bytes": size,
+                    "bytes_per_result": size / args.results,
+                    "percent_of_full_json": size / baseline * 100.0,
+                    "render_ms": ms,
+                })
+
+    document = catalog.describe()
+    catalog_bytes = {
+        encoding or "identity": len(render(document, ResponseFormat(encoding=encoding)).body) for encoding in encodings
+    }
+    print(json.dumps({"results": args.results, "formats": rows, "catalog_bytes": catalog_bytes}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Parity check and microbenchmark: NumPy/PIL preprocessing vs torchvision.
+
+Usage (from MedicalImageClassifier/):
+    python benchmarks/bench_preprocess.py [--iterations 200]
+
+Exits non-zero if the NumPy pipeline deviates from the torchvision reference
+by more than ``preprocessing.PARITY_TOLERANCE``. torchvision is only needed
+for the reference side; without it only the timing of the new path is shown.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.preprocessing import PARITY_TOLERANCE, preprocess_image  # noqa: E402
+
+
+# The pipeline common/preprocessing.py replaces, kept here as the reference
+def reference_preprocess_image(image_bytes, input_size=224):
+    from torchvision import transforms
+
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    transform = transforms.Compose([
+        transforms.Resize((input_size, input_size)),
+        transforms.ToTensor(),
+    ])
+    return transform(image).unsqueeze(0).numpy()
+
+
+def synthetic_images(seed=0):
+    rng = np.random.default_rng(seed)
+    images = {}
+    for name, size, mode, fmt in [
+        ("rgb-jpeg-1024", (1024, 768), "RGB", "JPEG"),
+        ("rgb-png-300", (300, 260), "RGB", "PNG"),
+        ("gray-png-512", (512, 512), "L", "PNG"),
+        ("gray-jpeg-2048", (2048, 2048), "L", "JPEG"),
+        ("rgb-png-28", (28, 28), "RGB", "PNG"),
+    ]:
+        width, height = size
+        shape = (height, width) if mode == "L" else (height, width, 3)
+        # Smooth gradients plus noise so resampling differences are visible
+        base = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+        pixels = base + rng.normal(0, 20, size=shape[:2]).astype(np.float32)
+        if mode == "RGB":
+            pixels = np.stack([pixels, pixels[:, ::-1], 255 - pixels], axis=-1)
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode).save(buffer, format=fmt)
+        images[name] = buffer.getvalue()
+    return images
+
+
+def time_it(fn, iterations):
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    try:
+        import torchvision  # noqa: F401
+        have_reference = True
+    except ImportError:
+        have_reference = False
+        print("torchvision not installed: skipping parity and reference timings")
+
+    failed = False
+    out = np.empty((1, 3, 224, 224), dtype=np.float32)
+    print(f"{'image':<16} {'max|diff|':>10} {'exact':>6} {'torchvision ms':>15} {'numpy ms':>9} {'numpy+out ms':>13}")
+    for name, image_bytes in synthetic_images().items():
+        new_ms = time_it(lambda: preprocess_image(image_bytes), args.iterations)
+        out_ms = time_it(lambda: preprocess_image(image_bytes, out=out), args.iterations)
+        if have_reference:
+            reference = reference_preprocess_image(image_bytes)
+            max_diff = float(np.abs(preprocess_image(image_bytes) - reference).max())
+            exact = np.array_equal(preprocess_image(image_bytes, draft=False), reference)
+            ref_ms = time_it(lambda: reference_preprocess_image(image_bytes), args.iterations)
+            failed |= max_diff > PARITY_TOLERANCE or not exact
+            print(f"{name:<16} {max_diff:>10.4f} {str(exact):>6} {ref_ms:>15.3f} {new_ms:>9.3f} {out_ms:>13.3f}")
+        else:
+            print(f"{name:<16} {'-':>10} {'-':>6} {'-':>15} {new_ms:>9.3f} {out_ms:>13.3f}")
+
+    if failed:
+        print(f"FAIL: output differs from torchvision beyond tolerance {PARITY_TOLERANCE}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
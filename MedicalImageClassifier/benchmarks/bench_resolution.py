@@ -0,0 +1,128 @@
+"""CPU time per request when preprocessing straight to a model's native input size.
+
+Builds one synthetic classifier per ``--sizes`` entry with that fixed input
+side (see tools/synthetic.py), reads the size back from the session like
+the API does (``ModelRegistry.input_spec``) and measures the process CPU
+time of decode + preprocess + inference per upload. Compare any native size
+with the 224 px every model used to be fed:
+
+    python benchmarks/bench_resolution.py --sizes 224 128 64 28
+    python benchmarks/bench_resolution.py --fast 64 --confidence 90
+
+A model with dynamic spatial dimensions is also timed in fast mode: a
+``--fast`` px pass first, repeated at 224 px when the top class is below
+``--confidence`` percent. The escalation rate depends on the model and the
+images, so measure it with real ones (``--images DIR``). The synthetic
+models are tiny; decoding dominates their cost, while a real network's
+convolutions scale with the pixel count and save far more.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "tools"))
+
+import synthetic  # noqa: E402
+from common.postprocess import top_k  # noqa: E402
+from common.preprocessing import INPUT_SIZE, decode_image, to_chw  # noqa: E402
+from common.registry import ModelRegistry, run_session  # noqa: E402
+
+
+def load_images(directory, count):
+    if directory:
+        names = sorted(os.listdir(directory))[:count]
+        images = []
+        for name in names:
+            with open(os.path.join(directory, name), "rb") as f:
+                images.append(f.read())
+        return images
+    # Camera-sized JPEGs, as most uploads are
+    return [synthetic.make_image((1024, 768), seed=seed, image_format="JPEG") for seed in range(count)]
+
+
+def classify(session, spec, image_bytes, size=None):
+    image = decode_image(image_bytes, size or spec.size(INPUT_SIZE), grayscale=spec.channels == 1)
+    logits = run_session(session, to_chw(image, channels=spec.channels, dtype=spec.dtype))
+    return float(top_k(logits, 1).probabilities[0, 0]) * 100.0
+
+
+def cpu_ms(fn, images, repeat):
+    """Best-of-``repeat`` process CPU time per image."""
+    for image_bytes in images[:2]:
+        fn(image_bytes)
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        for image_bytes in images:
+            fn(image_bytes)
+        elapsed = (time.process_time() - started) / len(images) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request CPU time by model input size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[224, 128, 64, 28])
+    parser.add_argument("--fast", type=int, default=64, help="fast-mode first-pass side; 0 skips fast mode")
+    parser.add_argument("--confidence", type=float, default=90.0, help="fast-mode escalation threshold (percent)")
+    parser.add_argument("--images", help="directory of images to use instead of synthetic JPEGs")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-resolution-")
+    images = load_images(args.images, args.count)
+    model_info = {}
+    for size in args.sizes + ([None] if args.fast else []):
+        task = f"native-{size}" if size else "dynamic"
+        path = synthetic.make_classifier(os.path.join(workdir, f"{task}.onnx"), 8, input_size=size)
+        model_info[task] = {"model_name": task, "model_path": path}
+    # One intra-op thread so CPU time is not inflated by spinning pool threads
+    registry = ModelRegistry(model_info, intra_op_threads=1)
+
+    report = {"images": len(images), "per_request_cpu_ms": {}}
+    for task in model_info:
+        if task == "dynamic":
+            continue
+        session, spec = registry.get(task), registry.input_spec(task)
+        report["per_request_cpu_ms"][f"{spec.height}x{spec.width}"] = cpu_ms(
+            lambda image_bytes: classify(session, spec, image_bytes), images, args.repeat
+        )
+    baseline = report["per_request_cpu_ms"].get(f"{INPUT_SIZE}x{INPUT_SIZE}")
+    if baseline:
+        report["cpu_saved_vs_224_percent"] = {
+            size: (1.0 - ms / baseline) * 100.0 for size, ms in report["per_request_cpu_ms"].items()
+        }
+
+    if args.fast:
+        session, spec = registry.get("dynamic"), registry.input_spec("dynamic")
+        escalations = []
+
+        def fast_mode(image_bytes):
+            escalated = classify(session, spec, image_bytes, args.fast) < args.confidence
+            if escalated:
+                classify(session, spec, image_bytes)
+            escalations.append(escalated)
+
+        full_ms = cpu_ms(lambda image_bytes: classify(session, spec, image_bytes), images, args.repeat)
+        fast_ms = cpu_ms(fast_mode, images, args.repeat)
+        report["fast_mode"] = {
+            "size": args.fast,
+            "confidence": args.confidence,
+            "escalation_rate": float(np.mean(escalations)),
+            "full_cpu_ms": full_ms,
+            "fast_cpu_ms": fast_ms,
+            "cpu_saved_percent": (1.0 - fast_ms / full_ms) * 100.0,
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
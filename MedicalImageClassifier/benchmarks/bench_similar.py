@@ -0,0 +1,113 @@
+"""Recall and latency of similar-case search (similarity.py), exact against IVF-PQ.
+
+Fills a temporary ``EmbeddingStore`` with clustered random unit vectors
+(embeddings of real images cluster by class and patient, and uniform random
+vectors would make every index look bad). For every ``--sizes`` entry it
+times exact brute-force search and the approximate index at several
+``--nprobe`` (lists scanned) and ``--refine`` (re-rank depth) values.
+Recall@k is measured against the exact results for held-out queries:
+
+    python benchmarks/bench_similar.py --sizes 100000 1000000 --dim 128
+
+The 1M x 128 store is 512 MB on disk and is memory-mapped. Training the
+index takes a minute or so on one core.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import similarity  # noqa: E402
+from similarity import EmbeddingStore, normalize  # noqa: E402
+
+
+def clustered(rng, count, dim, centres, spread=0.35):
+    rows = []
+    for start in range(0, count, similarity.BLOCK_ROWS):
+        size = min(similarity.BLOCK_ROWS, count - start)
+        block = centres[rng.integers(len(centres), size=size)]
+        block += rng.standard_normal((size, dim), dtype=np.float32) * spread
+        rows.append(normalize(block))
+    return np.concatenate(rows)
+
+
+def timed_searches(store, queries, k, **kwargs):
+    results = []
+    started = time.perf_counter()
+    for query in queries:
+        results.append([case_id for case_id, _ in store.search(query, k, **kwargs)])
+    return results, (time.perf_counter() - started) / len(queries) * 1000.0
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar-case search benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 32])
+    parser.add_argument("--refine", type=int, nargs="+", default=[8, 32, 64],
+                        help="approximate candidates re-ranked exactly, per requested neighbour")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((1000, args.dim), dtype=np.float32)
+    queries = clustered(rng, args.queries, args.dim, centres)
+    workdir = tempfile.mkdtemp(prefix="bench-similar-")
+    similarity.IVF_MIN_VECTORS = 0
+    report = []
+    try:
+        store = EmbeddingStore(os.path.join(workdir, "bench"))
+        for size in sorted(args.sizes):
+            started = time.perf_counter()
+            while len(store) < size:
+                count = min(similarity.BLOCK_ROWS * 4, size - len(store))
+                store.add(clustered(rng, count, args.dim, centres), list(range(len(store), len(store) + count)))
+            insert_s = time.perf_counter() - started
+
+            truth, exact_ms = timed_searches(store, queries, args.k)
+            started = time.perf_counter()
+            index = store.index(wait=True)
+            train_s = time.perf_counter() - started
+            row = {
+                "vectors": size,
+                "dim": args.dim,
+                "insert_s": insert_s,
+                "exact_ms": exact_ms,
+                "index_lists": index.lists,
+                "index_build_s": train_s,
+                "approximate": [],
+            }
+            for nprobe in args.nprobe:
+                for refine in args.refine:
+                    found, approx_ms = timed_searches(
+                        store, queries, args.k, approximate=True, nprobe=nprobe, refine=refine
+                    )
+                    row["approximate"].append({
+                        "nprobe": nprobe,
+                        "refine": refine,
+                        "ms": approx_ms,
+                        f"recall@{args.k}": recall(found, truth),
+                        "speedup": exact_ms / approx_ms,
+                    })
+            report.append(row)
+            print(json.dumps(row, indent=2), flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Latency of test-time augmentation (tta.py) against a single prediction.
+
+Builds tiny synthetic models (see tools/synthetic.py) and times, per image:
+one view, ``--views`` separate ``run_session`` calls (the naive loop), and
+the TTA path (one ``augment`` gather plus one batched ``run_session``):
+
+    python benchmarks/bench_tta.py --views 8
+    python benchmarks/bench_tta.py --model onnx_models/VSSM-BloodMNIST.onnx
+
+The batched path should cost well under ``views`` times a single view. The
+synthetic models are so cheap that the augmentation gather (about 1-2 ms
+for 8 views at 224x224) dominates; pass ``--model`` to measure a real one.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "tools"))
+
+import synthetic  # noqa: E402
+from common.registry import ModelRegistry, run_session  # noqa: E402
+from tta import augment, summarize  # noqa: E402
+
+
+def best_ms(fn, iterations, repeat=5):
+    return min(timeit.repeat(fn, number=iterations, repeat=repeat)) / iterations * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test-time augmentation latency benchmark")
+    parser.add_argument("--views", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--model", help="ONNX model to time instead of a synthetic one")
+    args = parser.parse_args()
+
+    if args.model:
+        task = os.path.basename(args.model)
+        model_info = {task: {"model_name": task, "model_path": os.path.abspath(args.model)}}
+    else:
+        workdir = tempfile.mkdtemp(prefix="bench-tta-")
+        with open(os.path.join(APP_DIR, "utils", "model_info.json")) as f:
+            model_info = synthetic.build(workdir, json.load(f), images_per_class=0)
+        task = next(iter(model_info))
+    session = ModelRegistry(model_info).get(task)
+    image = np.random.default_rng(0).random((1, 3, 224, 224), dtype=np.float32)
+    views = augment(image, args.views)
+
+    def batched():
+        summarize(run_session(session, augment(image, args.views)))
+
+    def looped():
+        summarize(np.concatenate([run_session(session, views[i:i + 1]) for i in range(args.views)]))
+
+    single_ms = best_ms(lambda: run_session(session, image), args.iterations)
+    looped_ms = best_ms(looped, args.iterations)
+    batched_ms = best_ms(batched, args.iterations)
+    augment_ms = best_ms(lambda: augment(image, args.views), args.iterations)
+    print(json.dumps({
+        "task": task,
+        "views": args.views,
+        "single_ms": single_ms,
+        "looped_ms": looped_ms,
+        "batched_ms": batched_ms,
+        "augment_ms": augment_ms,
+        "batched_over_single": batched_ms / single_ms,
+        "looped_over_single": looped_ms / single_ms,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
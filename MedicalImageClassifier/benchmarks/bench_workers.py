@@ -0,0 +1,106 @@
+"""Throughput scaling of the inference worker pool (workerpool.py).
+
+Builds tiny synthetic models (see tools/synthetic.py), then for each process
+count in the sweep drives ``InferenceWorkerPool.run_batch`` from enough
+threads to keep every ring slot busy for ``--seconds`` and reports images
+per second, scaling efficiency relative to one process and each worker's
+utilization:
+
+    python benchmarks/bench_workers.py --processes 1,2,4,8,16,32 --batch 8
+
+On a machine with N free cores throughput should grow close to linearly up
+to N processes.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "tools"))
+
+import synthetic  # noqa: E402
+from workerpool import InferenceWorkerPool  # noqa: E402
+
+
+def bench_pool(model_info, task, processes, batch_size, seconds, slots):
+    pool = InferenceWorkerPool(model_info, num_workers=processes, slots=slots)
+    pool.start()
+    try:
+        if not pool.wait_ready():
+            raise RuntimeError("Workers did not become ready")
+        batch = np.random.default_rng(0).standard_normal((batch_size, 3, 224, 224)).astype(np.float32)
+        pool.run_batch(task, batch)
+
+        stop = time.perf_counter() + seconds
+        counts = []
+
+        def drive():
+            done = 0
+            while time.perf_counter() < stop:
+                pool.run_batch(task, batch)
+                done += batch_size
+            counts.append(done)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=drive) for _ in range(pool.capacity)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stats = pool.stats()
+    finally:
+        pool.close()
+
+    return {
+        "processes": processes,
+        "intra_op_threads": stats["intra_op_threads"],
+        "images_per_second": sum(counts) / elapsed,
+        "utilization": [round(worker["utilization"], 3) for worker in stats["workers"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference worker pool scaling benchmark")
+    parser.add_argument("--processes", default="1,2,4", help="comma-separated process counts")
+    parser.add_argument("--batch", type=int, default=8, help="images per run_batch call")
+    parser.add_argument("--seconds", type=float, default=5.0, help="measurement time per process count")
+    parser.add_argument("--slots", type=int, default=2, help="ring slots per worker")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-workers-")
+    with open(os.path.join(APP_DIR, "utils", "model_info.json")) as f:
+        model_info = synthetic.build(workdir, json.load(f), images_per_class=0)
+    task = next(iter(model_info))
+
+    results = []
+    for processes in [int(count) for count in args.processes.split(",")]:
+        result = bench_pool(model_info, task, processes, args.batch, args.seconds, args.slots)
+        result["scaling_efficiency"] = (
+            result["images_per_second"] / (results[0]["images_per_second"] / results[0]["processes"]) / processes
+            if results else 1.0
+        )
+        results.append(result)
+        print(f"{processes:>3} processes: {result['images_per_second']:9.1f} img/s "
+              f"efficiency {result['scaling_efficiency']:.2f} utilization {result['utilization']}",
+              file=sys.stderr)
+
+    output = json.dumps({"cpu_count": os.cpu_count(), "task": task, "batch": args.batch, "results": results},
+                        indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Content-addressed prediction cache.
+
+Entries are keyed by (task, model version, image hash) where the model
+version is a hash of the ``.onnx`` file and the image hash is taken over the
+raw upload bytes, so re-uploading the same image for the same model skips
+preprocessing and inference entirely. An in-process LRU tier with a TTL sits
+in front of an optional SQLite tier that all uvicorn workers on a node can
+share (set ``PREDICTION_CACHE_DB`` to a file path to enable it).
+
+Entries survive hot reloads that leave a task's model file unchanged, so
+hits are stamped with the serving ``model_version`` rather than the one
+they were computed under.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "4096"))
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", "3600"))
+PREDICTION_CACHE_DB = os.environ.get("PREDICTION_CACHE_DB", "")
+
+# Purge expired rows from the SQLite tier every this many writes
+DB_PURGE_INTERVAL = 1000
+
+
+def content_hash(data):
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def file_hash(path):
+    """Hash of a model file, recomputed only when its size or mtime changes."""
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cached = _file_hashes.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    with _file_hashes_lock:
+        _file_hashes[path] = (signature, digest.hexdigest())
+    return _file_hashes[path][1]
+
+
+class PredictionCache:
+    """Two-tier (memory LRU + optional SQLite) cache of prediction results.
+
+    ``model_path(task)`` returns the ``.onnx`` file currently serving ``task``
+    and ``model_version()`` the serving version number stamped on hits.
+    """
+
+    def __init__(self, model_path, max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL,
+                 db_path=PREDICTION_CACHE_DB, model_version=None):
+        self.model_path = model_path
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path or None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ("memory_hits", "disk_hits", "misses", "evictions", "expirations", "invalidations"), 0
+        )
+        self._db = None
+        self._db_writes = 0
+        if self.db_path:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " task TEXT, model_version TEXT, image_hash TEXT, result TEXT, expires_at REAL,"
+                " PRIMARY KEY (task, model_version, image_hash))"
+            )
+
+    def key(self, task, image_bytes):
+        return (task, file_hash(self.model_path(task)), content_hash(image_bytes))
+
+    def lookup(self, task, image_bytes):
+        """Return ``(key, result)``; ``result`` is None on a miss."""
+        key = self.key(task, image_bytes)
+        result = self.get(key)
+        if result is not None and self.model_version is not None and "model_version" in result:
+            result = {**result, "model_version": self.model_version()}
+        return key, result
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return result
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, expires_at FROM predictions"
+                    " WHERE task = ? AND model_version = ? AND image_hash = ?",
+                    key,
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    result = json.loads(row[0])
+                    self._store(key, result, row[1])
+                    self._counters["disk_hits"] += 1
+                    return result
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, result):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, result, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                    (*key, json.dumps(result), expires_at),
+                )
+                self._db_writes += 1
+                if self._db_writes % DB_PURGE_INTERVAL == 0:
+                    self._db.execute("DELETE FROM predictions WHERE expires_at <= ?", (time.time(),))
+
+    def _store(self, key, result, expires_at):
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def invalidate(self, task=None):
+        """Drop cached results for ``task`` (or everything) and forget its model file hash."""
+        with _file_hashes_lock:
+            if task is None:
+                _file_hashes.clear()
+            else:
+                try:
+                    _file_hashes.pop(self.model_path(task), None)
+                except KeyError:
+                    # The task is no longer served
+                    pass
+        with self._lock:
+            stale = [key for key in self._entries if task is None or key[0] == task]
+            for key in stale:
+                del self._entries[key]
+            if self._db is not None:
+                if task is None:
+                    self._db.execute("DELETE FROM predictions")
+                else:
+                    self._db.execute("DELETE FROM predictions WHERE task = ?", (task,))
+            self._counters["invalidations"] += 1
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        return {
+            **counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "disk_tier": self.db_path,
+        }
@@ -0,0 +1,157 @@
+"""Task/model catalog built from utils/model_info.json.
+
+The catalog is validated once at startup and normalised so the rest of the
+service can rely on one shape per task::
+
+    {"model_name": str, "model_path": str, "aliases": [str, ...],
+     "temperature": float,  # optional in the file, defaults to 1.0
+     "class_info": {"0": {"class": str, "desc": str}, ...}, ...}
+
+Tasks are addressed by their canonical (long) name, their ``model_name``
+(e.g. ``bloodmnist``) or any listed alias (e.g. ``blood``, as used by the
+mock API in main.py); lookups are case-insensitive.
+
+Relative model paths are resolved against the application directory (the
+one holding ``utils/`` and ``onnx_models/``), not the working directory.
+"""
+import json
+import os
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_INFO_PATH = os.environ.get("MODEL_INFO_PATH", os.path.join(APP_DIR, "utils", "model_info.json"))
+
+
+class CatalogError(ValueError):
+    """model_info.json does not describe a usable set of tasks."""
+
+
+def _alias_key(name):
+    return " ".join(name.split()).casefold()
+
+
+def normalize_entry(task, entry, base_dir=APP_DIR):
+    """Return ``(normalised_entry, problems)`` for one model_info.json entry."""
+    problems = []
+    if not isinstance(entry, dict):
+        return None, [f"{task}: entry must be an object"]
+
+    normalized = {key: value for key, value in entry.items() if not key.isdigit()}
+    for key in ("model_name", "model_path"):
+        if not isinstance(entry.get(key), str) or not entry[key]:
+            problems.append(f"{task}: '{key}' must be a non-empty string")
+    if isinstance(entry.get("model_path"), str) and entry["model_path"]:
+        normalized["model_path"] = os.path.join(base_dir, entry["model_path"])
+    # Quantized variants recorded by tools/optimize_models.py
+    if isinstance(entry.get("variants"), dict):
+        normalized["variants"] = {
+            name: {**variant, "model_path": os.path.join(base_dir, variant["model_path"])}
+            if isinstance(variant, dict) and isinstance(variant.get("model_path"), str) else variant
+            for name, variant in entry["variants"].items()
+        }
+
+    # Older entries put the classes at the top level instead of under "class_info"
+    class_info = entry.get("class_info")
+    if class_info is None:
+        class_info = {key: value for key, value in entry.items() if key.isdigit()}
+        if class_info:
+            print(f"Catalog: {task} lists its classes at the top level; expected them under 'class_info'")
+    if not isinstance(class_info, dict) or not class_info:
+        problems.append(f"{task}: 'class_info' must map class ids to class descriptions")
+        class_info = {}
+    expected_ids = [str(class_id) for class_id in range(len(class_info))]
+    if sorted(class_info, key=lambda key: int(key) if key.isdigit() else -1) != expected_ids:
+        problems.append(f"{task}: class ids must be 0..{len(class_info) - 1}, got {sorted(class_info)}")
+    for class_id, details in class_info.items():
+        if not isinstance(details, dict) or not isinstance(details.get("class"), str) \
+                or not isinstance(details.get("desc"), str):
+            problems.append(f"{task}: class {class_id} needs string 'class' and 'desc' fields")
+    normalized["class_info"] = {class_id: class_info[class_id] for class_id in expected_ids if class_id in class_info}
+
+    aliases = entry.get("aliases", [])
+    if not isinstance(aliases, list) or not all(isinstance(alias, str) and alias for alias in aliases):
+        problems.append(f"{task}: 'aliases' must be a list of non-empty strings")
+        aliases = []
+    normalized["aliases"] = list(aliases)
+
+    # Optional temperature for calibrated confidences (logits are divided by it)
+    temperature = entry.get("temperature", 1.0)
+    if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or not temperature > 0:
+        problems.append(f"{task}: 'temperature' must be a positive number")
+        temperature = 1.0
+    normalized["temperature"] = float(temperature)
+    return normalized, problems
+
+
+class Catalog:
+    """Validated, alias-aware view of model_info.json."""
+
+    def __init__(self, model_info, base_dir=APP_DIR):
+        if not isinstance(model_info, dict) or not model_info:
+            raise CatalogError("model_info must be a non-empty object of tasks")
+
+        problems = []
+        self.model_info = {}
+        self._aliases = {}
+        for task, entry in model_info.items():
+            normalized, entry_problems = normalize_entry(task, entry, base_dir)
+            problems.extend(entry_problems)
+            if normalized is None:
+                continue
+            self.model_info[task] = normalized
+            names = [task, normalized.get("model_name")] + normalized["aliases"]
+            for name in filter(None, names):
+                key = _alias_key(name)
+                owner = self._aliases.setdefault(key, task)
+                if owner != task:
+                    problems.append(f"{task}: name '{name}' is already used by {owner}")
+        if problems:
+            raise CatalogError("Invalid model_info:\n  " + "\n  ".join(problems))
+
+    @classmethod
+    def load(cls, path=MODEL_INFO_PATH, base_dir=APP_DIR):
+        with open(path, "r") as f:
+            return cls(json.load(f), base_dir)
+
+    def canonical(self, name):
+        """Canonical task name for ``name`` (task, model name or alias), or None."""
+        if not isinstance(name, str):
+            return None
+        return self._aliases.get(_alias_key(name))
+
+    def resolve(self, name):
+        task = self.canonical(name)
+        if task is None:
+            raise KeyError(name)
+        return task
+
+    def class_info(self, task, class_id):
+        return self.model_info[task]["class_info"][str(class_id)]
+
+    def temperature(self, task):
+        return self.model_info[task]["temperature"]
+
+    def num_classes(self, task):
+        return len(self.model_info[task]["class_info"])
+
+    def describe(self):
+        """Public summary of every task: names, aliases and class names and descriptions by id."""
+        return {
+            task: {
+                "model_name": entry["model_name"],
+                "aliases": entry["aliases"],
+                "class_info": entry["class_info"],
+            }
+            for task, entry in self.model_info.items()
+        }
+
+    def __contains__(self, name):
+        return self.canonical(name) is not None
+
+    def __iter__(self):
+        return iter(self.model_info)
+
+    def __len__(self):
+        return len(self.model_info)
+
+    def __getitem__(self, name):
+        return self.model_info[self.resolve(name)]
@@ -0,0 +1,9 @@
+"""Code shared by the inference API (api.py) and the mock server (../main.py).
+
+Upload validation and form parsing, archives, content negotiation, metrics,
+the ONNX session registry and image pre/post-processing. The app imports
+these as ``common.<module>``; main.py, which runs from the repository root,
+imports them as ``MedicalImageClassifier.common.<module>`` without adding
+anything to ``sys.path``. Modules in this package only import each other
+(relatively) and third-party packages, never the app's own modules.
+"""
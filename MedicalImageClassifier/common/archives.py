@@ -0,0 +1,29 @@
+"""Images submitted as a zip or tar archive (``/predict/batch`` in api.py and main.py)."""
+import io
+import tarfile
+import zipfile
+
+
+def read_archive(data):
+    """Return ``(name, bytes)`` for every regular file in a zip or tar archive, in archive order."""
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return [
+                (member.filename, archive.read(member))
+                for member in archive.infolist()
+                if not member.is_dir() and not _is_hidden(member.filename)
+            ]
+    try:
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+            return [
+                (member.name, archive.extractfile(member).read())
+                for member in archive.getmembers()
+                if member.isfile() and not _is_hidden(member.name)
+            ]
+    except tarfile.TarError:
+        raise ValueError("Archive must be a zip or tar file")
+
+
+def _is_hidden(name):
+    # Skip macOS resource forks and dotfiles that archivers like to add
+    return any(part.startswith(".") or part == "__MACOSX" for part in name.split("/"))
@@ -0,0 +1,127 @@
+"""Incremental multipart/form-data parsing straight off ``request.stream()``.
+
+Parts are yielded as soon as they are complete, with the upload capped and
+each image's header checked while it arrives (validation.py), so a bad or
+oversized upload is refused without buffering the rest of the body. Used by
+api.py and by the mock server in the repository root (main.py).
+"""
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ImportError:
+    import multipart
+    from multipart.multipart import parse_options_header
+
+from .validation import FORM_OVERHEAD_BYTES, MAX_UPLOAD_BYTES, InvalidImage, check_image_header
+
+
+async def iter_multipart(request, max_bytes=None, inspect=None, max_part_bytes=None, raise_invalid=True):
+    """Yield ``(name, filename, data)`` for each multipart part as soon as it is complete.
+
+    The upload is aborted with ``InvalidImage`` (413) once the body exceeds
+    ``max_bytes``. ``inspect(data, complete)`` sees each file part's bytes as
+    they arrive until it returns something other than None; raising from it
+    aborts the upload without reading the rest of the body. So does a file
+    part over ``max_part_bytes``. With ``raise_invalid=False`` only that part
+    is rejected: its bytes are dropped and it is yielded with the
+    ``InvalidImage`` as its data, and parsing carries on with the next part.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidImage("Expected a multipart/form-data body")
+
+    completed = []
+    part = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        part.clear()
+        part.update(name=None, filename=None, data=bytearray(), inspected=inspect is None, error=None)
+
+    def reject(error):
+        if raise_invalid:
+            raise error
+        part["error"] = error
+        part["data"] = bytearray()
+
+    def on_part_data(data, start, end):
+        if part["error"] is not None:
+            return
+        part["data"] += data[start:end]
+        if part["filename"] is None:
+            return
+        if max_part_bytes is not None and len(part["data"]) > max_part_bytes:
+            reject(InvalidImage(f"Upload exceeds {max_part_bytes} bytes", 413))
+        elif not part["inspected"]:
+            try:
+                part["inspected"] = inspect(part["data"], False) is not None
+            except InvalidImage as e:
+                reject(e)
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        if bytes(header_field).lower() == b"content-disposition":
+            _, options = parse_options_header(bytes(header_value))
+            part["name"] = options.get(b"name", b"").decode("utf-8")
+            filename = options.get(b"filename")
+            part["filename"] = filename.decode("utf-8") if filename is not None else None
+        header_field.clear()
+        header_value.clear()
+
+    def on_part_end():
+        if part["error"] is None and not part["inspected"] and part["filename"] is not None:
+            try:
+                inspect(part["data"], True)
+            except InvalidImage as e:
+                reject(e)
+        data = part["error"] if part["error"] is not None else bytes(part["data"])
+        completed.append((part["name"], part["filename"], data))
+
+    parser = multipart.MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+    })
+    received = 0
+    async for body in request.stream():
+        received += len(body)
+        if max_bytes is not None and received > max_bytes:
+            raise InvalidImage(f"Upload exceeds {max_bytes} bytes", 413)
+        parser.write(body)
+        while completed:
+            yield completed.pop(0)
+    parser.finalize()
+    while completed:
+        yield completed.pop(0)
+
+
+async def read_image_form(request, resolve_task=None, max_bytes=MAX_UPLOAD_BYTES):
+    """Read a single-image form (an ``image`` file part plus text fields), failing fast.
+
+    The image header is validated as soon as its first bytes arrive and the
+    ``task`` field is passed through ``resolve_task`` as soon as it is parsed,
+    so bad uploads are rejected without reading (or decoding) the rest.
+    Returns ``(fields, image_bytes)``.
+    """
+    fields = {}
+    image = None
+    async for name, filename, data in iter_multipart(request, max_bytes + FORM_OVERHEAD_BYTES, check_image_header):
+        if filename is None:
+            value = data.decode("utf-8")
+            fields[name] = resolve_task(value) if name == "task" and resolve_task is not None else value
+        elif name == "image":
+            image = data
+    if image is None:
+        raise InvalidImage("The form has no 'image' file")
+    if len(image) > max_bytes:
+        raise InvalidImage(f"Upload exceeds {max_bytes} bytes", 413)
+    return fields, image
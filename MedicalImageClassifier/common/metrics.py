@@ -0,0 +1,235 @@
+"""Lightweight in-process metrics, request tracing and /metrics exposition.
+
+``InstrumentationMiddleware`` records per-endpoint request counts, errors,
+latency histograms and in-flight gauges. Handlers add per-task and per-stage
+detail through the request's ``Trace`` (``current_trace()``), which is also
+rendered as a ``Server-Timing`` header when ``SERVER_TIMING=1`` or the
+client sends ``X-Server-Timing: 1``. ``MetricsRegistry.render`` produces the
+Prometheus text format; all durations are in milliseconds.
+"""
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, safe to observe from several threads."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum = self._count, self._sum
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = total
+        return {"buckets": buckets, "count": total, "sum": value_sum}
+
+
+class MetricsRegistry:
+    """Labelled counters, gauges and histograms rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._values = defaultdict(dict)
+        self._callbacks = []
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+
+    def add(self, name, value, **labels):
+        """Adjust a gauge by ``value`` (may be negative)."""
+        self.inc(name, value, **labels)
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[name][_label_key(labels)] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS_MS, **labels):
+        self.histogram(name, buckets, **labels).observe(value)
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS_MS, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+        return histogram
+
+    def attach(self, name, histogram, **labels):
+        """Expose an existing ``Histogram`` (e.g. the micro-batcher's) under ``name``."""
+        with self._lock:
+            self._values[name][_label_key(labels)] = histogram
+
+    def on_collect(self, callback):
+        """Run ``callback(registry)`` before every render to refresh derived gauges."""
+        self._callbacks.append(callback)
+
+    def render(self):
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Error collecting metrics: {str(e)}")
+
+        lines = []
+        with self._lock:
+            series_by_name = {name: dict(series) for name, series in self._values.items()}
+        for name in sorted(series_by_name):
+            kind, help_text = self._meta.get(name, ("untyped", ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(series_by_name[name].items()):
+                if isinstance(value, Histogram):
+                    snapshot = value.snapshot()
+                    for bound, count in snapshot["buckets"].items():
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {snapshot['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {snapshot['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+class Trace:
+    """Per-request stage timings and task, filled in by the handler."""
+
+    def __init__(self):
+        self.task = None
+        self.error = False
+        self.stages = []
+
+    def add(self, stage, duration_ms):
+        self.stages.append((stage, duration_ms))
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - started) * 1000.0)
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={duration:.3f}" for stage, duration in self.stages)
+
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace():
+    """The active request's ``Trace``; a throwaway one outside instrumented requests."""
+    trace = _current_trace.get()
+    return trace if trace is not None else Trace()
+
+
+metrics = MetricsRegistry()
+metrics.describe("http_requests_total", "counter", "HTTP requests by method, endpoint and status")
+metrics.describe("http_request_errors_total", "counter", "HTTP requests that failed (status >= 400 or handler error)")
+metrics.describe("http_request_duration_ms", "histogram", "HTTP request latency")
+metrics.describe("http_requests_in_flight", "gauge", "HTTP requests currently being served")
+metrics.describe("predictions_total", "counter", "Prediction requests by task and outcome")
+metrics.describe("prediction_duration_ms", "histogram", "End-to-end prediction latency by task")
+metrics.describe("stage_duration_ms", "histogram", "Time spent per pipeline stage")
+
+
+class InstrumentationMiddleware:
+    """Pure ASGI middleware (streaming-safe) that records request metrics and traces."""
+
+    def __init__(self, app, registry=metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _current_trace.set(trace)
+        want_timing = SERVER_TIMING or _header(scope, b"x-server-timing") == b"1"
+        status = 500
+        started = time.perf_counter()
+        self.registry.add("http_requests_in_flight", 1)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if want_timing and trace.stages:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            self.registry.add("http_requests_in_flight", -1)
+            self._record(scope, trace, status, (time.perf_counter() - started) * 1000.0)
+
+    def _record(self, scope, trace, status, duration_ms):
+        route = scope.get("route")
+        endpoint = getattr(route, "path", None) or "unmatched"
+        failed = status >= 400 or trace.error
+        self.registry.inc("http_requests_total", method=scope["method"], endpoint=endpoint, status=status)
+        self.registry.observe("http_request_duration_ms", duration_ms, endpoint=endpoint)
+        if failed:
+            self.registry.inc("http_request_errors_total", endpoint=endpoint)
+        if trace.task is not None:
+            self.registry.inc("predictions_total", task=trace.task, outcome="error" if failed else "ok")
+            self.registry.observe("prediction_duration_ms", duration_ms, task=trace.task)
+        for stage, stage_ms in trace.stages:
+            self.registry.observe("stage_duration_ms", stage_ms, stage=stage, task=trace.task or "")
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return None
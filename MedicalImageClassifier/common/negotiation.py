@@ -0,0 +1,154 @@
+"""Content negotiation for prediction responses.
+
+High-volume clients can cut the bytes on the wire per request:
+
+* compact results (``?compact=true`` or ``Prefer: return=minimal``) keep
+  class ids and confidences but drop class names and descriptions. Those
+  come once from ``GET /catalog``, revalidated with its ETag.
+* ``Accept: application/msgpack`` selects MessagePack when the ``msgpack``
+  package is installed.
+* bodies of at least ``COMPRESS_MIN_BYTES`` are compressed with brotli
+  (when the ``brotli`` package is installed) or gzip, per
+  ``Accept-Encoding``.
+
+Clients that ask for none of these get the same JSON as before.
+"""
+import gzip
+import hashlib
+import json
+import os
+from typing import NamedTuple, Optional
+
+from starlette.responses import Response
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+CATALOG_MAX_AGE = int(os.environ.get("CATALOG_MAX_AGE", "300"))
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+VARY = "Accept, Accept-Encoding, Prefer"
+# Sent with compact results so clients can find the texts they refer to
+CATALOG_LINK = {"Link": '</catalog>; rel="describedby"'}
+
+# Keys dropped from results (and their top_k entries) in compact mode
+VERBOSE_KEYS = ("class_name", "class_desc")
+
+
+class ResponseFormat(NamedTuple):
+    compact: bool = False
+    media_type: str = JSON
+    # Content-Encoding for bodies of COMPRESS_MIN_BYTES or more, or None
+    encoding: Optional[str] = None
+
+
+def header_qualities(value):
+    """``{token: q}`` from an Accept or Accept-Encoding header."""
+    qualities = {}
+    for part in (value or "").split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, number = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        qualities[token] = quality
+    return qualities
+
+
+def response_format(request):
+    """Compact or full results, JSON or MessagePack and the content coding for ``request``."""
+    compact = request.query_params.get("compact", "").lower() in ("1", "true", "yes", "on") \
+        or "return=minimal" in request.headers.get("prefer", "").lower()
+    accept = header_qualities(request.headers.get("accept"))
+    media_type = JSON
+    if msgpack is not None:
+        msgpack_quality = max(accept.get(name, 0.0) for name in MSGPACK_MEDIA_TYPES)
+        json_quality = accept.get(JSON, accept.get("application/*", accept.get("*/*", 0.0)))
+        if msgpack_quality > 0 and msgpack_quality >= json_quality:
+            media_type = MSGPACK
+    codings = header_qualities(request.headers.get("accept-encoding"))
+    accepted = [
+        coding for coding in ("br", "gzip")
+        if codings.get(coding, codings.get("*", 0.0)) > 0 and (coding != "br" or brotli is not None)
+    ]
+    return ResponseFormat(compact, media_type, accepted[0] if accepted else None)
+
+
+def compact_result(result):
+    """``result`` without class names and descriptions (see GET /catalog)."""
+    compact = {key: value for key, value in result.items() if key not in VERBOSE_KEYS}
+    if "top_k" in compact:
+        compact["top_k"] = [
+            {key: value for key, value in candidate.items() if key not in VERBOSE_KEYS}
+            for candidate in compact["top_k"]
+        ]
+    return compact
+
+
+def encode(payload, media_type=JSON):
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    # Same output as FastAPI's JSONResponse
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def render(payload, fmt, status_code=200, headers=None):
+    """Encode and compress ``payload`` (compacting results first) into a ``Response``.
+
+    ``payload`` is a result, or a dict with a ``results`` list of them.
+    Large batches are worth rendering on a pool thread.
+    """
+    if fmt.compact:
+        if isinstance(payload.get("results"), list):
+            payload = {**payload, "results": [compact_result(result) for result in payload["results"]]}
+        else:
+            payload = compact_result(payload)
+        headers = {**CATALOG_LINK, **(headers or {})}
+    body = encode(payload, fmt.media_type)
+    headers = {"Vary": VARY, **(headers or {})}
+    if fmt.encoding is not None and len(body) >= COMPRESS_MIN_BYTES:
+        body = compress(body, fmt.encoding)
+        headers["Content-Encoding"] = fmt.encoding
+    return Response(content=body, status_code=status_code, media_type=fmt.media_type, headers=headers)
+
+
+def etag(payload):
+    """Weak validator for ``payload``: the same for every encoding, stable across processes."""
+    digest = hashlib.blake2b(json.dumps(payload, sort_keys=True).encode("utf-8"), digest_size=16)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match, tag):
+    """Weak comparison, as If-None-Match uses."""
+    if not if_none_match:
+        return False
+    opaque = tag[2:] if tag.startswith("W/") else tag
+    return any(
+        candidate == "*" or (candidate[2:] if candidate.startswith("W/") else candidate) == opaque
+        for candidate in (candidate.strip() for candidate in if_none_match.split(","))
+    )
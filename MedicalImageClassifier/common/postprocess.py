@@ -0,0 +1,82 @@
+"""Vectorised post-processing of classifier logits.
+
+One call handles a whole ``(N, C)`` batch: optional temperature scaling
+(``"temperature"`` per task in model_info.json, fitted offline on a
+validation set), a numerically stable log-softmax and the top-k classes of
+every row. The max is subtracted before exponentiating, so large logits
+cannot overflow, and every intermediate lives in a handful of arrays
+allocated once per batch (or supplied by the caller) and updated in place.
+
+Rows with NaN or infinite logits are flagged in ``finite`` instead of
+producing NaN probabilities.
+"""
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+# Classes reported per prediction, capped at the task's class count
+TOP_K = int(os.environ.get("TOP_K", "3"))
+
+
+class TopK(NamedTuple):
+    """Post-processed batch; every array has one row per input row."""
+    log_probs: np.ndarray      # (N, C) float32 log-probabilities
+    classes: np.ndarray        # (N, k) int64 class ids, most likely first
+    probabilities: np.ndarray  # (N, k) float32 probabilities matching ``classes``
+    finite: np.ndarray         # (N,) bool, False where the logits were not finite
+
+
+def log_softmax(logits, temperature=1.0, out=None):
+    """Stable ``log(softmax(logits / temperature))`` along the last axis."""
+    logits = np.asarray(logits, dtype=np.float32)
+    if out is None:
+        out = np.empty(logits.shape, dtype=np.float32)
+    # Non-finite rows come out as NaN without warnings; top_k flags them
+    with np.errstate(invalid="ignore", over="ignore"):
+        np.divide(logits, np.float32(temperature), out=out)
+        row_max = out.max(axis=-1, keepdims=True)
+        row_max[~np.isfinite(row_max)] = 0.0
+        out -= row_max
+        scratch = np.exp(out)
+        log_sum = np.log(scratch.sum(axis=-1, keepdims=True, out=row_max), out=row_max)
+        out -= log_sum
+    return out
+
+
+def top_k(logits, k=TOP_K, temperature=1.0, out=None):
+    """Calibrated top-k of a ``(N, C)`` batch of logits.
+
+    ``out`` may be a ``TopK`` of matching shapes to write into; its
+    ``log_probs`` also serves as the log-softmax buffer.
+    """
+    logits = np.asarray(logits, dtype=np.float32)
+    if logits.ndim == 1:
+        logits = logits[np.newaxis]
+    if temperature <= 0:
+        raise ValueError(f"temperature must be positive, got {temperature}")
+    rows, num_classes = logits.shape
+    k = max(1, min(int(k), num_classes))
+    if out is None:
+        out = TopK(
+            log_probs=np.empty((rows, num_classes), dtype=np.float32),
+            classes=np.empty((rows, k), dtype=np.int64),
+            probabilities=np.empty((rows, k), dtype=np.float32),
+            finite=np.empty(rows, dtype=bool),
+        )
+
+    np.isfinite(logits).all(axis=1, out=out.finite)
+    log_probs = log_softmax(logits, temperature, out=out.log_probs)
+
+    # Partial selection of the k best, then a sort of only those k
+    if k < num_classes:
+        candidates = np.argpartition(log_probs, num_classes - k, axis=1)[:, num_classes - k:]
+        # Ascending ids so ties go to the lowest class id, as with argmax
+        candidates.sort(axis=1)
+    else:
+        candidates = np.broadcast_to(np.arange(num_classes), (rows, num_classes))
+    candidate_scores = np.take_along_axis(log_probs, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    out.classes[...] = np.take_along_axis(candidates, order, axis=1)
+    np.exp(np.take_along_axis(candidate_scores, order, axis=1), out=out.probabilities)
+    return out
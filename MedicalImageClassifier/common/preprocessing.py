@@ -0,0 +1,96 @@
+"""NumPy/PIL image preprocessing for the ONNX models.
+
+Equivalent to ``transforms.Resize((size, size))`` followed by
+``transforms.ToTensor()`` without importing torch/torchvision. JPEGs are
+downscaled while decoding via ``Image.draft`` and the HWC uint8 pixels are
+written straight into a CHW float32 buffer, which the caller may supply
+(e.g. a row of a preallocated batch) to avoid any further copies.
+
+The size, channel count and dtype default to the 3 x 224 x 224 float32 the
+bundled models take; callers pass the shape a model declares (see
+``registry.InputSpec``) to resize straight to it.
+"""
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+from .validation import check_decoded_size
+
+INPUT_SIZE = 224
+
+# Maximum per-pixel deviation from the torchvision pipeline. Exact (0.0) when
+# draft decoding is not used; JPEG draft decoding resamples inside libjpeg.
+PARITY_TOLERANCE = 0.1
+
+# Fast mode for models with dynamic spatial dimensions: classify at FAST_MODE_SIZE px
+# first and redo it at full size below FAST_MODE_CONFIDENCE percent (0 disables)
+FAST_MODE_SIZE = int(os.environ.get("FAST_MODE_SIZE", "0"))
+FAST_MODE_CONFIDENCE = float(os.environ.get("FAST_MODE_CONFIDENCE", "90"))
+
+
+def decode_image(image_bytes, input_size=INPUT_SIZE, draft=True, grayscale=False):
+    """Decode and resize to ``input_size`` (a side or ``(height, width)``); returns an RGB or L image.
+
+    ``grayscale`` decodes straight to one channel for single-channel models.
+    """
+    height, width = (input_size, input_size) if isinstance(input_size, int) else input_size
+    image = Image.open(io.BytesIO(image_bytes))
+    # Only the header has been read so far; refuse oversized images before decoding
+    check_decoded_size(image)
+    if draft and image.format == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale while staying >= the target size
+        mode = "L" if grayscale else "RGB" if image.mode not in ("L", "RGB") else image.mode
+        image.draft(mode, (width, height))
+    if grayscale and image.mode != "L":
+        image = image.convert("L")
+    elif image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    # Same resampling torchvision applies to PIL images, in one pass to the model's size
+    return image.resize((width, height), Image.BILINEAR)
+
+
+def to_chw(image, out=None, channels=3, dtype=np.float32):
+    """Write a PIL image as ``(1, channels, H, W)``.
+
+    Floating-point outputs are scaled to [0, 1] like ToTensor; integer
+    outputs (quantized models declaring uint8 input) get the raw pixels.
+    """
+    pixels = np.asarray(image)
+    height, width = pixels.shape[:2]
+    if out is None:
+        out = np.empty((1, channels, height, width), dtype=dtype)
+    chw = out.reshape(-1, height, width)
+    scale = np.issubdtype(out.dtype, np.floating)
+
+    def write(source, target):
+        if scale:
+            np.divide(source, out.dtype.type(255), out=target, dtype=out.dtype)
+        else:
+            target[...] = source
+
+    if pixels.ndim == 2:
+        # Grayscale: convert once and broadcast into the other channels
+        write(pixels, chw[0])
+        chw[1:] = chw[0]
+    else:
+        write(pixels.transpose(2, 0, 1), chw)
+    return out
+
+
+def to_chw_float32(image, out=None):
+    """Write a PIL image as ``(1, 3, H, W)`` float32 in [0, 1], like ToTensor."""
+    return to_chw(image, out=out)
+
+
+def preprocess_image(image_bytes, input_size=INPUT_SIZE, out=None, draft=True, channels=3, dtype=np.float32):
+    """Decode raw upload bytes into a ``(1, channels, height, width)`` model input.
+
+    With ``out`` (e.g. a row of a preallocated batch) its shape and dtype win
+    over ``input_size``, ``channels`` and ``dtype``.
+    """
+    if out is not None:
+        channels, input_size = out.shape[1], out.shape[2:]
+    image = decode_image(image_bytes, input_size, draft=draft, grayscale=channels == 1)
+    return to_chw(image, out=out, channels=channels, dtype=dtype)
@@ -0,0 +1,342 @@
+"""Framework-independent ONNX session registry.
+
+One ``InferenceSession`` is built per task with tuned ``SessionOptions`` and
+warmed up with a dummy inference before the task is reported ready. Sessions
+are shared by all request threads (``InferenceSession.run`` is thread-safe).
+
+Sessions are loaded lazily on first use (and, unless ``MODEL_PRELOAD=0``,
+preloaded at startup while they fit). With ``MODEL_MEMORY_BUDGET_MB`` set,
+the least recently used sessions are dropped once the loaded models exceed
+the budget; an evicted task is simply reloaded on its next request. Each
+model's footprint is the process RSS growth while loading and warming it
+(at least its file size).
+
+With ``EMBEDDINGS=1`` every graph gets an extra ``embedding`` output (the
+penultimate-layer features, flattened to ``(N, D)``) so the same session
+can serve similar-case search; see ``with_embedding_output``.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+# onnxruntime is imported when the first session is built, so importing this
+# module (the API, and the worker pool's parent process) does not pay for it
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disabled": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+ORT_GRAPH_OPTIMIZATION = os.environ.get("ORT_GRAPH_OPTIMIZATION", "all")
+ORT_INTRA_OP_THREADS = int(os.environ.get("ORT_INTRA_OP_THREADS", "0"))
+ORT_INTER_OP_THREADS = int(os.environ.get("ORT_INTER_OP_THREADS", "0"))
+ORT_MEMORY_ARENA = os.environ.get("ORT_MEMORY_ARENA", "1") != "0"
+
+MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "1") != "0"
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get("MODEL_MEMORY_BUDGET_MB", "0"))
+
+# Model variant built by tools/optimize_models.py: one for every task, and
+# per-task overrides as JSON, e.g. '{"Pneumonia Detection": "int8_static"}'
+MODEL_VARIANT = os.environ.get("MODEL_VARIANT", "")
+MODEL_VARIANTS = json.loads(os.environ.get("MODEL_VARIANTS", "{}"))
+
+# Expose the penultimate-layer features as an "embedding" output (needs the onnx package)
+EMBEDDINGS = os.environ.get("EMBEDDINGS", "0") != "0"
+EMBEDDING_OUTPUT = "embedding"
+
+# Default size for dynamic spatial dimensions when building warmup inputs
+WARMUP_INPUT_SIZE = 224
+
+ONNX_DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(uint8)": np.uint8,
+    "tensor(int8)": np.int8,
+}
+
+
+def make_session_options(intra_op_threads=None):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = getattr(
+        ort.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[ORT_GRAPH_OPTIMIZATION]
+    )
+    options.intra_op_num_threads = ORT_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    options.inter_op_num_threads = ORT_INTER_OP_THREADS
+    options.enable_cpu_mem_arena = ORT_MEMORY_ARENA
+    options.enable_mem_pattern = ORT_MEMORY_ARENA
+    return options
+
+
+_missing_variants = set()
+
+
+def resolve_model_path(task, entry):
+    """Return ``(variant, model_path)`` for the configured variant of ``task``."""
+    variant = MODEL_VARIANTS.get(task, MODEL_VARIANT) or "fp32"
+    if variant == "fp32":
+        return variant, entry["model_path"]
+    recorded = entry.get("variants", {}).get(variant)
+    if recorded is None:
+        if (task, variant) not in _missing_variants:
+            _missing_variants.add((task, variant))
+            print(f"No '{variant}' variant recorded for {task}; run tools/optimize_models.py. Using fp32.")
+        return "fp32", entry["model_path"]
+    return variant, recorded["model_path"]
+
+
+class InputSpec(NamedTuple):
+    """A model's declared ``(N, C, H, W)`` input; ``None`` marks a dynamic spatial dimension."""
+    channels: int
+    height: Optional[int]
+    width: Optional[int]
+    dtype: str = "float32"
+
+    @property
+    def dynamic(self):
+        return self.height is None or self.width is None
+
+    def size(self, default=WARMUP_INPUT_SIZE):
+        """``(height, width)`` to feed the model, with ``default`` for dynamic dimensions."""
+        return self.height or default, self.width or default
+
+
+def input_spec(session):
+    """The declared input of ``session``: dynamic channels count as 3, dtype as a NumPy name."""
+    model_input = session.get_inputs()[0]
+    dims = [dim if isinstance(dim, int) and dim > 0 else None for dim in model_input.shape]
+    _, channels, height, width = ([None] * 4 + dims)[-4:]
+    return InputSpec(channels or 3, height, width, np.dtype(ONNX_DTYPES.get(model_input.type, np.float32)).name)
+
+
+def warmup_input(session):
+    spec = input_spec(session)
+    shape = (1, spec.channels, *spec.size())
+    return {session.get_inputs()[0].name: np.zeros(shape, dtype=spec.dtype)}
+
+
+def with_embedding_output(model_path, tensor_name=None):
+    """Serialized model with ``tensor_name`` added as a flattened ``embedding`` output.
+
+    Without ``tensor_name`` the input of the final Gemm/MatMul (the classifier
+    head) is used, looking through a trailing bias Add or Softmax.
+    """
+    import onnx
+    from onnx import TensorProto, helper
+
+    model = onnx.load(model_path)
+    graph = model.graph
+    if tensor_name is None:
+        producers = {output: node for node in graph.node for output in node.output}
+        node = producers.get(graph.output[0].name)
+        while node is not None and node.op_type in ("Softmax", "Add", "Identity"):
+            node = next((producers[name] for name in node.input
+                         if name in producers and producers[name].op_type in ("Gemm", "MatMul", "Add", "Identity")),
+                        None)
+        if node is None or node.op_type not in ("Gemm", "MatMul"):
+            raise ValueError(f"No classifier head found in {model_path}; set 'embedding_output' in model_info.json")
+        tensor_name = node.input[0]
+    graph.node.append(helper.make_node("Flatten", [tensor_name], [EMBEDDING_OUTPUT], axis=1))
+    graph.output.append(helper.make_tensor_value_info(EMBEDDING_OUTPUT, TensorProto.FLOAT, None))
+    return model.SerializeToString()
+
+
+def run_session(session, batch, output_name=None):
+    """Run an ``(N, C, H, W)`` batch and return one output (the first by default) for all ``N`` rows."""
+    model_input = session.get_inputs()[0]
+    output_name = output_name or session.get_outputs()[0].name
+    # The worker pool ships float32; models declaring float16 or uint8 get their own dtype
+    dtype = ONNX_DTYPES.get(model_input.type)
+    if dtype is not None and batch.dtype != dtype:
+        batch = batch.astype(dtype)
+
+    # Models exported with a fixed batch dimension of 1 are fed row by row
+    if model_input.shape and model_input.shape[0] == 1 and len(batch) > 1:
+        return np.concatenate([
+            session.run([output_name], {model_input.name: batch[i:i + 1]})[0]
+            for i in range(len(batch))
+        ])
+    return session.run([output_name], {model_input.name: batch})[0]
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ModelRegistry:
+    """Build, warm and hand out one inference session per task, LRU-bounded by memory."""
+
+    def __init__(self, model_info, providers=None, memory_budget_mb=MODEL_MEMORY_BUDGET_MB, preload=MODEL_PRELOAD,
+                 intra_op_threads=None, embeddings=EMBEDDINGS):
+        self.model_info = model_info
+        self.embeddings = embeddings
+        self.providers = providers or ["CPUExecutionProvider"]
+        self.intra_op_threads = intra_op_threads
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.preload = preload
+        self.evictions = 0
+        # Most recently used last
+        self._sessions = OrderedDict()
+        self._memory = {}
+        # Declared input per task, kept after eviction (the model file is unchanged)
+        self._inputs = {}
+        self._status = {task: {"state": "unloaded"} for task in model_info}
+        self._lock = threading.Lock()
+        # Loads are serialised so each one's RSS growth can be attributed to it
+        self._load_lock = threading.Lock()
+        self._thread = None
+        self._preloaded = threading.Event()
+
+    def start(self):
+        """Preload models on a background thread (or just mark the registry ready)."""
+        if not self.preload:
+            self._preloaded.set()
+        elif self._thread is None:
+            self._thread = threading.Thread(target=self.load_all, name="model-registry", daemon=True)
+            self._thread.start()
+
+    def load_all(self):
+        """Load tasks in catalog order until the memory budget is used up."""
+        try:
+            for task in self.model_info:
+                if self.memory_budget and self.memory_used() >= self.memory_budget:
+                    break
+                try:
+                    self.get(task)
+                except Exception as e:
+                    print(f"Error loading model for {task}: {str(e)}")
+        finally:
+            self._preloaded.set()
+
+    def get(self, task):
+        with self._lock:
+            session = self._sessions.get(task)
+            if session is not None:
+                self._sessions.move_to_end(task)
+                return session
+        with self._load_lock:
+            with self._lock:
+                session = self._sessions.get(task)
+            if session is None:
+                session = self._load(task)
+        return session
+
+    def adopt(self, other, tasks):
+        """Take over ``other``'s loaded sessions for ``tasks`` whose models did not change."""
+        with other._lock:
+            sessions = {task: other._sessions[task] for task in tasks if task in other._sessions}
+            memory = {task: other._memory[task] for task in sessions}
+            inputs = {task: other._inputs[task] for task in tasks if task in other._inputs}
+        with self._lock:
+            self._sessions.update(sessions)
+            self._memory.update(memory)
+            self._inputs.update(inputs)
+        for task in sessions:
+            self._status[task] = dict(other._status[task])
+
+    def input_spec(self, task):
+        """Declared input of ``task``'s model, loading it on first use."""
+        spec = self._inputs.get(task)
+        if spec is None:
+            self.get(task)
+            spec = self._inputs[task]
+        return spec
+
+    def model_path(self, task):
+        return resolve_model_path(task, self.model_info[task])[1]
+
+    def memory_used(self):
+        with self._lock:
+            return sum(self._memory[task] for task in self._sessions)
+
+    def _load(self, task):
+        import onnxruntime as ort
+
+        variant, model_path = resolve_model_path(task, self.model_info[task])
+        self._status[task] = {"state": "loading", "variant": variant, "model_path": model_path}
+        try:
+            rss_before = rss_bytes()
+            started = time.perf_counter()
+            model = model_path
+            if self.embeddings:
+                model = with_embedding_output(model_path, self.model_info[task].get("embedding_output"))
+            options = make_session_options(self.intra_op_threads)
+            session = ort.InferenceSession(model, sess_options=options, providers=self.providers)
+            loaded = time.perf_counter()
+            session.run(None, warmup_input(session))
+            warmed = time.perf_counter()
+            rss_after = rss_bytes()
+        except Exception as e:
+            self._status[task] = {"state": "error", "variant": variant, "model_path": model_path, "error": str(e)}
+            raise
+
+        memory = os.path.getsize(model_path)
+        if rss_before is not None and rss_after is not None:
+            memory = max(memory, rss_after - rss_before)
+        spec = input_spec(session)
+        with self._lock:
+            self._sessions[task] = session
+            self._memory[task] = memory
+            self._inputs[task] = spec
+        self._status[task] = {
+            "state": "ready",
+            "variant": variant,
+            "model_path": model_path,
+            "input": {"shape": [spec.channels, spec.height, spec.width], "dtype": spec.dtype},
+            "load_ms": (loaded - started) * 1000.0,
+            "warmup_ms": (warmed - loaded) * 1000.0,
+            "memory_bytes": memory,
+        }
+        self._evict(keep=task)
+        return session
+
+    def _evict(self, keep):
+        """Drop least recently used sessions until the loaded models fit the budget."""
+        if not self.memory_budget:
+            return
+        with self._lock:
+            used = sum(self._memory[task] for task in self._sessions)
+            for task in list(self._sessions):
+                if used <= self.memory_budget:
+                    break
+                if task == keep:
+                    continue
+                # In-flight runs keep their reference; memory is freed once they finish
+                del self._sessions[task]
+                used -= self._memory[task]
+                self.evictions += 1
+                self._status[task] = {**self._status[task], "state": "evicted"}
+                print(f"Evicted model for {task} to stay within the {self.memory_budget / (1 << 20):g} MiB budget")
+
+    def is_ready(self):
+        """True once startup preloading finished without errors; later loads happen on demand."""
+        return self._preloaded.is_set() and all(
+            status["state"] != "error" for status in self._status.values()
+        )
+
+    def status(self):
+        with self._lock:
+            loaded = list(self._sessions)
+        return {
+            "ready": self.is_ready(),
+            "models": dict(self._status),
+            "memory": {
+                "budget_bytes": self.memory_budget,
+                "used_bytes": self.memory_used(),
+                "loaded": loaded,
+                "evictions": self.evictions,
+            },
+        }
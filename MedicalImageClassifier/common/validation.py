@@ -0,0 +1,157 @@
+"""Fast-fail upload validation that runs before any full image decode.
+
+Uploads are checked as they stream in: the declared ``Content-Length`` and
+the running byte count are capped at ``MAX_UPLOAD_BYTES``, the image format
+is sniffed from its magic bytes and the dimensions are read from the file
+header, so a wrong format, an oversized image or a decompression bomb is
+rejected after a few hundred bytes instead of after a full decode.
+``MAX_IMAGE_PIXELS`` is also installed as PIL's own decompression-bomb
+limit as a backstop for code paths that decode directly.
+"""
+import io
+import os
+import struct
+
+from PIL import Image
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(40_000_000)))
+# Give up on finding the dimensions in a header longer than this
+MAX_HEADER_BYTES = 256 * 1024
+# Allowance for multipart boundaries and the text fields around the image
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+# PIL raises DecompressionBombError above twice this many pixels
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+_MAGIC = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+
+# JPEG start-of-frame markers (0xC4 DHT, 0xC8 JPG and 0xCC DAC are not frames)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class InvalidImage(ValueError):
+    """Upload rejected before decoding; ``status_code`` is the HTTP status to return."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def check_content_length(headers, max_bytes=MAX_UPLOAD_BYTES):
+    """Reject a request whose declared body size is over the cap, before reading it."""
+    length = headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > max_bytes + FORM_OVERHEAD_BYTES:
+        raise InvalidImage(f"Upload exceeds {max_bytes} bytes", 413)
+
+
+def sniff_format(header):
+    """Image format from the magic bytes, or None if ``header`` is too short to tell."""
+    for magic, image_format in _MAGIC:
+        if header.startswith(magic):
+            return image_format
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    if len(header) < 12:
+        return None
+    raise InvalidImage("Unsupported or unrecognised image format", 415)
+
+
+def _jpeg_size(header):
+    offset = 2
+    while offset + 9 <= len(header):
+        if header[offset] != 0xFF:
+            raise InvalidImage("Malformed JPEG header")
+        marker = header[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", header[offset + 5:offset + 9])
+            return width, height
+        if marker == 0xDA:
+            raise InvalidImage("Malformed JPEG header: no frame before scan data")
+        offset += 2 + struct.unpack(">H", header[offset + 2:offset + 4])[0]
+    return None
+
+
+def _webp_size(header):
+    if len(header) < 30:
+        return None
+    chunk = header[12:16]
+    if chunk == b"VP8X":
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return width, height
+    if chunk == b"VP8L":
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    raise InvalidImage("Malformed WEBP header")
+
+
+def header_size(header, image_format):
+    """``(width, height)`` from the file header, or None if more bytes are needed."""
+    if image_format == "PNG":
+        return struct.unpack(">II", header[16:24]) if len(header) >= 24 else None
+    if image_format == "GIF":
+        return struct.unpack("<HH", header[6:10]) if len(header) >= 10 else None
+    if image_format == "BMP":
+        if len(header) < 26:
+            return None
+        if struct.unpack("<I", header[14:18])[0] == 12:
+            return struct.unpack("<HH", header[18:22])
+        width, height = struct.unpack("<ii", header[18:26])
+        return abs(width), abs(height)
+    if image_format == "JPEG":
+        return _jpeg_size(header)
+    if image_format == "WEBP":
+        return _webp_size(header)
+    # TIFF keeps its dimensions in an IFD that may sit anywhere; let PIL parse the header
+    try:
+        with Image.open(io.BytesIO(header), formats=[image_format]) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        raise InvalidImage(f"Image exceeds {MAX_IMAGE_PIXELS} pixels", 413)
+    except Exception:
+        return None
+
+
+def check_image_header(header, complete=False, max_pixels=MAX_IMAGE_PIXELS):
+    """Validate an image from its first bytes.
+
+    Returns ``(format, width, height)`` once the header has been read, or None
+    while more bytes are needed (``complete`` means no more bytes will come).
+    """
+    image_format = sniff_format(bytes(header[:12]))
+    size = header_size(header, image_format) if image_format else None
+    if size is None:
+        if complete or len(header) > MAX_HEADER_BYTES:
+            raise InvalidImage("Truncated or malformed image header")
+        return None
+    width, height = size
+    if width <= 0 or height <= 0:
+        raise InvalidImage("Image has no pixels")
+    if width * height > max_pixels:
+        raise InvalidImage(f"Image is {width}x{height}; the limit is {max_pixels} pixels", 413)
+    return image_format, width, height
+
+
+def check_decoded_size(image, max_pixels=MAX_IMAGE_PIXELS):
+    """Guard for an opened (not yet loaded) PIL image."""
+    width, height = image.size
+    if width * height > max_pixels:
+        raise InvalidImage(f"Image is {width}x{height}; the limit is {max_pixels} pixels", 413)
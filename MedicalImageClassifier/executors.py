@@ -0,0 +1,93 @@
+"""Bounded thread pools that keep blocking work off the asyncio event loop.
+
+Decode/preprocess and ONNX inference get separate pools so a burst of large
+uploads cannot starve inference (and vice versa). Each pool accepts at most
+``max_workers + max_queue`` outstanding jobs; anything beyond that raises
+``Overloaded`` immediately so the API can answer 503 instead of queueing
+without limit.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.metrics import Histogram
+
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+PREPROCESS_QUEUE = int(os.environ.get("PREPROCESS_QUEUE", "64"))
+# With the inference process pool (workerpool.py) these threads only hand batches
+# to the worker processes and wait, so by default there is one per ring slot
+INFERENCE_PROCESSES = int(os.environ.get("INFERENCE_PROCESSES", "0"))
+INFERENCE_RING_SLOTS = int(os.environ.get("INFERENCE_RING_SLOTS", "4"))
+INFERENCE_WORKERS = int(os.environ.get(
+    "INFERENCE_WORKERS", str(INFERENCE_PROCESSES * INFERENCE_RING_SLOTS if INFERENCE_PROCESSES > 0 else 2)
+))
+INFERENCE_QUEUE = int(os.environ.get("INFERENCE_QUEUE", "16"))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "1"))
+
+STAGE_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Overloaded(Exception):
+    """Raised when a stage cannot accept more work; maps to HTTP 503."""
+
+    def __init__(self, stage, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__(f"Server busy: {stage} queue is full")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class BoundedExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor with a hard cap on queued jobs and per-job timing."""
+
+    def __init__(self, name, max_workers, max_queue):
+        super().__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_wait_hist = Histogram(STAGE_BUCKETS_MS)
+        self.run_time_hist = Histogram(STAGE_BUCKETS_MS)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise Overloaded(self.name)
+        enqueued = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            self.queue_wait_hist.observe((started - enqueued) * 1000.0)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.run_time_hist.observe((time.perf_counter() - started) * 1000.0)
+
+        try:
+            future = super().submit(timed)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._pending_lock:
+            self._pending += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+            "run_time_ms": self.run_time_hist.snapshot(),
+        }
+
+
+preprocess_pool = BoundedExecutor("preprocess", PREPROCESS_WORKERS, PREPROCESS_QUEUE)
+inference_pool = BoundedExecutor("inference", INFERENCE_WORKERS, INFERENCE_QUEUE)
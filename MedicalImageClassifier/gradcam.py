@@ -0,0 +1,131 @@
+"""Precomputed Grad-CAM overlay engine.
+
+Every ``grad-cams/<model_name>/class_N_heatmap.jpg`` is colour-mapped (JET)
+once and stored at ``GRADCAM_SIZE`` x ``GRADCAM_SIZE`` in a single uint8
+``.npy`` file that is memory-mapped read-only, so all workers on a node share
+the same pages. Requests only blend the input with a row of that array in
+float32 scratch buffers and encode the result if the client asked for it.
+"""
+import base64
+import io
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+GRADCAM_DIR = os.environ.get("GRADCAM_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "grad-cams"))
+GRADCAM_CACHE = os.environ.get("GRADCAM_CACHE", os.path.join(GRADCAM_DIR, ".heatmaps-224.npy"))
+GRADCAM_SIZE = 224
+GRADCAM_ALPHA = 0.4
+GRADCAM_FORMATS = {"png": "PNG", "webp": "WEBP"}
+
+
+class GradCamEngine:
+    """Blend per-class Grad-CAM heatmaps onto model inputs."""
+
+    def __init__(self, model_info, heatmap_dir=GRADCAM_DIR, cache_path=GRADCAM_CACHE, size=GRADCAM_SIZE):
+        self.model_info = model_info
+        self.heatmap_dir = heatmap_dir
+        self.cache_path = cache_path
+        self.size = size
+        self.heatmaps = None
+        self.index = {}
+        self._buffers = threading.local()
+
+    def load(self):
+        """Open the colour-mapped heatmap array, rebuilding it if any source changed."""
+        sources = self._sources()
+        manifest = {f"{model_name}/{class_id}": [path, os.stat(path).st_mtime_ns]
+                    for (model_name, class_id), path in sources.items()}
+        manifest_path = self.cache_path + ".json"
+        try:
+            with open(manifest_path) as f:
+                stale = json.load(f) != manifest
+        except (OSError, ValueError):
+            stale = True
+        if stale or not os.path.exists(self.cache_path):
+            self._build(sources, manifest, manifest_path)
+
+        self.heatmaps = np.load(self.cache_path, mmap_mode="r")
+        self.index = {key: row for row, key in enumerate(sources)}
+
+    def _sources(self):
+        sources = {}
+        for entry in self.model_info.values():
+            model_dir = os.path.join(self.heatmap_dir, entry["model_name"])
+            if not os.path.isdir(model_dir):
+                continue
+            for class_id in sorted(int(name) for name in _class_ids(entry)):
+                path = os.path.join(model_dir, f"class_{class_id}_heatmap.jpg")
+                if os.path.exists(path):
+                    sources[(entry["model_name"], class_id)] = path
+        return sources
+
+    def _build(self, sources, manifest, manifest_path):
+        import cv2
+
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp.npy"
+        heatmaps = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.uint8, shape=(len(sources), self.size, self.size, 3)
+        )
+        for row, path in enumerate(sources.values()):
+            heatmap = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            heatmap = cv2.resize(heatmap, (self.size, self.size))
+            colored = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
+            cv2.cvtColor(colored, cv2.COLOR_BGR2RGB, dst=heatmaps[row])
+        heatmaps.flush()
+        del heatmaps
+        # Atomic swap so concurrent workers never map a half-written file
+        os.replace(tmp_path, self.cache_path)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+
+    def overlay(self, model_name, class_id, image_tensor, alpha=GRADCAM_ALPHA):
+        """Blend the class heatmap onto a ``(1, 3, H, W)`` input; returns HWC uint8 or None."""
+        row = self.index.get((model_name, int(class_id)))
+        if row is None or self.heatmaps is None:
+            return None
+
+        image = image_tensor[0].transpose(1, 2, 0)
+        if image.shape[:2] != (self.size, self.size):
+            return None
+        blended, heat, out = self._scratch()
+
+        # (1 - alpha) * image / image.max() + alpha * heatmap / 255, scaled to 0..255
+        peak = float(image.max()) or 1.0
+        np.multiply(image, np.float32((1 - alpha) * 255.0 / peak), out=blended)
+        np.multiply(self.heatmaps[row], np.float32(alpha), out=heat)
+        blended += heat
+        np.clip(blended, 0, 255, out=blended)
+        np.copyto(out, blended, casting="unsafe")
+        return out
+
+    def render(self, model_name, class_id, image_tensor, image_format="png"):
+        """Return the overlay as a base64 data URL, or None when no heatmap exists."""
+        overlay = self.overlay(model_name, class_id, image_tensor)
+        if overlay is None:
+            return None
+        pil_format = GRADCAM_FORMATS[image_format]
+        buffer = io.BytesIO()
+        options = {"compress_level": 1} if pil_format == "PNG" else {"quality": 90}
+        Image.fromarray(overlay).save(buffer, format=pil_format, **options)
+        encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+        return f"data:image/{image_format};base64,{encoded}"
+
+    def _scratch(self):
+        buffers = getattr(self._buffers, "arrays", None)
+        if buffers is None:
+            shape = (self.size, self.size, 3)
+            buffers = self._buffers.arrays = (
+                np.empty(shape, dtype=np.float32),
+                np.empty(shape, dtype=np.float32),
+                np.empty(shape, dtype=np.uint8),
+            )
+        return buffers
+
+
+def _class_ids(entry):
+    # Most entries nest classes under "class_info"; tolerate top-level class keys
+    return entry.get("class_info") or [key for key in entry if key.isdigit()]
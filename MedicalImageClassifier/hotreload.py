@@ -0,0 +1,228 @@
+"""Versioned model serving with hot reload.
+
+``ModelStore.current`` is an immutable ``ServingVersion``: the validated
+catalog plus the sessions built from it, numbered from 1. A watcher thread
+stats model_info.json and every model file it points to each
+``MODEL_WATCH_INTERVAL`` seconds (0 disables watching). Once a change has
+been stable for one interval, a new catalog and registry are built in the
+background. Unchanged models (same entry, same file) take over their warm
+sessions and the rest are loaded and warmed. Only then is ``current``
+swapped, in one assignment.
+
+Requests keep the version they started with (micro-batches are keyed by
+``VersionedTask``), and a replaced version stays resolvable for
+``MODEL_RETIRE_SECONDS``, so in-flight work finishes on the old sessions.
+A malformed model_info.json or a model that fails to load leaves the
+current version serving and is reported by ``status()``.
+"""
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from catalog import MODEL_INFO_PATH, Catalog
+from common.registry import ModelRegistry, resolve_model_path
+
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "2"))
+MODEL_RETIRE_SECONDS = float(os.environ.get("MODEL_RETIRE_SECONDS", "30"))
+
+
+class VersionedTask(NamedTuple):
+    """Task pinned to the serving version a request started on.
+
+    ``size`` marks inputs at a resolution other than the model's own (the
+    low-resolution first pass of fast mode), so they are batched apart.
+    """
+    task: str
+    version: int
+    size: Optional[int] = None
+
+    def __str__(self):
+        return f"{self.task}@v{self.version}" + (f"@{self.size}px" if self.size else "")
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ServingVersion:
+    """One generation of catalog and sessions; never modified once serving."""
+
+    def __init__(self, number, catalog, registry, files, changed=()):
+        self.number = number
+        self.catalog = catalog
+        self.registry = registry
+        # {path: (size, mtime_ns)} of model_info.json and every model file
+        self.files = files
+        # Tasks added, removed or changed relative to the previous version
+        self.changed = list(changed)
+        self.loaded_at = time.time()
+
+    @property
+    def model_info(self):
+        return self.catalog.model_info
+
+
+class ModelStore:
+    """Hold the serving version and swap in new ones when the model files change.
+
+    With an ``InferenceWorkerPool`` attached as ``worker_pool``, the workers
+    build and warm each new version themselves and the swap waits for all
+    of them.
+    """
+
+    def __init__(self, path=MODEL_INFO_PATH, interval=MODEL_WATCH_INTERVAL, retire_seconds=MODEL_RETIRE_SECONDS,
+                 make_registry=ModelRegistry):
+        self.path = path
+        self.interval = interval
+        self.retire_seconds = retire_seconds
+        self.make_registry = make_registry
+        self.worker_pool = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        catalog = Catalog.load(path)
+        self._current = ServingVersion(1, catalog, make_registry(catalog.model_info), self._snapshot(catalog))
+        self._versions = {1: self._current}
+        self._listeners = []
+        self._retire_listeners = []
+        self._reload_lock = threading.Lock()
+        self._seen = self._current.files
+        self._pending = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def current(self):
+        return self._current
+
+    def get(self, number):
+        """Version ``number`` while it is serving or retiring, else the current one."""
+        return self._versions.get(number, self._current)
+
+    def on_swap(self, callback):
+        """Call ``callback(old, new)`` after every swap."""
+        self._listeners.append(callback)
+
+    def on_retire(self, callback):
+        """Call ``callback(number)`` once version ``number`` has stopped serving."""
+        self._retire_listeners.append(callback)
+
+    def start(self):
+        """Start the watcher thread (unless ``interval`` is 0)."""
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _snapshot(self, catalog):
+        files = {self.path: _signature(self.path)}
+        for task, entry in catalog.model_info.items():
+            path = resolve_model_path(task, entry)[1]
+            files[path] = _signature(path)
+        return files
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error checking model files: {str(e)}")
+
+    def check(self):
+        """Reload once the watched files differ from the last attempt and have stopped changing."""
+        files = {path: _signature(path) for path in self._seen}
+        if files == self._seen:
+            self._pending = None
+            return None
+        # Wait for one quiet interval so half-copied files are never loaded
+        if files != self._pending:
+            self._pending = files
+            return None
+        self._pending = None
+        return self.reload()
+
+    def reload(self):
+        """Build, warm and swap in a new version; returns it, or None if it failed."""
+        with self._reload_lock:
+            old = self._current
+            number = old.number + 1
+            try:
+                catalog = Catalog.load(self.path)
+                files = self._snapshot(catalog)
+                self._seen = files
+                unchanged = []
+                for task, entry in catalog.model_info.items():
+                    path = resolve_model_path(task, entry)[1]
+                    if old.model_info.get(task) == entry and files[path] == old.files.get(path):
+                        unchanged.append(task)
+                changed = sorted((set(catalog.model_info) | set(old.model_info)) - set(unchanged))
+                registry = self.make_registry(catalog.model_info)
+                if self.worker_pool is not None:
+                    self.worker_pool.reload(number, catalog.model_info, unchanged)
+                else:
+                    registry.adopt(old.registry, unchanged)
+                    if registry.preload:
+                        registry.load_all()
+                    errors = [
+                        f"{task}: {status['error']}" for task, status in registry.status()["models"].items()
+                        if status["state"] == "error"
+                    ]
+                    if errors:
+                        raise RuntimeError("; ".join(errors))
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                # Keep serving the old version; the next file change triggers another attempt
+                self._seen = {path: _signature(path) for path in self._seen}
+                print(f"Error reloading models, still serving version {old.number}: {str(e)}")
+                return None
+
+            version = ServingVersion(number, catalog, registry, files, changed)
+            self._versions[number] = version
+            self._current = version
+            self.reloads += 1
+            self.last_error = None
+
+        print(f"Serving model version {number} (changed: {', '.join(changed) or 'none'})")
+        for callback in self._listeners:
+            try:
+                callback(old, version)
+            except Exception as e:
+                print(f"Error in model swap listener: {str(e)}")
+        retire = threading.Timer(self.retire_seconds, self._retire, args=(old.number,))
+        retire.daemon = True
+        retire.start()
+        return version
+
+    def _retire(self, number):
+        if number == self._current.number:
+            return
+        self._versions.pop(number, None)
+        if self.worker_pool is not None:
+            self.worker_pool.retire(number)
+        for callback in self._retire_listeners:
+            try:
+                callback(number)
+            except Exception as e:
+                print(f"Error in model retire listener: {str(e)}")
+
+    def status(self):
+        current = self._current
+        return {
+            "version": current.number,
+            "loaded_at": current.loaded_at,
+            "changed": current.changed,
+            "serving": sorted(self._versions),
+            "model_info_path": self.path,
+            "watch_interval": self.interval,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
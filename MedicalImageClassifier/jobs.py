@@ -0,0 +1,384 @@
+"""Asynchronous bulk classification jobs.
+
+``POST /jobs`` stores the uploaded images with a broker and returns a job id
+straight away; ``JobRunner`` tasks on the API's event loop claim
+same-task chunks of up to ``BATCH_CHUNK_SIZE`` items and classify them with
+``predict_chunk`` (the /predict/batch path: ``preprocess_image`` into one
+batch, a single inference call, the prediction cache). Progress and results
+are read back from the broker.
+
+Brokers are chosen with ``JOBS_BROKER``:
+
+    memory                 in-process only; jobs are lost on restart (default)
+    sqlite:///path/jobs.db durable; shared by every API process on the node
+
+Claimed items hold a lease of ``JOB_LEASE_SECONDS``, renewed every third of
+that while their chunk runs, so a slow chunk is never claimed twice. Items
+whose lease runs out (the process died or was restarted mid-chunk) are
+claimed again, so durable jobs resume where they stopped. Inference
+failures (overload, a crashed worker) and chunks that fail outright are
+retried up to ``JOB_MAX_ATTEMPTS`` times with ``JOB_RETRY_SECONDS`` between
+attempts; unreadable images fail at once.
+"""
+import abc
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from batch_inference import BATCH_CHUNK_SIZE, item_error, predict_chunk
+
+JOBS_BROKER = os.environ.get("JOBS_BROKER", "memory")
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", "2"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_SECONDS = float(os.environ.get("JOB_RETRY_SECONDS", "5"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "120"))
+# How often idle runners look for work submitted by other processes
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1"))
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    " id TEXT PRIMARY KEY, created_at REAL, finished_at REAL, total INTEGER)",
+    "CREATE TABLE IF NOT EXISTS job_items ("
+    " job_id TEXT, idx INTEGER, filename TEXT, task TEXT, image BLOB,"
+    " state TEXT, attempts INTEGER DEFAULT 0, available_at REAL, result TEXT,"
+    " PRIMARY KEY (job_id, idx))",
+    "CREATE INDEX IF NOT EXISTS job_items_pending ON job_items (state, available_at)",
+)
+
+
+class Broker(abc.ABC):
+    """Where jobs and their items live. Methods are blocking and thread-safe."""
+
+    @abc.abstractmethod
+    def submit(self, job_id, items):
+        """Store a job; ``items`` is a list of ``(filename, task, image_bytes)``."""
+
+    @abc.abstractmethod
+    def claim(self, limit, lease_seconds):
+        """Lease up to ``limit`` runnable items of one job and task.
+
+        Returns ``(job_id, task, [(index, filename, image_bytes, attempts), ...])``
+        or None when nothing is runnable.
+        """
+
+    @abc.abstractmethod
+    def renew(self, job_id, indexes, lease_seconds):
+        """Extend the lease on items that are still running to ``lease_seconds`` from now."""
+
+    @abc.abstractmethod
+    def complete(self, job_id, results):
+        """Store final ``{index: result}`` for leased items."""
+
+    @abc.abstractmethod
+    def retry(self, job_id, results, delay, max_attempts):
+        """Put leased items back in the queue, or store ``results`` once out of attempts."""
+
+    @abc.abstractmethod
+    def status(self, job_id):
+        """Progress counts of a job, or None if it does not exist."""
+
+    @abc.abstractmethod
+    def results(self, job_id):
+        """Results of the finished items, in upload order."""
+
+
+class SQLiteBroker(Broker):
+    """Jobs in a SQLite file (WAL mode), safe to share between API processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA busy_timeout=5000")
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+
+    def _transaction(self, work):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front so two processes never claim the same items
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def submit(self, job_id, items):
+        now = time.time()
+
+        def work(db):
+            db.execute("INSERT INTO jobs VALUES (?, ?, NULL, ?)", (job_id, now, len(items)))
+            db.executemany(
+                "INSERT INTO job_items (job_id, idx, filename, task, image, state, available_at)"
+                " VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                [(job_id, index, filename, task, image, now) for index, (filename, task, image) in enumerate(items)],
+            )
+        self._transaction(work)
+
+    def claim(self, limit, lease_seconds):
+        now = time.time()
+
+        def work(db):
+            # Queued items that are due, and running items whose lease has expired
+            head = db.execute(
+                "SELECT job_id, task FROM job_items WHERE state IN ('queued', 'running') AND available_at <= ?"
+                " ORDER BY available_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if head is None:
+                return None
+            job_id, task = head
+            rows = db.execute(
+                "SELECT idx, filename, image, attempts FROM job_items"
+                " WHERE job_id = ? AND task = ? AND state IN ('queued', 'running') AND available_at <= ?"
+                " ORDER BY idx LIMIT ?",
+                (job_id, task, now, limit),
+            ).fetchall()
+            db.executemany(
+                "UPDATE job_items SET state = 'running', available_at = ? WHERE job_id = ? AND idx = ?",
+                [(now + lease_seconds, job_id, row[0]) for row in rows],
+            )
+            return job_id, task, [tuple(row) for row in rows]
+        return self._transaction(work)
+
+    def renew(self, job_id, indexes, lease_seconds):
+        available_at = time.time() + lease_seconds
+
+        def work(db):
+            db.executemany(
+                "UPDATE job_items SET available_at = ? WHERE job_id = ? AND idx = ? AND state = 'running'",
+                [(available_at, job_id, index) for index in indexes],
+            )
+        self._transaction(work)
+
+    def complete(self, job_id, results):
+        def work(db):
+            db.executemany(
+                "UPDATE job_items SET state = ?, result = ?, image = NULL, attempts = attempts + 1"
+                " WHERE job_id = ? AND idx = ? AND state = 'running'",
+                [
+                    ("failed" if "error" in result else "done", json.dumps(result), job_id, index)
+                    for index, result in results.items()
+                ],
+            )
+            self._finish_if_done(db, job_id)
+        self._transaction(work)
+
+    def retry(self, job_id, results, delay, max_attempts):
+        available_at = time.time() + delay
+
+        def work(db):
+            attempts = dict(db.execute(
+                f"SELECT idx, attempts FROM job_items WHERE job_id = ? AND idx IN ({','.join('?' * len(results))})",
+                (job_id, *results),
+            ).fetchall())
+            exhausted = {index: result for index, result in results.items() if attempts.get(index, 0) + 1 >= max_attempts}
+            db.executemany(
+                "UPDATE job_items SET state = 'queued', attempts = attempts + 1, available_at = ?"
+                " WHERE job_id = ? AND idx = ? AND state = 'running'",
+                [(available_at, job_id, index) for index in results if index not in exhausted],
+            )
+            db.executemany(
+                "UPDATE job_items SET state = 'failed', result = ?, image = NULL, attempts = attempts + 1"
+                " WHERE job_id = ? AND idx = ? AND state = 'running'",
+                [(json.dumps(result), job_id, index) for index, result in exhausted.items()],
+            )
+            self._finish_if_done(db, job_id)
+            return len(results) - len(exhausted)
+        return self._transaction(work)
+
+    @staticmethod
+    def _finish_if_done(db, job_id):
+        db.execute(
+            "UPDATE jobs SET finished_at = ? WHERE id = ? AND finished_at IS NULL AND NOT EXISTS"
+            " (SELECT 1 FROM job_items WHERE job_id = ? AND state IN ('queued', 'running'))",
+            (time.time(), job_id, job_id),
+        )
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._db.execute(
+                "SELECT created_at, finished_at, total FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall())
+        created_at, finished_at, total = job
+        finished = counts.get("done", 0) + counts.get("failed", 0)
+        if finished_at is not None:
+            state = "finished"
+        elif counts.get("running", 0) or finished:
+            state = "running"
+        else:
+            state = "queued"
+        return {
+            "id": job_id,
+            "state": state,
+            "total": total,
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "progress": finished / total if total else 1.0,
+            "created_at": created_at,
+            "finished_at": finished_at,
+        }
+
+    def results(self, job_id):
+        """Results of the finished items, in upload order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT result FROM job_items WHERE job_id = ? AND result IS NOT NULL ORDER BY idx", (job_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+class MemoryBroker(SQLiteBroker):
+    """In-process broker (a private in-memory SQLite database); nothing survives a restart."""
+
+    def __init__(self):
+        super().__init__(":memory:")
+
+
+BROKERS = {
+    "memory": lambda location: MemoryBroker(),
+    "sqlite": SQLiteBroker,
+}
+
+
+def make_broker(url=JOBS_BROKER):
+    """Broker for ``memory`` or ``<scheme>:///<location>`` (see ``BROKERS``)."""
+    scheme, _, location = url.partition("://")
+    if scheme not in BROKERS:
+        raise ValueError(f"Unknown jobs broker '{scheme}'; expected one of {sorted(BROKERS)}")
+    # sqlite:///relative.db and sqlite:////absolute.db, as in SQLAlchemy URLs
+    return BROKERS[scheme](location[1:] if location.startswith("/") else location)
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+class JobRunner:
+    """Event-loop tasks that drain the broker with at most ``concurrency`` chunks in flight."""
+
+    def __init__(self, broker, pipeline, cache=None, concurrency=JOB_CONCURRENCY,
+                 chunk_size=BATCH_CHUNK_SIZE, max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_SECONDS,
+                 lease_seconds=JOB_LEASE_SECONDS, poll_seconds=JOB_POLL_SECONDS):
+        self.broker = broker
+        # Returns the (run_batch, format_predictions, input_spec) triple to use for the next chunk
+        self.pipeline = pipeline
+        self.cache = cache
+        self.concurrency = max(1, int(concurrency))
+        self.chunk_size = chunk_size
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self._tasks = []
+        self._wakeup = None
+        self._counters = dict.fromkeys(("chunks", "items", "retries", "errors"), 0)
+
+    def start(self):
+        """Start the runner tasks; must be called from the running event loop."""
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, items):
+        """Store ``(filename, task, image_bytes)`` items as a new job and return its id."""
+        job_id = new_job_id()
+        await asyncio.get_running_loop().run_in_executor(None, self.broker.submit, job_id, items)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                claimed = await loop.run_in_executor(None, self.broker.claim, self.chunk_size, self.lease_seconds)
+            except Exception as e:
+                print(f"Error claiming job items: {str(e)}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._process(*claimed)
+            except Exception as e:
+                self._counters["errors"] += 1
+                print(f"Error processing job chunk: {str(e)}")
+                await self._retry_chunk(*claimed, f"Error processing image: {str(e)}")
+
+    async def _process(self, job_id, task, rows):
+        loop = asyncio.get_running_loop()
+        chunk = [(index, filename, image_bytes) for index, filename, image_bytes, _ in rows]
+        run_batch, format_predictions, input_spec = self.pipeline()
+        heartbeat = asyncio.ensure_future(self._keep_leased(job_id, [index for index, _, _ in chunk]))
+        try:
+            results = await predict_chunk(task, chunk, run_batch, format_predictions, input_spec, cache=self.cache)
+        finally:
+            heartbeat.cancel()
+        # The retryable flag is for this runner only; it is never stored
+        retry = {index: result for index, result in results.items() if result.pop("retryable", False)}
+        final = {index: result for index, result in results.items() if index not in retry}
+        if final:
+            await loop.run_in_executor(None, self.broker.complete, job_id, final)
+        if retry:
+            requeued = await loop.run_in_executor(
+                None, self.broker.retry, job_id, retry, self.retry_delay, self.max_attempts
+            )
+            self._counters["retries"] += requeued
+        self._counters["chunks"] += 1
+        self._counters["items"] += len(final)
+
+    async def _retry_chunk(self, job_id, task, rows, message):
+        """Count a chunk that failed outright as an attempt, so a poison chunk ends up failed."""
+        failed = {index: item_error((index, filename), task, message) for index, filename, _, _ in rows}
+        try:
+            requeued = await asyncio.get_running_loop().run_in_executor(
+                None, self.broker.retry, job_id, failed, self.retry_delay, self.max_attempts
+            )
+        except Exception as e:
+            # The lease runs out and the items are claimed again
+            print(f"Error requeueing job chunk: {str(e)}")
+            return
+        self._counters["retries"] += requeued
+
+    async def _keep_leased(self, job_id, indexes):
+        """Renew the lease on a chunk's items until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await loop.run_in_executor(None, self.broker.renew, job_id, indexes, self.lease_seconds)
+            except Exception as e:
+                print(f"Error renewing job lease: {str(e)}")
+
+    def stats(self):
+        return {
+            **self._counters,
+            "concurrency": self.concurrency,
+            "running": len(self._tasks),
+            "max_attempts": self.max_attempts,
+        }
@@ -0,0 +1,349 @@
+"""Similar-case search over model embeddings.
+
+Each task has an ``EmbeddingStore``: an append-only float32 matrix on disk
+(``<name>.f32``, memory-mapped for search) plus one JSON case id per line
+(``<name>.ids``). Vectors are L2-normalised on insert, so cosine similarity
+is a plain dot product. Stores are keyed by the model file hash, because a
+retrained model has a different embedding space and its vectors are not
+comparable with the old ones.
+
+Exact search is one vectorised matrix-vector product over the memmap and a
+partial sort. ``IVFPQIndex`` is the approximate alternative. It uses a
+k-means coarse quantiser with ``IVF_LISTS`` lists and product-quantised
+residuals (``PQ_SUBVECTORS`` uint8 codes per vector). A query scores the
+``nprobe`` closest lists with table lookups, then re-ranks the best
+``REFINE_FACTOR * k`` candidates exactly against the memmap. The index
+lives in memory. The first approximate query on a store holding at least
+``IVF_MIN_VECTORS`` vectors starts training it on a background thread, and
+exact search answers until the index is ready. The index is retrained the
+same way once the store has grown ``IVF_RETRAIN_GROWTH`` times. Inserts in
+between are encoded with the trained quantisers.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from catalog import APP_DIR
+
+EMBEDDINGS_DIR = os.environ.get("EMBEDDINGS_DIR", os.path.join(APP_DIR, "embeddings"))
+IVF_LISTS = int(os.environ.get("IVF_LISTS", "0"))  # 0: about 4 * sqrt(n)
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", "8"))
+IVF_MIN_VECTORS = int(os.environ.get("IVF_MIN_VECTORS", "20000"))
+IVF_RETRAIN_GROWTH = float(os.environ.get("IVF_RETRAIN_GROWTH", "4"))
+PQ_SUBVECTORS = int(os.environ.get("PQ_SUBVECTORS", "16"))
+# Approximate candidates re-scored exactly per requested neighbour
+REFINE_FACTOR = int(os.environ.get("REFINE_FACTOR", "64"))
+
+TRAIN_SAMPLE = 65536
+# 256 codewords per sub-quantiser need far fewer training vectors than the coarse lists
+PQ_TRAIN_SAMPLE = 16384
+KMEANS_ITERATIONS = 12
+# Rows per block when scanning or encoding, to bound temporary memory
+BLOCK_ROWS = 65536
+
+
+class EmbeddingsDisabled(Exception):
+    """Raised when similar-case search is used without ``EMBEDDINGS=1``; maps to HTTP 501."""
+
+
+def normalize(vectors):
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    return vectors / norms
+
+
+def top_k_indices(scores, k):
+    """Indices of the ``k`` largest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def kmeans(vectors, clusters, iterations=KMEANS_ITERATIONS, spherical=False, seed=0):
+    """Lloyd's k-means; ``spherical`` assigns by inner product and keeps unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    clusters = min(clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign(vectors, centroids, spherical)
+        counts = np.bincount(assignment, minlength=clusters)
+        # Per-column bincount is much faster than np.add.at for the cluster sums
+        sums = np.stack([
+            np.bincount(assignment, weights=column, minlength=clusters) for column in vectors.T
+        ], axis=1).astype(np.float32)
+        # Empty clusters are reseeded from random vectors
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        counts[empty] = 1
+        centroids = sums / counts[:, np.newaxis]
+        if spherical:
+            centroids = normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def assign(vectors, centroids, spherical=False):
+    """Nearest centroid per vector, in blocks."""
+    result = np.empty(len(vectors), dtype=np.intp)
+    centroid_norms = None if spherical else (centroids * centroids).sum(axis=1)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = vectors[start:start + BLOCK_ROWS] @ centroids.T
+        if not spherical:
+            # argmin ||x - c||^2 == argmax (2 x.c - ||c||^2)
+            block = 2 * block - centroid_norms
+        result[start:start + BLOCK_ROWS] = block.argmax(axis=1)
+    return result
+
+
+class IVFPQIndex:
+    """Inverted lists over coarse centroids, with product-quantised residuals."""
+
+    def __init__(self, dim, lists, subvectors=PQ_SUBVECTORS, seed=0):
+        while dim % subvectors:
+            subvectors -= 1
+        self.dim = dim
+        self.lists = lists
+        self.subvectors = subvectors
+        self.sub_dim = dim // subvectors
+        self.seed = seed
+        self.centroids = None
+        self.codebooks = None  # (subvectors, 256, sub_dim)
+        self.trained_size = 0  # vectors in the store when the index was trained
+        self.size = 0
+        self._ids = [[] for _ in range(lists)]
+        self._codes = [[] for _ in range(lists)]
+
+    def train(self, sample):
+        self.centroids = kmeans(sample, self.lists, spherical=True, seed=self.seed)
+        self.lists = len(self.centroids)
+        rng = np.random.default_rng(self.seed)
+        sample = sample[rng.permutation(len(sample))[:PQ_TRAIN_SAMPLE]]
+        residuals = sample - self.centroids[assign(sample, self.centroids, spherical=True)]
+        self.codebooks = np.stack([
+            kmeans(residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim], 256, seed=self.seed + j)
+            for j in range(self.subvectors)
+        ])
+
+    def encode(self, vectors):
+        """``(list, codes)`` for each vector."""
+        lists = assign(vectors, self.centroids, spherical=True)
+        residuals = vectors - self.centroids[lists]
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for j, codebook in enumerate(self.codebooks):
+            codes[:, j] = assign(residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim], codebook)
+        return lists, codes
+
+    def add(self, vectors, first_id):
+        for start in range(0, len(vectors), BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            lists, codes = self.encode(block)
+            ids = np.arange(first_id + start, first_id + start + len(block), dtype=np.int64)
+            order = np.argsort(lists, kind="stable")
+            bounds = np.searchsorted(lists[order], np.arange(self.lists + 1))
+            for list_id in np.flatnonzero(np.diff(bounds)):
+                rows = order[bounds[list_id]:bounds[list_id + 1]]
+                self._ids[list_id].append(ids[rows])
+                self._codes[list_id].append(codes[rows])
+        self.size += len(vectors)
+
+    def _list(self, list_id):
+        # Inserts append chunks; merge them the first time the list is searched
+        if len(self._ids[list_id]) > 1:
+            self._ids[list_id] = [np.concatenate(self._ids[list_id])]
+            self._codes[list_id] = [np.concatenate(self._codes[list_id])]
+        if not self._ids[list_id]:
+            return None, None
+        return self._ids[list_id][0], self._codes[list_id][0]
+
+    def search(self, query, candidates, nprobe=IVF_NPROBE):
+        """Approximate ``(ids, scores)`` of the best ``candidates`` vectors for one unit query."""
+        coarse = self.centroids @ query
+        probed = top_k_indices(coarse, nprobe)
+        # Inner products of each query sub-vector with every codeword: (subvectors, 256)
+        table = np.einsum("jkd,jd->jk", self.codebooks, query.reshape(self.subvectors, self.sub_dim))
+        ids, scores = [], []
+        for list_id in probed:
+            list_ids, codes = self._list(list_id)
+            if list_ids is None:
+                continue
+            ids.append(list_ids)
+            scores.append(coarse[list_id] + table[np.arange(self.subvectors), codes].sum(axis=1))
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        best = top_k_indices(scores, candidates)
+        return ids[best], scores[best]
+
+
+class EmbeddingStore:
+    """Append-only, memory-mapped matrix of unit vectors with one case id per row."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.vectors_path = prefix + ".f32"
+        self.ids_path = prefix + ".ids"
+        self.meta_path = prefix + ".json"
+        self.dim = None
+        self._ids = []
+        self._matrix = None
+        self._index = None
+        self._training = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            self.dim = json.load(f)["dim"]
+        with open(self.ids_path) as f:
+            self._ids = [json.loads(line) for line in f if line.strip()]
+        rows = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        # A crash between the two appends leaves one file a row ahead; trust the shorter one
+        count = min(rows, len(self._ids))
+        if rows != count:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(count * 4 * self.dim)
+        if len(self._ids) != count:
+            self._ids = self._ids[:count]
+            with open(self.ids_path, "w") as f:
+                f.writelines(json.dumps(case_id) + "\n" for case_id in self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, vectors, case_ids):
+        """Normalise and append ``vectors`` (one per case id); returns their row numbers."""
+        vectors = normalize(vectors)
+        if len(vectors) != len(case_ids):
+            raise ValueError("Expected one case id per vector")
+        with self._lock:
+            if self.dim is None:
+                os.makedirs(os.path.dirname(self.prefix) or ".", exist_ok=True)
+                self.dim = vectors.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} values; this store holds {self.dim}")
+            first = len(self._ids)
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.ids_path, "a") as f:
+                f.writelines(json.dumps(case_id) + "\n" for case_id in case_ids)
+            self._ids.extend(case_ids)
+            if self._index is not None and len(self._ids) < self._index.trained_size * IVF_RETRAIN_GROWTH:
+                self._index.add(vectors, first)
+            else:
+                self._index = None
+        return list(range(first, first + len(vectors)))
+
+    def matrix(self):
+        """Memory-mapped ``(count, dim)`` view; remapped only after inserts."""
+        with self._lock:
+            return self._mapped()
+
+    def _mapped(self):
+        # Callers hold _lock
+        count = len(self._ids)
+        if self._matrix is None or len(self._matrix) != count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim)) \
+                if count else np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix
+
+    def index(self, lists=IVF_LISTS, wait=False):
+        """The approximate index; None while the store is too small or the index is being trained.
+
+        Training runs on a background thread (``wait=True`` blocks until it is done).
+        """
+        with self._lock:
+            if self._index is not None or len(self._ids) < IVF_MIN_VECTORS:
+                return self._index
+            if self._training is None:
+                self._training = threading.Thread(target=self._train, args=(lists,), name="ivfpq-train", daemon=True)
+                self._training.start()
+            training = self._training
+        if wait:
+            training.join()
+            return self._index
+        return None
+
+    def _train(self, lists):
+        try:
+            matrix = self.matrix()
+            count = len(matrix)
+            rng = np.random.default_rng(0)
+            sample = matrix[np.sort(rng.choice(count, min(count, TRAIN_SAMPLE), replace=False))]
+            index = IVFPQIndex(self.dim, lists or int(4 * np.sqrt(count)))
+            index.train(np.asarray(sample))
+            index.add(matrix, 0)
+            index.trained_size = count
+            with self._lock:
+                # Cases inserted while the index was training
+                if len(self._ids) > count:
+                    index.add(self._mapped()[count:], count)
+                self._index = index
+        except Exception as e:
+            print(f"Error training similarity index for {self.prefix}: {str(e)}")
+        finally:
+            with self._lock:
+                self._training = None
+
+    def search(self, query, k=10, approximate=False, nprobe=IVF_NPROBE, refine=REFINE_FACTOR):
+        """Best ``k`` cases as ``[(case_id, cosine), ...]``, exact unless ``approximate``."""
+        query = normalize(query)[0]
+        if approximate:
+            # Starts training the index once the store is large enough
+            self.index()
+        with self._lock:
+            # One consistent snapshot: add() grows the ids, the matrix and the index together
+            ids, matrix, index = self._ids, self._mapped(), self._index if approximate else None
+            if index is not None:
+                # Searching merges the inverted lists add() appends to, so it must not overlap one
+                rows, _ = index.search(query, k * refine, nprobe)
+        if not len(matrix):
+            return []
+        if index is not None:
+            rows = np.sort(rows)
+            scores = matrix[rows] @ query
+            best = top_k_indices(scores, k)
+            rows, scores = rows[best], scores[best]
+        else:
+            scores = np.concatenate([
+                matrix[start:start + BLOCK_ROWS] @ query for start in range(0, len(matrix), BLOCK_ROWS)
+            ])
+            rows = top_k_indices(scores, k)
+            scores = scores[rows]
+        return [(ids[row], float(score)) for row, score in zip(rows.tolist(), scores.tolist())]
+
+
+class SimilarityIndex:
+    """One ``EmbeddingStore`` per (task, model file hash) under ``directory``."""
+
+    def __init__(self, directory=EMBEDDINGS_DIR):
+        self.directory = directory
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def store(self, model_name, model_version):
+        key = f"{model_name}-{model_version[:12]}"
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                store = self._stores[key] = EmbeddingStore(os.path.join(self.directory, key))
+            return store
+
+    def stats(self):
+        with self._lock:
+            stores = dict(self._stores)
+        return {
+            key: {
+                "vectors": len(store),
+                "dim": store.dim,
+                "approximate_index": store._index is not None,
+            }
+            for key, store in stores.items()
+        }
@@ -0,0 +1,119 @@
+"""Streaming NDJSON predictions for large batch uploads.
+
+The multipart body is parsed incrementally straight off ``request.stream()``
+so only the images of chunks still in flight are held in memory. Images are
+grouped into per-task chunks as they arrive; every finished result is
+emitted immediately as one JSON line.
+
+Form layout: a ``task`` text field sets the task for every image part that
+follows it, so one upload can switch tasks as often as needed::
+
+    task=Pneumonia Detection, image=a.png, image=b.png, task=..., image=c.png
+"""
+import asyncio
+import json
+import os
+
+from starlette.responses import StreamingResponse
+
+from batch_inference import item_error, predict_chunk
+from common.forms import iter_multipart
+from common.negotiation import compact_result
+from common.validation import MAX_UPLOAD_BYTES, InvalidImage, check_image_header
+
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", "8"))
+# Whole streamed upload; every image in it is still capped at MAX_UPLOAD_BYTES
+STREAM_MAX_UPLOAD_BYTES = int(os.environ.get("STREAM_MAX_UPLOAD_BYTES", str(MAX_UPLOAD_BYTES * 64)))
+# Chunks that may be buffered or in flight before we stop reading the upload
+STREAM_MAX_PENDING_CHUNKS = int(os.environ.get("STREAM_MAX_PENDING_CHUNKS", "4"))
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """NDJSON streaming response whose body generator still reads the upload.
+
+    The stock ``StreamingResponse`` listens for client disconnects on
+    ``receive`` while streaming, which would swallow the request body chunks
+    the generator is parsing. A disconnect still surfaces as
+    ``ClientDisconnect`` from ``request.stream()`` or as a failed send.
+    """
+
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def stream_predictions(request, run_batch, format_predictions, input_spec, catalog, cache=None, compact=False):
+    """Yield one NDJSON line (bytes) per image, in completion order; ``compact`` drops the class texts."""
+    results = asyncio.Queue()
+    slots = asyncio.Semaphore(STREAM_MAX_PENDING_CHUNKS)
+    in_flight = set()
+    done = object()
+
+    async def run(task, chunk):
+        try:
+            chunk_results = await predict_chunk(task, chunk, run_batch, format_predictions, input_spec, cache=cache)
+            for result in chunk_results.values():
+                result.pop("retryable", None)
+                await results.put(result)
+        finally:
+            slots.release()
+
+    async def dispatch(task, chunk):
+        # Blocks reading of the upload while too many chunks are pending
+        await slots.acquire()
+        job = asyncio.ensure_future(run(task, chunk))
+        in_flight.add(job)
+        job.add_done_callback(in_flight.discard)
+
+    async def produce():
+        chunks = {}
+        task = task_name = None
+        index = 0
+        try:
+            parts = iter_multipart(
+                request, STREAM_MAX_UPLOAD_BYTES, check_image_header, max_part_bytes=MAX_UPLOAD_BYTES,
+                raise_invalid=False,
+            )
+            async for name, filename, data in parts:
+                if filename is None:
+                    if name == "task":
+                        task_name = data.decode("utf-8")
+                        task = catalog.canonical(task_name)
+                    continue
+                entry = (index, filename, data)
+                index += 1
+                if isinstance(data, InvalidImage):
+                    # Rejected from its header or size without buffering the rest of it
+                    await results.put(item_error(entry, task_name, str(data)))
+                    continue
+                if task is None:
+                    await results.put(item_error(entry, task_name, f"Unknown task type: {task_name}"))
+                    continue
+                chunk = chunks.setdefault(task, [])
+                chunk.append(entry)
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    await dispatch(task, chunks.pop(task))
+            for pending_task, chunk in chunks.items():
+                await dispatch(pending_task, chunk)
+        except Exception as e:
+            await results.put({"error": f"Error reading upload: {str(e)}"})
+        finally:
+            # Let chunks already submitted report their results before closing
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            await results.put(done)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            result = await results.get()
+            if result is done:
+                break
+            yield json.dumps(compact_result(result) if compact else result).encode("utf-8") + b"\n"
+    finally:
+        producer.cancel()
+        for job in list(in_flight):
+            job.cancel()
@@ -0,0 +1,62 @@
+"""Shared fixtures: tiny synthetic ONNX models (tools/synthetic.py) and an API client.
+
+The app reads its configuration from the environment at import time, so the
+synthetic model_info.json and every on-disk cache are pointed at a temporary
+directory before any app module is imported.
+
+Run from MedicalImageClassifier/ with ``python -m pytest tests``; besides
+requirements.txt this needs pytest, httpx (for TestClient) and onnx (for
+tools/synthetic.py).
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "tools"))
+
+SYNTHETIC_DIR = tempfile.mkdtemp(prefix="medical-image-classifier-tests-")
+# Small enough to build and run in milliseconds; the API preprocesses to each model's declared size
+SYNTHETIC_INPUT_SIZE = 32
+
+os.environ.update({
+    "MODEL_INFO_PATH": os.path.join(SYNTHETIC_DIR, "model_info.json"),
+    "MODEL_WATCH_INTERVAL": "0",
+    "INFERENCE_PROCESSES": "0",
+    "PREDICTION_CACHE_DB": "",
+    "JOBS_BROKER": "memory",
+    "EMBEDDINGS": "0",
+    "EMBEDDINGS_DIR": os.path.join(SYNTHETIC_DIR, "embeddings"),
+    "GRADCAM_CACHE": os.path.join(SYNTHETIC_DIR, "heatmaps.npy"),
+})
+
+import synthetic  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def synthetic_models():
+    """Synthetic models for every task in utils/model_info.json; returns the synthetic model_info."""
+    with open(os.path.join(APP_DIR, "utils", "model_info.json")) as f:
+        model_info = json.load(f)
+    yield synthetic.build(SYNTHETIC_DIR, model_info, images_per_class=1, input_size=SYNTHETIC_INPUT_SIZE)
+    shutil.rmtree(SYNTHETIC_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client(synthetic_models):
+    from fastapi.testclient import TestClient
+
+    import api
+
+    with TestClient(api.app) as client:
+        yield client
+
+
+@pytest.fixture
+def image_bytes():
+    return synthetic.make_image(size=(64, 48))
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+
+def predict(client, image_bytes, task=None, query=None, **headers):
+    data = {"task": task} if task is not None else {}
+    params = {"task": query} if query is not None else {}
+    return client.post(
+        "/predict", data=data, params=params, headers=headers,
+        files={"image": ("scan.png", image_bytes, "image/png")},
+    )
+
+
+def test_ready(client):
+    assert client.get("/ready").status_code == 200
+
+
+@pytest.mark.parametrize("task, query", [
+    ("Pneumonia Detection", None),
+    ("pneumonia", None),
+    (None, "PneumoniaMNIST"),
+])
+def test_predict(client, synthetic_models, image_bytes, task, query):
+    response = predict(client, image_bytes, task=task, query=query)
+    assert response.status_code == 200
+    result = response.json()
+    assert "error" not in result
+    class_info = synthetic_models["Pneumonia Detection"]["class_info"]
+    assert str(result["prediction"]) in class_info
+    assert result["class_name"] == class_info[str(result["prediction"])]["class"]
+    assert 0 <= result["confidence"] <= 100
+    assert result["model_version"] >= 1
+
+
+def test_predict_is_deterministic_and_compactable(client, image_bytes):
+    full = predict(client, image_bytes, task="skin").json()
+    compact = predict(client, image_bytes, task="skin", Prefer="return=minimal")
+    assert compact.headers["link"] == '</catalog>; rel="describedby"'
+    assert compact.json()["prediction"] == full["prediction"]
+    assert "class_name" not in compact.json()
+
+
+@pytest.mark.parametrize("task, query, status", [
+    ("Heart Disease", None, 400),
+    (None, "Heart Disease", 400),
+    (None, None, 400),
+])
+def test_predict_rejects_tasks(client, image_bytes, task, query, status):
+    response = predict(client, image_bytes, task=task, query=query)
+    assert response.status_code == status
+    assert "error" in response.json()
+
+
+def test_predict_rejects_non_images(client):
+    response = predict(client, b"%PDF-1.7\n" + bytes(256), task="pneumonia")
+    assert response.status_code == 415
+
+
+def test_job(client, image_bytes):
+    submitted = client.post(
+        "/jobs", data={"tasks": ["retina"]},
+        files=[("images", ("one.png", image_bytes, "image/png")), ("images", ("two.png", b"junk" * 8, "image/png"))],
+    )
+    assert submitted.status_code == 202
+    job = submitted.json()
+    assert job["total"] == 2
+
+    for _ in range(500):
+        status = client.get(job["status_url"]).json()
+        if status["state"] == "finished":
+            break
+        time.sleep(0.01)
+    assert (status["state"], status["done"], status["failed"]) == ("finished", 1, 1)
+    first, second = client.get(job["results_url"]).json()["results"]
+    assert first["filename"] == "one.png" and "prediction" in first
+    assert second["filename"] == "two.png" and "error" in second
+    assert client.get("/jobs/missing").status_code == 404
@@ -0,0 +1,79 @@
+import pytest
+
+from catalog import Catalog, CatalogError
+
+
+def entry(model_name, aliases=(), classes=2):
+    return {
+        "model_name": model_name,
+        "model_path": f"models/{model_name}.onnx",
+        "aliases": list(aliases),
+        "class_info": {str(i): {"class": f"class {i}", "desc": f"description {i}"} for i in range(classes)},
+    }
+
+
+@pytest.fixture
+def catalog():
+    return Catalog({
+        "Pneumonia Detection": entry("pneumoniamnist", ["pneumonia"]),
+        "Skin Lesion Detection": entry("dermamnist", ["derma", "skin"], classes=7),
+    })
+
+
+@pytest.mark.parametrize("name", [
+    "Skin Lesion Detection", "skin  lesion DETECTION", "dermamnist", "DermaMNIST", "derma", "Skin",
+])
+def test_names_resolve_to_the_task(catalog, name):
+    assert catalog.canonical(name) == "Skin Lesion Detection"
+    assert catalog.resolve(name) == "Skin Lesion Detection"
+    assert name in catalog
+
+
+def test_unknown_names(catalog):
+    assert catalog.canonical("retina") is None
+    assert catalog.canonical(None) is None
+    assert "retina" not in catalog
+    with pytest.raises(KeyError):
+        catalog.resolve("retina")
+
+
+def test_entries(catalog):
+    assert list(catalog) == ["Pneumonia Detection", "Skin Lesion Detection"]
+    assert catalog.num_classes("Skin Lesion Detection") == 7
+    assert catalog["pneumonia"]["model_name"] == "pneumoniamnist"
+    assert catalog.temperature("Pneumonia Detection") == 1.0
+    assert catalog.describe()["Skin Lesion Detection"]["aliases"] == ["derma", "skin"]
+
+
+def test_duplicate_alias_is_rejected():
+    with pytest.raises(CatalogError, match="already used"):
+        Catalog({
+            "Pneumonia Detection": entry("pneumoniamnist", ["chest"]),
+            "Breast Cancer Classification": entry("breastmnist", ["Chest"]),
+        })
+
+
+@pytest.mark.parametrize("model_info", [
+    {},
+    {"Pneumonia Detection": {**entry("pneumoniamnist"), "class_info": {"1": {"class": "a", "desc": "b"}}}},
+    {"Pneumonia Detection": {**entry("pneumoniamnist"), "temperature": 0}},
+    {"Pneumonia Detection": {**entry("pneumoniamnist"), "aliases": "pneumonia"}},
+])
+def test_invalid_model_info(model_info):
+    with pytest.raises(CatalogError):
+        Catalog(model_info)
+
+
+def test_catalog_etag(client):
+    response = client.get("/catalog")
+    assert response.status_code == 200
+    tag = response.headers["etag"]
+    assert tag.startswith('W/"')
+    assert "max-age" in response.headers["cache-control"]
+    assert set(response.json()) >= {"Pneumonia Detection", "Skin Lesion Detection"}
+
+    assert client.get("/catalog").headers["etag"] == tag
+    revalidated = client.get("/catalog", headers={"If-None-Match": tag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == tag
+    assert client.get("/catalog", headers={"If-None-Match": 'W/"stale"'}).status_code == 200
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+
+from jobs import JobRunner, MemoryBroker
+
+ITEMS = [("a.png", "Pneumonia Detection", b"a"), ("b.png", "Pneumonia Detection", b"b"),
+         ("c.png", "Skin Lesion Detection", b"c")]
+
+
+def error(index, message="boom"):
+    return {"index": index, "error": message}
+
+
+@pytest.fixture
+def broker():
+    broker = MemoryBroker()
+    broker.submit("job", ITEMS)
+    return broker
+
+
+def test_claims_same_task_chunks(broker):
+    assert broker.status("job")["state"] == "queued"
+    job_id, task, rows = broker.claim(10, lease_seconds=60)
+    assert (job_id, task) == ("job", "Pneumonia Detection")
+    assert [(index, filename, image) for index, filename, image, _ in rows] == [(0, "a.png", b"a"), (1, "b.png", b"b")]
+
+    job_id, task, rows = broker.claim(10, lease_seconds=60)
+    assert task == "Skin Lesion Detection" and [row[0] for row in rows] == [2]
+    # Everything is leased
+    assert broker.claim(10, lease_seconds=60) is None
+    assert broker.status("job")["running"] == 3
+
+
+def test_expired_lease_is_claimed_again(broker):
+    first = broker.claim(1, lease_seconds=0.05)
+    assert first[2][0][0] == 0
+    time.sleep(0.1)
+    again = broker.claim(1, lease_seconds=60)
+    assert again[2][0][0] == 0
+
+
+def test_renew_extends_the_lease(broker):
+    broker.claim(1, lease_seconds=0.05)
+    broker.renew("job", [0], lease_seconds=60)
+    time.sleep(0.1)
+    assert broker.claim(1, lease_seconds=60)[2][0][0] == 1
+
+
+def test_complete(broker):
+    broker.claim(10, lease_seconds=60)
+    broker.complete("job", {0: {"index": 0, "prediction": 1}, 1: error(1)})
+    status = broker.status("job")
+    assert (status["state"], status["done"], status["failed"], status["queued"]) == ("running", 1, 1, 1)
+    assert broker.results("job") == [{"index": 0, "prediction": 1}, error(1)]
+
+    broker.claim(10, lease_seconds=60)
+    broker.complete("job", {2: {"index": 2, "prediction": 0}})
+    status = broker.status("job")
+    assert status["state"] == "finished" and status["progress"] == 1.0 and status["finished_at"]
+
+
+def test_retry_until_attempts_run_out(broker):
+    for attempt in range(2):
+        _, _, rows = broker.claim(1, lease_seconds=60)
+        assert rows[0][0] == 0 and rows[0][3] == attempt
+        assert broker.retry("job", {0: error(0)}, delay=0, max_attempts=3) == 1
+        assert broker.status("job")["queued"] == 3
+
+    broker.claim(1, lease_seconds=60)
+    assert broker.retry("job", {0: error(0)}, delay=0, max_attempts=3) == 0
+    assert broker.status("job")["failed"] == 1
+    assert broker.results("job") == [error(0)]
+
+
+def test_retry_delay(broker):
+    broker.claim(1, lease_seconds=60)
+    broker.retry("job", {0: error(0)}, delay=60, max_attempts=3)
+    assert broker.claim(1, lease_seconds=60)[2][0][0] == 1
+
+
+def test_unknown_job():
+    broker = MemoryBroker()
+    assert broker.status("missing") is None
+    assert broker.results("missing") == []
+
+
+def test_runner_fails_a_poison_chunk_after_max_attempts():
+    broker = MemoryBroker()
+
+    def pipeline():
+        raise RuntimeError("model unavailable")
+
+    async def run():
+        runner = JobRunner(broker, pipeline, concurrency=1, max_attempts=2, retry_delay=0, poll_seconds=0.01)
+        runner.start()
+        job_id = await runner.submit(ITEMS[:2])
+        try:
+            for _ in range(500):
+                if broker.status(job_id)["state"] == "finished":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await runner.stop()
+        return job_id, runner.stats()
+
+    job_id, stats = asyncio.run(run())
+    assert broker.status(job_id)["failed"] == 2
+    assert stats["errors"] == 2 and stats["retries"] == 2
+    assert [result["error"] for result in broker.results(job_id)] == ["Error processing image: model unavailable"] * 2
@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import pytest
+from starlette.requests import Request
+
+from common import negotiation
+from common.negotiation import JSON, MSGPACK, etag, etag_matches, header_qualities, render, response_format
+
+needs_msgpack = pytest.mark.skipif(negotiation.msgpack is None, reason="msgpack is not installed")
+needs_brotli = pytest.mark.skipif(negotiation.brotli is None, reason="brotli is not installed")
+
+
+def request(query="", **headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "query_string": query.encode(),
+        "headers": [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_header_qualities():
+    assert header_qualities("application/json;q=0.5, application/msgpack, br;q=0, gzip;q=junk") == {
+        "application/json": 0.5, "application/msgpack": 1.0, "br": 0.0, "gzip": 0.0,
+    }
+    assert header_qualities(None) == {}
+
+
+def test_defaults_to_full_json():
+    assert response_format(request()) == (False, JSON, None)
+    assert response_format(request(accept="text/html, */*;q=0.8")).media_type == JSON
+
+
+def test_compact():
+    assert response_format(request("compact=true")).compact
+    assert response_format(request(prefer="return=minimal")).compact
+    assert not response_format(request("compact=0")).compact
+
+
+@needs_msgpack
+def test_msgpack_by_quality():
+    assert response_format(request(accept="application/msgpack")).media_type == MSGPACK
+    assert response_format(request(accept="application/x-msgpack, application/json")).media_type == MSGPACK
+    assert response_format(request(accept="application/json, application/msgpack;q=0.5")).media_type == JSON
+    assert response_format(request(accept="application/msgpack;q=0")).media_type == JSON
+
+
+@needs_brotli
+def test_content_coding():
+    assert response_format(request(accept_encoding="gzip, br")).encoding == "br"
+    assert response_format(request(accept_encoding="br;q=0, gzip")).encoding == "gzip"
+    assert response_format(request(accept_encoding="*")).encoding == "br"
+    assert response_format(request(accept_encoding="identity")).encoding is None
+
+
+def test_render_compacts_and_compresses():
+    result = {"prediction": 1, "class_name": "a", "top_k": [{"class_id": 1, "class_desc": "b"}], "pad": "x" * 2048}
+    fmt = response_format(request("compact=1", accept_encoding="gzip"))._replace(encoding="gzip")
+    response = render({"results": [result]}, fmt)
+    assert response.headers["content-encoding"] == "gzip"
+    assert "rel=\"describedby\"" in response.headers["link"]
+    assert json.loads(gzip.decompress(response.body)) == {
+        "results": [{"prediction": 1, "top_k": [{"class_id": 1}], "pad": "x" * 2048}],
+    }
+
+    small = render({"prediction": 1}, fmt)
+    assert "content-encoding" not in small.headers
+
+
+def test_etag():
+    tag = etag({"b": 1, "a": [1, 2]})
+    assert tag.startswith('W/"') and tag.endswith('"')
+    assert tag == etag({"a": [1, 2], "b": 1})
+    assert tag != etag({"a": [1, 2], "b": 2})
+
+
+def test_etag_matches():
+    tag = etag({"a": 1})
+    strong = tag[2:]
+    assert etag_matches(tag, tag)
+    assert etag_matches(strong, tag)
+    assert etag_matches(f'W/"other", {tag}', tag)
+    assert etag_matches("*", tag)
+    assert not etag_matches('W/"other"', tag)
+    assert not etag_matches(None, tag)
+    assert not etag_matches("", tag)
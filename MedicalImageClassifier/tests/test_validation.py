@@ -0,0 +1,57 @@
+import io
+
+import pytest
+from PIL import Image
+
+from common.validation import (
+    FORM_OVERHEAD_BYTES,
+    InvalidImage,
+    check_content_length,
+    check_decoded_size,
+    check_image_header,
+)
+
+
+def encode(size, image_format):
+    buffer = io.BytesIO()
+    Image.new("RGB", size).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("image_format", ["PNG", "JPEG", "GIF", "BMP", "WEBP", "TIFF"])
+def test_header_gives_format_and_size(image_format):
+    assert check_image_header(encode((64, 48), image_format), complete=True) == (image_format, 64, 48)
+
+
+def test_unknown_format_is_415():
+    with pytest.raises(InvalidImage) as error:
+        check_image_header(b"%PDF-1.7\n" + bytes(64), complete=True)
+    assert error.value.status_code == 415
+
+
+def test_truncated_header():
+    header = encode((64, 48), "PNG")[:16]
+    assert check_image_header(header) is None
+    with pytest.raises(InvalidImage) as error:
+        check_image_header(header, complete=True)
+    assert error.value.status_code == 400
+
+
+def test_too_many_pixels_is_413():
+    header = encode((64, 48), "PNG")
+    with pytest.raises(InvalidImage) as error:
+        check_image_header(header, complete=True, max_pixels=64 * 48 - 1)
+    assert error.value.status_code == 413
+
+    with Image.open(io.BytesIO(header)) as image:
+        check_decoded_size(image, max_pixels=64 * 48)
+        with pytest.raises(InvalidImage):
+            check_decoded_size(image, max_pixels=100)
+
+
+def test_content_length():
+    check_content_length({}, max_bytes=10)
+    check_content_length({"content-length": str(10 + FORM_OVERHEAD_BYTES)}, max_bytes=10)
+    with pytest.raises(InvalidImage) as error:
+        check_content_length({"content-length": str(11 + FORM_OVERHEAD_BYTES)}, max_bytes=10)
+    assert error.value.status_code == 413
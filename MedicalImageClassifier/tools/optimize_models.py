@@ -0,0 +1,204 @@
+"""Build optimised variants of each model and record their accuracy/latency.
+
+For every task in model_info.json this writes, next to the original model:
+
+* ``optimized``    - ONNX Runtime graph-optimised model (extended level, portable)
+* ``int8_dynamic`` - dynamic INT8 quantisation (weights int8, activations at runtime)
+* ``int8_static``  - static QDQ INT8 quantisation calibrated on ``--calibration-dir``
+
+Each variant (and the fp32 baseline) is timed at batch size 1 and evaluated
+on the calibration images, each preprocessed to the input size, channels and
+dtype its model declares. Images stored as ``<dir>/<class_id>/*.png`` give a
+real accuracy; otherwise top-1 agreement with fp32 is reported. Results are
+written to ``model_info[task]["variants"]`` and the server picks a variant via
+``MODEL_VARIANT`` / ``MODEL_VARIANTS`` (see common/registry.py).
+
+Usage (from MedicalImageClassifier/):
+    python tools/optimize_models.py --calibration-dir path/to/images
+    python tools/optimize_models.py --synthetic /tmp/synthetic   # no LFS models needed
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.preprocessing import INPUT_SIZE, preprocess_image  # noqa: E402
+from common.registry import input_spec, warmup_input  # noqa: E402
+
+VARIANTS = ("optimized", "int8_dynamic", "int8_static")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def image_files(directory):
+    """Yield ``(path, folder name)`` for every image under ``directory``, in sorted order."""
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name), os.path.basename(root)
+
+
+def load_images(directory, limit=None):
+    """Return ``(images, labels)`` (raw file bytes); labels are None unless images sit in class-id folders."""
+    images, labels = [], []
+    for path, label in itertools.islice(image_files(directory), limit or None):
+        with open(path, "rb") as f:
+            images.append(f.read())
+        labels.append(int(label) if label.isdigit() else None)
+    if any(label is None for label in labels):
+        labels = None
+    return images, labels
+
+
+def preprocess_for(session, images):
+    """``images`` as inputs of ``session``'s model, at the size, channels and dtype it declares."""
+    spec = input_spec(session)
+    return [
+        preprocess_image(image, spec.size(INPUT_SIZE), channels=spec.channels, dtype=spec.dtype) for image in images
+    ]
+
+
+class CalibrationReader:
+    """Feeds preprocessed images to onnxruntime's static quantiser."""
+
+    def __init__(self, input_name, tensors):
+        self.input_name = input_name
+        self._tensors = iter(tensors)
+
+    def get_next(self):
+        tensor = next(self._tensors, None)
+        return None if tensor is None else {self.input_name: tensor}
+
+
+def variant_path(model_path, variant):
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
+
+def build_variant(model_path, variant, calibration):
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    output_path = variant_path(model_path, variant)
+    if variant == "optimized":
+        options = ort.SessionOptions()
+        # Extended (not "all") keeps the saved graph free of hardware-specific layouts
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        options.optimized_model_filepath = output_path
+        ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+    elif variant == "int8_dynamic":
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    elif variant == "int8_static":
+        if not calibration:
+            return None
+        session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        reader = CalibrationReader(session.get_inputs()[0].name, preprocess_for(session, calibration))
+        quantize_static(
+            model_path, output_path, reader,
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    else:
+        raise ValueError(f"Unknown variant: {variant}")
+    return output_path
+
+
+def evaluate(model_path, images, labels, runs):
+    session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    tensors = preprocess_for(session, images)
+
+    predictions = np.array([int(np.argmax(session.run(None, {input_name: t})[0], axis=1)[0]) for t in tensors])
+
+    sample = tensors[0] if tensors else warmup_input(session)[input_name]
+    for _ in range(3):
+        session.run(None, {input_name: sample})
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        session.run(None, {input_name: sample})
+        timings.append((time.perf_counter() - started) * 1000.0)
+
+    metrics = {
+        "model_path": model_path,
+        "size_bytes": os.path.getsize(model_path),
+        "latency_ms_p50": float(np.percentile(timings, 50)),
+        "latency_ms_p95": float(np.percentile(timings, 95)),
+    }
+    if labels is not None and len(predictions):
+        metrics["accuracy"] = float(np.mean(predictions == np.array(labels)))
+    return metrics, predictions
+
+
+def optimize_task(task, entry, variants, images, labels, runs):
+    base_path = entry["model_path"]
+    baseline, base_predictions = evaluate(base_path, images, labels, runs)
+    results = {"fp32": baseline}
+    print(f"{task}: fp32 p50={baseline['latency_ms_p50']:.2f}ms")
+
+    for variant in variants:
+        try:
+            output_path = build_variant(base_path, variant, images)
+        except Exception as e:
+            print(f"  {variant}: failed ({str(e)})")
+            continue
+        if output_path is None:
+            print(f"  {variant}: skipped (needs --calibration-dir)")
+            continue
+
+        metrics, predictions = evaluate(output_path, images, labels, runs)
+        metrics["speedup"] = baseline["latency_ms_p50"] / metrics["latency_ms_p50"]
+        if len(predictions):
+            metrics["agreement"] = float(np.mean(predictions == base_predictions))
+        if "accuracy" in metrics:
+            metrics["accuracy_delta"] = metrics["accuracy"] - baseline["accuracy"]
+        results[variant] = metrics
+        print(f"  {variant}: p50={metrics['latency_ms_p50']:.2f}ms speedup={metrics['speedup']:.2f}x"
+              f" agreement={metrics.get('agreement', float('nan')):.3f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build optimised/quantised model variants")
+    parser.add_argument("--model-info", default="utils/model_info.json")
+    parser.add_argument("--tasks", nargs="*", help="tasks to process (default: all)")
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--calibration-dir", help="images for calibration/evaluation")
+    parser.add_argument("--max-images", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=50, help="timed runs per variant")
+    parser.add_argument("--synthetic", metavar="DIR",
+                        help="generate tiny synthetic models/images in DIR and optimise those instead")
+    args = parser.parse_args()
+
+    model_info_path = args.model_info
+    calibration_dir = args.calibration_dir
+    if args.synthetic:
+        from synthetic import build
+
+        with open(model_info_path) as f:
+            build(args.synthetic, json.load(f))
+        model_info_path = os.path.join(args.synthetic, "model_info.json")
+        calibration_dir = calibration_dir or os.path.join(args.synthetic, "images")
+
+    with open(model_info_path) as f:
+        model_info = json.load(f)
+
+    images, labels = load_images(calibration_dir, args.max_images) if calibration_dir else ([], None)
+    variants = [variant for variant in args.variants.split(",") if variant]
+    for task in args.tasks or list(model_info):
+        model_info[task]["variants"] = optimize_task(task, model_info[task], variants, images, labels, args.runs)
+
+    with open(model_info_path, "w") as f:
+        json.dump(model_info, f, indent=4)
+    print(f"Variant metrics written to {model_info_path}")
+
+
+if __name__ == "__main__":
+    main()
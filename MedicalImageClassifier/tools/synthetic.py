@@ -0,0 +1,112 @@
+"""Tiny synthetic ONNX classifiers and images for offline tooling.
+
+The checked-in ``onnx_models/*.onnx`` files are Git LFS pointers, so the
+optimisation and benchmark tools can generate small stand-ins with the same
+interface: one ``(N, 3, H, W)`` float32 input named ``input`` and one
+``(N, num_classes)`` logits output named ``output``, with a dynamic batch
+dimension. ``--input-size 0`` makes the spatial dimensions dynamic too.
+
+Usage (from MedicalImageClassifier/):
+    python tools/synthetic.py OUTPUT_DIR [--images 32] [--input-size 0]
+
+writes one model per task in utils/model_info.json, a model_info.json that
+points at them and a folder of labelled images (``images/<class_id>/*.png``).
+"""
+import argparse
+import io
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+
+def make_classifier(path, num_classes, input_size=224, channels=16, seed=0, input_channels=3):
+    """Write a Conv-ReLU-GAP-Gemm classifier to ``path``; ``input_size=None`` leaves H and W dynamic."""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(seed)
+    initializers = [
+        numpy_helper.from_array(rng.normal(0, 0.5, (channels, input_channels, 3, 3)).astype(np.float32), "conv_w"),
+        numpy_helper.from_array(np.zeros(channels, dtype=np.float32), "conv_b"),
+        numpy_helper.from_array(rng.normal(0, 1.0, (channels, num_classes)).astype(np.float32), "fc_w"),
+        numpy_helper.from_array(np.zeros(num_classes, dtype=np.float32), "fc_b"),
+    ]
+    nodes = [
+        helper.make_node("Conv", ["input", "conv_w", "conv_b"], ["conv"], pads=[1, 1, 1, 1], strides=[2, 2]),
+        helper.make_node("Relu", ["conv"], ["relu"]),
+        helper.make_node("GlobalAveragePool", ["relu"], ["pool"]),
+        helper.make_node("Flatten", ["pool"], ["features"]),
+        helper.make_node("Gemm", ["features", "fc_w", "fc_b"], ["output"]),
+    ]
+    height, width = (input_size, input_size) if input_size else ("height", "width")
+    graph = helper.make_graph(
+        nodes,
+        "synthetic_classifier",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", input_channels, height, width])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch", num_classes])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    onnx.save(model, path)
+    return path
+
+
+def make_image(size=(256, 256), mode="RGB", seed=0, image_format="PNG"):
+    """Encoded bytes of a smooth random test image."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :] * rng.uniform(0.2, 1.0)
+    pixels = gradient + rng.normal(0, 25, (height, width)).astype(np.float32)
+    if mode == "RGB":
+        pixels = np.stack([pixels, pixels[:, ::-1], 255 - pixels], axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def num_classes(entry):
+    classes = entry.get("class_info") or [key for key in entry if key.isdigit()]
+    return len(classes)
+
+
+def build(output_dir, model_info, images_per_class=4, input_size=224):
+    """Synthetic models + model_info.json + labelled images under ``output_dir``."""
+    synthetic_info = {}
+    for seed, (task, entry) in enumerate(model_info.items()):
+        model_path = os.path.join(output_dir, entry["model_path"])
+        make_classifier(model_path, num_classes(entry), input_size=input_size, seed=seed)
+        synthetic_info[task] = {**entry, "model_path": model_path}
+    with open(os.path.join(output_dir, "model_info.json"), "w") as f:
+        json.dump(synthetic_info, f, indent=4)
+
+    max_classes = max(num_classes(entry) for entry in model_info.values())
+    for class_id in range(max_classes):
+        class_dir = os.path.join(output_dir, "images", str(class_id))
+        os.makedirs(class_dir, exist_ok=True)
+        for i in range(images_per_class):
+            with open(os.path.join(class_dir, f"{i}.png"), "wb") as f:
+                f.write(make_image(seed=class_id * 1000 + i))
+    return synthetic_info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic ONNX models and images")
+    parser.add_argument("output_dir")
+    parser.add_argument("--model-info", default="utils/model_info.json")
+    parser.add_argument("--images", type=int, default=4, help="images per class")
+    parser.add_argument("--input-size", type=int, default=224, help="model input side; 0 for dynamic H and W")
+    args = parser.parse_args()
+
+    with open(args.model_info) as f:
+        model_info = json.load(f)
+    build(args.output_dir, model_info, images_per_class=args.images, input_size=args.input_size or None)
+    print(f"Synthetic models and images written to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
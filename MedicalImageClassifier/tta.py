@@ -0,0 +1,104 @@
+"""Test-time augmentation (TTA) as one gather and one batched inference call.
+
+Flips are strided copies. Every other view (small rotations, centre crops) is
+expressed as a map from output pixel to source pixel. The maps for an input
+size are computed once and cached, so those views come from a single
+``np.take``. All ``views`` copies are written into one ``(views, 3, H, W)``
+batch. That batch goes through
+a single ``run_batch`` call, so 8 views cost one batched inference rather
+than eight. Models exported with a fixed batch dimension of 1 still run
+row by row (see ``registry.run_session``).
+
+Rotations and crops use nearest-neighbour sampling with edge replication,
+which is enough for averaging predictions and keeps the step one gather.
+
+The probabilities of the views are averaged. The spread of the winning
+class's probability across views is the uncertainty score.
+"""
+import functools
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from common.postprocess import log_softmax
+
+TTA_VIEWS = int(os.environ.get("TTA_VIEWS", "8"))
+
+# (horizontal flip, vertical flip, rotation in degrees, crop scale), in order of use;
+# the plain flips come first so the sampled views form one contiguous block
+VIEW_TRANSFORMS = (
+    (False, False, 0.0, 1.0),
+    (True, False, 0.0, 1.0),
+    (False, True, 0.0, 1.0),
+    (True, True, 0.0, 1.0),
+    (False, False, 10.0, 1.0),
+    (False, False, -10.0, 1.0),
+    (False, False, 0.0, 0.9),
+    (True, False, 0.0, 0.9),
+)
+FLIP_VIEWS = 4
+MAX_VIEWS = len(VIEW_TRANSFORMS)
+
+
+class TTASummary(NamedTuple):
+    log_probs: np.ndarray  # (C,) log of the view-averaged probabilities
+    prediction: int
+    uncertainty: float     # variance of the predicted class's probability across views
+    agreement: float       # share of views whose own top class is ``prediction``
+    views: int
+
+
+@functools.lru_cache(maxsize=8)
+def view_maps(channels, height, width):
+    """``(MAX_VIEWS - FLIP_VIEWS, C * H * W)`` flat source indices of the rotated and cropped views."""
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float64)
+    cy, cx = (height - 1) / 2.0, (width - 1) / 2.0
+    channel_offsets = np.arange(channels, dtype=np.intp)[:, np.newaxis] * (height * width)
+    maps = []
+    for flip_h, flip_v, degrees, scale in VIEW_TRANSFORMS[FLIP_VIEWS:]:
+        out_x = (width - 1 - xs) if flip_h else xs
+        out_y = (height - 1 - ys) if flip_v else ys
+        # Inverse mapping: rotate the output offset back and shrink it for the crop
+        theta = np.deg2rad(degrees)
+        dx, dy = out_x - cx, out_y - cy
+        src_x = (np.cos(theta) * dx + np.sin(theta) * dy) * scale + cx
+        src_y = (-np.sin(theta) * dx + np.cos(theta) * dy) * scale + cy
+        src_x = np.clip(np.rint(src_x), 0, width - 1).astype(np.intp)
+        src_y = np.clip(np.rint(src_y), 0, height - 1).astype(np.intp)
+        maps.append(((src_y * width + src_x).ravel() + channel_offsets).ravel())
+    maps = np.array(maps, dtype=np.intp).reshape(len(maps), channels * height * width)
+    maps.setflags(write=False)
+    return maps
+
+
+def augment(image_tensor, views=TTA_VIEWS, out=None):
+    """Expand a ``(1, 3, H, W)`` input into a ``(views, 3, H, W)`` batch of augmented views."""
+    views = max(1, min(int(views), MAX_VIEWS))
+    image = np.ascontiguousarray(image_tensor, dtype=np.float32)
+    _, channels, height, width = image.shape
+    if out is None:
+        out = np.empty((views, channels, height, width), dtype=np.float32)
+
+    for view, (flip_h, flip_v, _, _) in enumerate(VIEW_TRANSFORMS[:min(views, FLIP_VIEWS)]):
+        out[view] = image[0, :, ::-1 if flip_v else 1, ::-1 if flip_h else 1]
+    if views > FLIP_VIEWS:
+        # Indices are in range by construction; mode="clip" skips the bounds-check buffering
+        np.take(image.reshape(-1), view_maps(channels, height, width)[:views - FLIP_VIEWS],
+                out=out[FLIP_VIEWS:].reshape(views - FLIP_VIEWS, -1), mode="clip")
+    return out
+
+
+def summarize(logits, temperature=1.0):
+    """Average the views' probabilities and measure how much the views disagree."""
+    log_probs = log_softmax(logits, temperature)
+    probabilities = np.exp(log_probs)
+    mean = probabilities.mean(axis=0)
+    prediction = int(np.argmax(mean))
+    return TTASummary(
+        log_probs=np.log(mean),
+        prediction=prediction,
+        uncertainty=float(probabilities[:, prediction].var()),
+        agreement=float(np.mean(np.argmax(probabilities, axis=1) == prediction)),
+        views=len(probabilities),
+    )
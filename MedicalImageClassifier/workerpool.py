@@ -0,0 +1,524 @@
+"""Pre-started inference worker processes fed through shared memory.
+
+With ``INFERENCE_PROCESSES=N`` the API process only handles I/O, decoding
+and preprocessing; ONNX inference runs in ``N`` worker processes, each with
+its own ``ModelRegistry``, pinned to its own share of the CPUs (where the
+OS supports affinity) and with ``intra_op_num_threads`` set to that share.
+
+Every worker owns a ``multiprocessing.shared_memory`` block split into a
+ring of fixed-size slots. A request copies the batch into a free slot and
+sends only ``(slot, task, shape)`` over the worker's pipe; the worker runs
+the session on a view of the slot, writes the output back into the same
+slot and answers with the output shape. Tensors are never pickled.
+Batches larger than a slot are split across several slots.
+
+Requests name the serving version they were started on. ``reload`` has
+every worker build and warm a new version beside the current one, so the
+model hot reload in hotreload.py never stops the workers. ``input_spec``
+asks a worker for a model's declared input shape and dtype (loading the
+model if needed) so the API process can preprocess straight to it.
+
+Workers are started with the ``forkserver`` method (``spawn`` where it is
+unavailable), never forked straight from the multithreaded API process. A
+worker that exits is replaced after ``WORKER_RESTART_DELAY`` seconds with
+the current serving version; its in-flight batches fail. A worker that has
+not answered a batch within ``INFERENCE_TIMEOUT`` seconds is presumed hung,
+killed and replaced the same way. A request that waits
+``INFERENCE_SLOT_TIMEOUT`` seconds for a free slot raises
+``executors.Overloaded`` (503) instead of blocking.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from common.registry import InputSpec, ModelRegistry, run_session
+from executors import INFERENCE_PROCESSES, INFERENCE_RING_SLOTS, Overloaded
+
+# Intra-op threads per worker; 0 splits the CPUs evenly between workers
+INFERENCE_PROCESS_THREADS = int(os.environ.get("INFERENCE_PROCESS_THREADS", "0"))
+INFERENCE_SLOT_ROWS = int(os.environ.get("INFERENCE_SLOT_ROWS", "16"))
+WORKER_START_TIMEOUT = float(os.environ.get("WORKER_START_TIMEOUT", "300"))
+WORKER_RESTART_DELAY = float(os.environ.get("WORKER_RESTART_DELAY", "1"))
+INFERENCE_SLOT_TIMEOUT = float(os.environ.get("INFERENCE_SLOT_TIMEOUT", "10"))
+# A worker that takes longer than this over one batch is killed and restarted
+INFERENCE_TIMEOUT = float(os.environ.get("INFERENCE_TIMEOUT", "60"))
+
+SLOT_INPUT_SHAPE = (3, 224, 224)
+# Output values reserved per row (logits, or embeddings for larger heads)
+SLOT_OUTPUT_VALUES = 2048
+
+
+def _available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _slot_views(buffer, slot, input_bytes, output_bytes, input_shape=None, output_shape=None):
+    offset = slot * (input_bytes + output_bytes)
+    inputs = np.ndarray(input_shape, dtype=np.float32, buffer=buffer, offset=offset) if input_shape else None
+    outputs = np.ndarray(output_shape, dtype=np.float32, buffer=buffer, offset=offset + input_bytes) \
+        if output_shape else None
+    return inputs, outputs
+
+
+def _worker_main(shm_name, input_bytes, output_bytes, model_info, version, cpus, intra_op_threads, conn):
+    from multiprocessing import shared_memory
+
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # One registry per serving version (see hotreload.py), starting with the one started with
+    registries = {version: ModelRegistry(model_info, intra_op_threads=intra_op_threads)}
+    current = [version]
+    send_lock = threading.Lock()
+    if registries[version].preload:
+        registries[version].load_all()
+    conn.send(("ready", os.getpid(), registries[version].status()))
+
+    def reload(version, new_model_info, unchanged):
+        # Runs beside the request loop so the old version keeps serving meanwhile
+        try:
+            registry = ModelRegistry(new_model_info, intra_op_threads=intra_op_threads)
+            registry.adopt(registries[current[0]], unchanged)
+            if registry.preload:
+                registry.load_all()
+            errors = [f"{task}: {status['error']}" for task, status in registry.status()["models"].items()
+                      if status["state"] == "error"]
+            if errors:
+                raise RuntimeError("; ".join(errors))
+            registries[version] = registry
+            current[0] = version
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        with send_lock:
+            conn.send(("reloaded", version, error))
+
+    def describe(version, task):
+        # Also beside the request loop: the model may have to be loaded first
+        try:
+            registry = registries.get(version) or registries[current[0]]
+            reply = ("input", version, task, tuple(registry.input_spec(task)), None)
+        except Exception as e:
+            reply = ("input", version, task, None, f"{type(e).__name__}: {str(e)}")
+        with send_lock:
+            conn.send(reply)
+
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            if message[0] == "reload":
+                threading.Thread(target=reload, args=message[1:], daemon=True).start()
+                continue
+            if message[0] == "input":
+                threading.Thread(target=describe, args=message[1:], daemon=True).start()
+                continue
+            if message[0] == "retire":
+                if message[1] != current[0]:
+                    registries.pop(message[1], None)
+                continue
+            slot, task, version, shape, output_name = message
+            started = time.perf_counter()
+            try:
+                registry = registries.get(version) or registries[current[0]]
+                inputs, _ = _slot_views(shm.buf, slot, input_bytes, output_bytes, input_shape=shape)
+                result = run_session(registry.get(task), inputs, output_name).astype(np.float32, copy=False)
+                if result.nbytes > output_bytes:
+                    raise ValueError(f"Model output of {result.nbytes} bytes does not fit the slot")
+                _, outputs = _slot_views(shm.buf, slot, input_bytes, output_bytes, output_shape=result.shape)
+                outputs[...] = result
+                del inputs, outputs
+                reply = (slot, result.shape, None, time.perf_counter() - started)
+            except Exception as e:
+                reply = (slot, None, f"{type(e).__name__}: {str(e)}", time.perf_counter() - started)
+            with send_lock:
+                conn.send(reply)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+
+
+class _Worker:
+    """Parent-side handle: shared-memory ring, pipe, pending slots and counters."""
+
+    def __init__(self, index, shm, slots, conn, process, cpus):
+        self.index = index
+        self.shm = shm
+        self.conn = conn
+        self.process = process
+        self.cpus = cpus
+        self.free_slots = queue.Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+        self.pending = {}
+        self.reloads = {}
+        self.inputs = {}
+        self.send_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.alive = True
+        self.pid = None
+        self.requests = 0
+        self.rows = 0
+        self.errors = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+
+
+class InferenceWorkerPool:
+    """Dispatch ``(N, C, H, W)`` batches to pre-started inference processes."""
+
+    def __init__(self, model_info, num_workers=INFERENCE_PROCESSES, slots=INFERENCE_RING_SLOTS,
+                 slot_rows=INFERENCE_SLOT_ROWS, intra_op_threads=INFERENCE_PROCESS_THREADS,
+                 input_shape=SLOT_INPUT_SHAPE, output_values=SLOT_OUTPUT_VALUES,
+                 slot_timeout=INFERENCE_SLOT_TIMEOUT, restart_delay=WORKER_RESTART_DELAY,
+                 run_timeout=INFERENCE_TIMEOUT):
+        self.model_info = model_info
+        # Serving version of model_info; replacement workers start with it
+        self.version = 1
+        self.slot_timeout = slot_timeout
+        self.restart_delay = restart_delay
+        self.run_timeout = run_timeout
+        self.num_workers = max(1, int(num_workers))
+        self.slots = max(1, int(slots))
+        self.slot_rows = max(1, int(slot_rows))
+        self.input_bytes = self.slot_rows * int(np.prod(input_shape)) * 4
+        self.output_bytes = self.slot_rows * int(output_values) * 4
+        cpus = _available_cpus()
+        self.intra_op_threads = intra_op_threads or max(1, len(cpus) // self.num_workers)
+        # Round-robin CPU sets; workers are left unpinned when there are fewer CPUs than workers
+        self._cpu_sets = [
+            cpus[i::self.num_workers] if len(cpus) >= self.num_workers else []
+            for i in range(self.num_workers)
+        ]
+        self._workers = []
+        self._lock = threading.Lock()
+        # {(version, task): Future of InputSpec}; errors are not kept so the next request retries
+        self._inputs = {}
+        self._next = 0
+        self._closing = False
+
+    @property
+    def capacity(self):
+        """Slots across all workers, i.e. how many batches can be in flight at once."""
+        return self.num_workers * self.slots
+
+    def start(self):
+        """Start the workers; they load their models in the background."""
+        for index in range(self.num_workers):
+            self._workers.append(self._spawn(index))
+
+    def _spawn(self, index):
+        from multiprocessing import shared_memory
+
+        # Never fork: the API process runs threads (and this may be a reader thread)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        shm = shared_memory.SharedMemory(create=True, size=self.slots * (self.input_bytes + self.output_bytes))
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=_worker_main,
+            args=(shm.name, self.input_bytes, self.output_bytes, self.model_info, self.version,
+                  self._cpu_sets[index], self.intra_op_threads, child_conn),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(index, shm, self.slots, parent_conn, process, self._cpu_sets[index])
+        threading.Thread(target=self._read_responses, args=(worker,), name=f"inference-reader-{index}",
+                         daemon=True).start()
+        return worker
+
+    def _restart(self, worker):
+        """Replace a worker that exited, unless the pool is shutting down."""
+        time.sleep(self.restart_delay)
+        with self._lock:
+            if self._closing or self._workers[worker.index] is not worker:
+                return
+        replacement = self._spawn(worker.index)
+        replacement.restarts = worker.restarts + 1
+        with self._lock:
+            if not self._closing:
+                self._workers[worker.index] = replacement
+                replacement = None
+        if replacement is not None:
+            replacement.process.terminate()
+        try:
+            worker.shm.close()
+        except BufferError:
+            # A submitter still holds a view of the old ring; it is freed with that view
+            pass
+        worker.shm.unlink()
+
+    def wait_ready(self, timeout=WORKER_START_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        return all(worker.ready.wait(max(0.0, deadline - time.monotonic())) for worker in self._workers)
+
+    def run_batch(self, task, batch, version=1, output_name=None):
+        """Run ``batch`` for ``task`` on a worker; blocks the calling thread until done.
+
+        ``version`` selects the serving version (see ``reload``); workers fall
+        back to their newest one if it has been retired. ``output_name``
+        picks a model output other than the first (e.g. ``embedding``).
+        A worker that does not answer within ``run_timeout`` is restarted.
+        """
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        row_bytes = batch[0].nbytes if len(batch) else 0
+        if row_bytes > self.input_bytes:
+            raise ValueError(f"One input row ({row_bytes} bytes) does not fit an inference slot")
+        rows_per_slot = min(self.slot_rows, self.input_bytes // max(row_bytes, 1))
+        submitted = [
+            self._submit(task, version, output_name, batch[start:start + rows_per_slot])
+            for start in range(0, len(batch), rows_per_slot)
+        ]
+        deadline = time.monotonic() + self.run_timeout
+        outputs = []
+        for worker, future in submitted:
+            try:
+                outputs.append(future.result(max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                self._kill_hung(worker)
+                raise RuntimeError(f"Inference worker {worker.index} timed out after {self.run_timeout:g} s")
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+    def _pick_worker(self):
+        with self._lock:
+            candidates = [worker for worker in self._workers if worker.alive]
+            if not candidates:
+                # Every worker has exited; replacements are on their way
+                raise Overloaded("inference workers")
+            # Fewest batches in flight; rotate the start so ties spread evenly
+            self._next = (self._next + 1) % len(candidates)
+            rotated = candidates[self._next:] + candidates[:self._next]
+            return min(rotated, key=lambda worker: len(worker.pending))
+
+    def _submit(self, task, version, output_name, chunk):
+        deadline = time.monotonic() + self.slot_timeout
+        while True:
+            worker = self._pick_worker()
+            try:
+                slot = worker.free_slots.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise Overloaded("inference workers")
+            if worker.alive:
+                break
+            # The worker exited while we waited; try the others (or its replacement)
+        future = Future()
+        try:
+            inputs, _ = _slot_views(worker.shm.buf, slot, self.input_bytes, self.output_bytes, input_shape=chunk.shape)
+            inputs[...] = chunk
+            del inputs
+            with self._lock:
+                if not worker.alive:
+                    raise RuntimeError(f"Inference worker {worker.index} exited")
+                worker.pending[slot] = future
+            with worker.send_lock:
+                worker.conn.send((slot, task, version, chunk.shape, output_name))
+        except Exception:
+            with self._lock:
+                worker.pending.pop(slot, None)
+            worker.free_slots.put(slot)
+            raise
+        return worker, future
+
+    def _kill_hung(self, worker):
+        """Kill a worker that stopped answering; its reader thread fails its batches and restarts it."""
+        with self._lock:
+            if not worker.alive:
+                return
+            # No new batches go to it meanwhile
+            worker.alive = False
+        print(f"Inference worker {worker.index} did not answer within {self.run_timeout:g} s; restarting it")
+        worker.process.kill()
+
+    def _read_responses(self, worker):
+        try:
+            _, worker.pid, _ = worker.conn.recv()
+            worker.ready.set()
+            while True:
+                message = worker.conn.recv()
+                if message[0] == "reloaded":
+                    future = worker.reloads.pop(message[1], None)
+                    if future is not None:
+                        future.set_result(message[2])
+                    continue
+                if message[0] == "input":
+                    _, version, task, spec, error = message
+                    with self._lock:
+                        future = worker.inputs.pop((version, task), None)
+                    if future is not None:
+                        if error is None:
+                            future.set_result(InputSpec(*spec))
+                        else:
+                            future.set_exception(RuntimeError(error))
+                    continue
+                slot, shape, error, busy = message
+                with self._lock:
+                    future = worker.pending.pop(slot)
+                    worker.requests += 1
+                    worker.busy_seconds += busy
+                    if error is None:
+                        worker.rows += shape[0]
+                    else:
+                        worker.errors += 1
+                if error is None:
+                    _, outputs = _slot_views(worker.shm.buf, slot, self.input_bytes, self.output_bytes,
+                                             output_shape=shape)
+                    result = outputs.copy()
+                    del outputs
+                    worker.free_slots.put(slot)
+                    future.set_result(result)
+                else:
+                    worker.free_slots.put(slot)
+                    future.set_exception(RuntimeError(error))
+        except (EOFError, OSError):
+            pass
+        with self._lock:
+            worker.alive = False
+            pending, worker.pending = worker.pending, {}
+            reloads, worker.reloads = worker.reloads, {}
+            inputs, worker.inputs = worker.inputs, {}
+            for key, future in inputs.items():
+                if self._inputs.get(key) is future:
+                    del self._inputs[key]
+        worker.ready.set()
+        # Wake submitters waiting on this worker's slots so they move on
+        for slot in pending:
+            worker.free_slots.put(slot)
+        for future in pending.values():
+            future.set_exception(RuntimeError(f"Inference worker {worker.index} exited"))
+        for future in reloads.values():
+            future.set_result(f"Inference worker {worker.index} exited")
+        for future in inputs.values():
+            future.set_exception(RuntimeError(f"Inference worker {worker.index} exited"))
+        if not self._closing:
+            print(f"Inference worker {worker.index} exited; restarting it")
+            worker.process.join(timeout=5)
+            self._restart(worker)
+
+    def reload(self, version, model_info, unchanged=(), timeout=WORKER_START_TIMEOUT):
+        """Have every worker build and warm ``version``; raises unless all of them succeed.
+
+        Sessions of the ``unchanged`` tasks are reused. Workers keep serving
+        their current version until the caller switches to the new one.
+        """
+        futures = []
+        with self._lock:
+            workers = [worker for worker in self._workers if worker.alive]
+            for worker in workers:
+                future = worker.reloads[version] = Future()
+                futures.append(future)
+        if not workers:
+            raise RuntimeError("No inference workers are running")
+        for worker in workers:
+            with worker.send_lock:
+                worker.conn.send(("reload", version, model_info, list(unchanged)))
+        deadline = time.monotonic() + timeout
+        errors = [future.result(max(0.0, deadline - time.monotonic())) for future in futures]
+        errors = [f"worker {worker.index}: {error}" for worker, error in zip(workers, errors) if error]
+        if errors:
+            self.retire(version)
+            raise RuntimeError("; ".join(errors))
+        with self._lock:
+            self.model_info = model_info
+            self.version = version
+
+    def input_spec(self, task, version=1, timeout=WORKER_START_TIMEOUT):
+        """Declared input of ``task``'s model in ``version``; asked of one worker, then cached."""
+        key = (version, task)
+        worker = None
+        with self._lock:
+            future = self._inputs.get(key)
+        if future is None:
+            worker = self._pick_worker()
+            with self._lock:
+                future = self._inputs.get(key)
+                if future is None:
+                    future = self._inputs[key] = worker.inputs[key] = Future()
+                else:
+                    worker = None
+        if worker is not None:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(("input", version, task))
+            except Exception as e:
+                future.set_exception(e)
+        try:
+            return future.result(timeout)
+        except Exception:
+            with self._lock:
+                if self._inputs.get(key) is future:
+                    del self._inputs[key]
+            raise
+
+    def retire(self, version):
+        """Let the workers drop the sessions of a version that no longer serves."""
+        with self._lock:
+            for key in [key for key in self._inputs if key[0] == version]:
+                del self._inputs[key]
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(("retire", version))
+            except (OSError, ValueError):
+                pass
+
+    def is_ready(self):
+        return bool(self._workers) and all(worker.ready.is_set() and worker.alive for worker in self._workers)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            workers = [
+                {
+                    "index": worker.index,
+                    "pid": worker.pid,
+                    "alive": worker.alive,
+                    "ready": worker.ready.is_set() and worker.alive,
+                    "cpus": worker.cpus,
+                    "in_flight": len(worker.pending),
+                    "requests": worker.requests,
+                    "rows": worker.rows,
+                    "errors": worker.errors,
+                    "restarts": worker.restarts,
+                    "busy_seconds": worker.busy_seconds,
+                    # Share of wall time spent inside session.run since the worker started
+                    "utilization": worker.busy_seconds / max(now - worker.started, 1e-9),
+                }
+                for worker in self._workers
+            ]
+        return {
+            "processes": self.num_workers,
+            "intra_op_threads": self.intra_op_threads,
+            "slots_per_worker": self.slots,
+            "slot_rows": self.slot_rows,
+            "ready": self.is_ready(),
+            "workers": workers,
+        }
+
+    def close(self):
+        self._closing = True
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+            worker.shm.close()
+            worker.shm.unlink()
+        self._workers = []
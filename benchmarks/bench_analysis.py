@@ -0,0 +1,97 @@
+"""Microbenchmark: per-request analysis assembly vs the precomputed index in main.py.
+
+Compares the original ``generate_llm_analysis`` (dict lookups, confidence
+if-chain, f-string) followed by ``json.dumps`` of the response dict with
+``lookup_analysis`` plus the pre-encoded response fragments. Both paths are
+first checked to produce identical JSON for every task, class and
+confidence band.
+
+    python benchmarks/bench_analysis.py [--number 200000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def legacy_analysis(task, class_id, confidence):
+    class_name = main.class_descriptions[task][class_id]
+    detailed_explanation = main.llm_explanations[task][class_id]
+    treatment = main.treatment_recommendations[task][class_id]
+    if confidence > 95:
+        confidence_statement = "The model has very high confidence in this diagnosis."
+    elif confidence > 85:
+        confidence_statement = "The model has high confidence in this diagnosis."
+    elif confidence > 70:
+        confidence_statement = "The model has moderate confidence in this diagnosis."
+    else:
+        confidence_statement = "The model has low confidence in this diagnosis. Consider additional testing or expert consultation."
+    analysis = f"{detailed_explanation}\n\n{confidence_statement}\n\nRecommended approach: {treatment}"
+    return class_name, analysis
+
+
+def legacy_response(task, class_id, confidence):
+    class_name, class_desc = legacy_analysis(task, class_id, confidence)
+    return json.dumps({
+        "class_name": class_name,
+        "confidence": confidence,
+        "class_desc": class_desc,
+        "prediction": int(class_id),
+    }).encode("utf-8")
+
+
+def indexed_response(task, class_id, confidence):
+    entry = main.lookup_analysis(task, class_id, confidence)
+    return entry.head + main.dumps(confidence) + entry.tail
+
+
+def check_parity():
+    confidences = (50.0, 70.0, 70.5, 85.0, 85.01, 95.0, 95.5, 99.9)
+    for task, classes in main.class_descriptions.items():
+        for class_id in classes:
+            for confidence in confidences:
+                expected = json.loads(legacy_response(task, class_id, confidence))
+                actual = json.loads(indexed_response(task, class_id, confidence))
+                if expected != actual:
+                    raise AssertionError(f"Mismatch for {task}/{class_id} at {confidence}: {actual} != {expected}")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Analysis assembly microbenchmark")
+    parser.add_argument("--number", type=int, default=200000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    check_parity()
+    print(f"Parity OK; serializer: {'orjson' if main.orjson is not None else 'json'}")
+
+    rng = random.Random(0)
+    inputs = [
+        (task, rng.choice(list(classes)), rng.uniform(70.0, 99.9))
+        for task, classes in main.class_descriptions.items()
+        for _ in range(20)
+    ]
+
+    def run(fn):
+        def loop():
+            for task, class_id, confidence in inputs:
+                fn(task, class_id, confidence)
+        calls = max(1, args.number // len(inputs))
+        best = min(timeit.repeat(loop, number=calls, repeat=args.repeat))
+        return best / (calls * len(inputs)) * 1e9
+
+    legacy_ns = run(legacy_response)
+    indexed_ns = run(indexed_response)
+    print(f"legacy  (f-string + json.dumps): {legacy_ns:8.1f} ns/response")
+    print(f"indexed (pre-encoded fragments): {indexed_ns:8.1f} ns/response")
+    print(f"speedup: {legacy_ns / indexed_ns:.2f}x")
+
+
+if __name__ == "__main__":
+    cli()
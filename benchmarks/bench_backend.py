@@ -0,0 +1,109 @@
+"""Fidelity check for the synthetic inference backend in main.py.
+
+Calls ``SyntheticBackend.classify`` from ``--threads`` threads with a cost
+profile and compares the latency and CPU time it actually spent with the
+configured distributions. With more threads than CPUs the calls compete for
+CPU time and latency grows, as it would for a real model, so latency is only
+checked when the threads fit on the CPUs. It also checks the results are
+deterministic: the same image and seed give the same prediction, even in a
+fresh backend.
+
+    python benchmarks/bench_backend.py --latency 40 90 --cpu 30 70 --threads 1
+
+Exits non-zero if a prediction is not reproducible or a measured median is
+more than ``--tolerance`` percent off the configured one.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def make_images(count):
+    images = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), (i % 256, (i * 7) % 256, (i * 13) % 256)).save(buffer, format="PNG")
+        images.append(buffer.getvalue())
+    return images
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Synthetic backend fidelity check")
+    parser.add_argument("--latency", type=float, nargs=2, default=(40.0, 90.0), metavar=("P50", "P95"))
+    parser.add_argument("--cpu", type=float, nargs=2, default=(30.0, 70.0), metavar=("P50", "P95"))
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=15.0, help="allowed median error in percent")
+    args = parser.parse_args()
+
+    latency, cpu = main.LogNormal(*args.latency), main.LogNormal(*args.cpu)
+    profile = {task: (latency, cpu) for task in main.class_descriptions}
+    backend = main.SyntheticBackend(seed=1, profile=profile)
+    images = make_images(args.calls)
+    tasks = list(main.class_descriptions)
+
+    failures = []
+    fresh = main.SyntheticBackend(seed=1, profile={})
+    for i, image in enumerate(images[:50]):
+        task = tasks[i % len(tasks)]
+        if fresh.classify(task, image, None) != fresh.classify(task, image, None):
+            failures.append(f"prediction for image {i} is not reproducible")
+    if main.SyntheticBackend(seed=2, profile={}).classify(tasks[0], images[0], None) == \
+            fresh.classify(tasks[0], images[0], None):
+        print("note: seeds 1 and 2 agree on image 0 (possible by chance)")
+
+    walls, cpus = [], []
+    lock = threading.Lock()
+
+    def worker(offset):
+        for i in range(offset, args.calls, args.threads):
+            wall_started, cpu_started = time.perf_counter(), time.thread_time()
+            result = backend.classify(tasks[i % len(tasks)], images[i], None)
+            wall, used = (time.perf_counter() - wall_started) * 1000.0, (time.thread_time() - cpu_started) * 1000.0
+            if result != fresh.classify(tasks[i % len(tasks)], images[i], None):
+                failures.append(f"prediction for image {i} differs between backends with the same seed")
+            with lock:
+                walls.append(wall)
+                cpus.append(used)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"{'':10} {'p50 want':>9} {'p50 got':>9} {'p95 want':>9} {'p95 got':>9}")
+    for name, wanted, measured in (("latency", latency, walls), ("cpu", cpu, cpus)):
+        got_p50, got_p95 = statistics.median(measured), percentile(measured, 95)
+        print(f"{name + ' ms':10} {wanted.p50:9.1f} {got_p50:9.1f} {wanted.p95:9.1f} {got_p95:9.1f}")
+        if name == "latency" and args.threads > (os.cpu_count() or 1):
+            continue
+        if abs(got_p50 - wanted.p50) > wanted.p50 * args.tolerance / 100.0:
+            failures.append(f"{name} median {got_p50:.1f} ms, configured {wanted.p50:g} ms")
+    print(f"{args.calls / elapsed:.1f} calls/s on {args.threads} threads "
+          f"({os.cpu_count()} CPUs; CPU-bound throughput is capped near cpu_count / cpu p50)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    cli()
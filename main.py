@@ -1,14 +1,38 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import numpy as np
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from starlette.concurrency import run_in_threadpool
+from types import MappingProxyType
+from typing import List, NamedTuple, Optional
+import bisect
+import hashlib
+import math
+import threading
+import time
 from PIL import Image
 import io
 import os
 import random
-import requests
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Upload parsing, archives, metrics and content negotiation are shared with
+# MedicalImageClassifier/api.py (see MedicalImageClassifier/common)
+from MedicalImageClassifier.common.archives import read_archive
+from MedicalImageClassifier.common.forms import read_image_form
+from MedicalImageClassifier.common.metrics import InstrumentationMiddleware, current_trace, metrics
+from MedicalImageClassifier.common.negotiation import (
+    CATALOG_LINK, CATALOG_MAX_AGE, COMPRESS_MIN_BYTES, JSON, VARY, ResponseFormat, compress, encode, etag,
+    etag_matches, response_format,
+)
+from MedicalImageClassifier.common.validation import (
+    FORM_OVERHEAD_BYTES, MAX_UPLOAD_BYTES, InvalidImage, check_image_header,
+)
+
 app = FastAPI()
 
 # Add CORS middleware to allow requests from your React app
@@ -20,6 +44,24 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+@app.middleware("http")
+async def fast_fail_uploads(request: Request, call_next):
+    """Refuse oversized bodies and unknown ?task= values before the body is read"""
+    if request.method == "POST" and request.url.path.startswith("/predict"):
+        length = request.headers.get("content-length", "")
+        limit = MAX_UPLOAD_BYTES if request.url.path == "/predict" else MAX_UPLOAD_BYTES * 64
+        if length.isdigit() and int(length) > limit + FORM_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"error": f"Upload exceeds {limit} bytes"})
+        task = request.query_params.get("task")
+        if task is not None and task not in class_descriptions:
+            return JSONResponse(status_code=400, content={"error": f"Unknown task type: {task}"})
+    return await call_next(request)
+
+# Prometheus metrics and per-stage Server-Timing headers (see MedicalImageClassifier/common/metrics.py)
+app.add_middleware(InstrumentationMiddleware)
+metrics.describe("inference_backend_info", "gauge", "The configured inference backend")
+metrics.describe("response_bytes_total", "counter", "Negotiated response body bytes by media type and encoding")
+
 # Mock class descriptions for different MNIST datasets
 class_descriptions = {
     "blood": {
@@ -131,83 +173,368 @@ treatment_recommendations = {
     }
 }
 
+# Confidence statements, lowest band first; a confidence above CONFIDENCE_THRESHOLDS[i]
+# falls in band i + 1
+CONFIDENCE_THRESHOLDS = (70, 85, 95)
+CONFIDENCE_STATEMENTS = (
+    "The model has low confidence in this diagnosis. Consider additional testing or expert consultation.",
+    "The model has moderate confidence in this diagnosis.",
+    "The model has high confidence in this diagnosis.",
+    "The model has very high confidence in this diagnosis.",
+)
+
+def dumps(obj) -> bytes:
+    """Serialize to JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class AnalysisEntry(NamedTuple):
+    class_name: str
+    analysis: str
+    # Pre-encoded response around the confidence value:
+    # head + <confidence> + tail == {"class_name":..,"confidence":..,"class_desc":..,"prediction":..}
+    head: bytes
+    tail: bytes
+
+def make_analysis_entry(class_id, class_name, analysis) -> AnalysisEntry:
+    return AnalysisEntry(
+        class_name,
+        analysis,
+        b'{"class_name":' + dumps(class_name) + b',"confidence":',
+        b',"class_desc":' + dumps(analysis) + b',"prediction":' + dumps(class_id) + b"}",
+    )
+
+def build_analysis_index():
+    """Render every (task, class, confidence band) analysis once at startup"""
+    index = {}
+    for task, classes in class_descriptions.items():
+        for class_id, class_name in classes.items():
+            detailed_explanation = llm_explanations[task][class_id]
+            treatment = treatment_recommendations[task][class_id]
+            for band, confidence_statement in enumerate(CONFIDENCE_STATEMENTS):
+                analysis = f"{detailed_explanation}\n\n{confidence_statement}\n\nRecommended approach: {treatment}"
+                index[(task, class_id, band)] = make_analysis_entry(class_id, class_name, analysis)
+    return MappingProxyType(index)
+
+ANALYSIS_INDEX = build_analysis_index()
+
+def confidence_band(confidence) -> int:
+    """Index into CONFIDENCE_STATEMENTS for a confidence in percent"""
+    return bisect.bisect_left(CONFIDENCE_THRESHOLDS, confidence)
+
+def lookup_analysis(task, class_id, confidence) -> AnalysisEntry:
+    entry = ANALYSIS_INDEX.get((task, class_id, confidence_band(confidence)))
+    if entry is None:
+        entry = make_analysis_entry(
+            class_id, f"{task.capitalize()} Class {class_id}", "Unable to generate detailed analysis."
+        )
+    return entry
+
 def generate_llm_analysis(task, class_id, confidence):
     """
     Generate a comprehensive analysis using pre-defined LLM responses
     """
-    try:
-        # Get the class description
-        class_name = class_descriptions[task][class_id]
-        
-        # Get the detailed explanation
-        detailed_explanation = llm_explanations[task][class_id]
-        
-        # Get treatment recommendation
-        treatment = treatment_recommendations[task][class_id]
-        
-        # Generate confidence assessment
-        if confidence > 95:
-            confidence_statement = "The model has very high confidence in this diagnosis."
-        elif confidence > 85:
-            confidence_statement = "The model has high confidence in this diagnosis."
-        elif confidence > 70:
-            confidence_statement = "The model has moderate confidence in this diagnosis."
-        else:
-            confidence_statement = "The model has low confidence in this diagnosis. Consider additional testing or expert consultation."
-        
-        # Combine all parts into a comprehensive analysis
-        analysis = f"{detailed_explanation}\n\n{confidence_statement}\n\nRecommended approach: {treatment}"
-        
-        return class_name, analysis
-    except Exception as e:
-        print(f"Error generating LLM analysis: {str(e)}")
-        return f"{task.capitalize()} Class {class_id}", "Unable to generate detailed analysis."
-
-def preprocess_image(image: Image.Image) -> np.ndarray:
-    """Preprocess the image for model input"""
-    # Resize to standard size
-    image = image.resize((224, 224))
-    # Convert to numpy array and normalize
-    image_array = np.array(image).astype(np.float32) / 255.0
-    # Add batch dimension if needed
-    if len(image_array.shape) == 3:  # For RGB images
-        image_array = np.expand_dims(image_array, axis=0)
-    return image_array
+    entry = lookup_analysis(task, class_id, confidence)
+    return entry.class_name, entry.analysis
+
+# Content negotiation for high-volume clients (see MedicalImageClassifier/common/negotiation.py):
+# compact results carry the class id, confidence and confidence band only, with the texts
+# coming once from GET /catalog; MessagePack and brotli/gzip are picked from the headers
+def encode_payload(payload, fmt: ResponseFormat) -> bytes:
+    # JSON goes through dumps, which uses orjson when it is installed
+    return dumps(payload) if fmt.media_type == JSON else encode(payload, fmt.media_type)
+
+async def negotiated_response(body: bytes, fmt: ResponseFormat, headers=None) -> Response:
+    """Response for an encoded body, compressed off the event loop when it is large enough"""
+    headers = {"Vary": VARY, **(headers or {})}
+    encoding = "identity"
+    if fmt.encoding is not None and len(body) >= COMPRESS_MIN_BYTES:
+        with current_trace().stage("compress"):
+            body = await run_in_threadpool(compress, body, fmt.encoding)
+        encoding = headers["Content-Encoding"] = fmt.encoding
+    metrics.inc("response_bytes_total", len(body), media_type=fmt.media_type, encoding=encoding)
+    return Response(content=body, media_type=fmt.media_type, headers=headers)
+
+def compact_prediction(predicted_class: int, confidence: float) -> dict:
+    """Class id, confidence and confidence band; look the texts up in GET /catalog"""
+    return {"prediction": int(predicted_class), "confidence": confidence, "band": confidence_band(confidence)}
+
+def build_catalog() -> dict:
+    """Class names and analyses per task, class id and confidence band"""
+    return {
+        "confidence_thresholds": list(CONFIDENCE_THRESHOLDS),
+        "tasks": {
+            task: {
+                str(class_id): {
+                    "class_name": class_name,
+                    "analysis": [
+                        ANALYSIS_INDEX[(task, class_id, band)].analysis for band in range(len(CONFIDENCE_STATEMENTS))
+                    ],
+                }
+                for class_id, class_name in classes.items()
+            }
+            for task, classes in class_descriptions.items()
+        },
+    }
+
+CATALOG = build_catalog()
+CATALOG_ETAG = etag(CATALOG)
+CATALOG_BODIES = {}
+
+# Inference backend answering /predict: "synthetic" needs no model files, "onnx" runs
+# the exported models
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "synthetic")
+SYNTHETIC_SEED = int(os.environ.get("SYNTHETIC_SEED", "0"))
+# Per-task cost of the synthetic backend as JSON, or a path to a JSON file; "*" applies
+# to every task, e.g. '{"*": {"latency_ms": {"p50": 40, "p95": 90}, "cpu_ms": {"p50": 30, "p95": 70}}}'
+SYNTHETIC_PROFILE = os.environ.get("SYNTHETIC_PROFILE", "")
+ONNX_MODEL_DIR = os.environ.get(
+    "ONNX_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "MedicalImageClassifier", "onnx_models")
+)
+ONNX_MODEL_FILES = {
+    "blood": "VSSM-BloodMNIST.onnx",
+    "breast": "VSSM-BreastMNIST.onnx",
+    "derma": "VSSM-DermaMNIST.onnx",
+    "pneumonia": "VSSM-PneumoniaMNIST.onnx",
+    "retina": "VSSM-RetinaMNIST.onnx",
+}
+
+# 95th percentile of the standard normal distribution
+Z_95 = 1.6448536269514722
+# Hashed repeatedly to spend CPU time; hashlib releases the GIL for buffers this size
+BURN_BUFFER = bytes(64 * 1024)
+
+class LogNormal(NamedTuple):
+    """Log-normal distribution given by its median and 95th percentile, in milliseconds"""
+    p50: float
+    p95: float
+
+    def at(self, z):
+        """Value at the standard normal quantile `z`"""
+        if self.p50 <= 0:
+            return 0.0
+        sigma = math.log(max(self.p95, self.p50) / self.p50) / Z_95
+        return self.p50 * math.exp(sigma * z)
+
+def burn_cpu(ms):
+    """Keep this thread busy for `ms` milliseconds of CPU time"""
+    deadline = time.thread_time() + ms / 1000.0
+    while time.thread_time() < deadline:
+        hashlib.blake2b(BURN_BUFFER).digest()
+
+def load_profile(value):
+    """Per-task (latency, cpu) distributions from SYNTHETIC_PROFILE"""
+    if not value:
+        return {}
+    if os.path.exists(value):
+        with open(value) as f:
+            value = f.read()
+    config = json.loads(value)
+    unknown = sorted(set(config) - set(class_descriptions) - {"*"})
+    if unknown:
+        raise ValueError(f"SYNTHETIC_PROFILE has unknown tasks: {', '.join(unknown)}")
+    profile = {}
+    for task in class_descriptions:
+        entry = {**config.get("*", {}), **config.get(task, {})}
+        if not entry:
+            continue
+        cpu = LogNormal(**entry.get("cpu_ms", {"p50": 0, "p95": 0}))
+        # Without a latency distribution the call takes as long as its CPU time
+        latency = LogNormal(**entry.get("latency_ms", cpu._asdict()))
+        profile[task] = (latency, cpu)
+    return profile
+
+class InferenceBackend:
+    """Turns a validated upload into a (class_id, confidence) prediction for a known task"""
+    name = None
+
+    def classify(self, task: str, contents: bytes, image: Image.Image):
+        """`image` has only had its header parsed; decoding it is up to the backend"""
+        raise NotImplementedError
+
+    def describe(self) -> dict:
+        return {"backend": self.name}
+
+class SyntheticBackend(InferenceBackend):
+    """
+    Deterministic predictions for load testing without model files.
+    The class and confidence depend only on the seed, the task and the image bytes.
+    Each call draws one normal quantile from a seeded stream and takes that quantile of
+    its task's latency and CPU distributions, so slow calls are also the expensive ones.
+    The CPU time is spent hashing, which releases the GIL like ONNX Runtime does, and the
+    rest of the latency is spent sleeping.
+    """
+    name = "synthetic"
+
+    def __init__(self, seed=SYNTHETIC_SEED, profile=None):
+        self.seed = seed
+        self.profile = load_profile(SYNTHETIC_PROFILE) if profile is None else profile
+        self._quantiles = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def classify(self, task, contents, image):
+        digest = hashlib.blake2b(f"{self.seed}:{task}:".encode(), digest_size=16)
+        digest.update(contents)
+        rng = random.Random(digest.digest())
+        predicted_class = rng.choice(list(class_descriptions[task]))
+        confidence = rng.uniform(70.0, 99.9)
+        with current_trace().stage("inference"):
+            self.spend(task)
+        return predicted_class, confidence
+
+    def spend(self, task):
+        """Take as long, and use as much CPU, as one call of `task`'s model would"""
+        costs = self.profile.get(task)
+        if costs is None:
+            return
+        latency, cpu = costs
+        with self._lock:
+            z = self._quantiles.gauss(0.0, 1.0)
+        started = time.perf_counter()
+        burn_cpu(cpu.at(z))
+        remaining = latency.at(z) / 1000.0 - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def describe(self):
+        return {
+            "backend": self.name,
+            "seed": self.seed,
+            "profile": {
+                task: {"latency_ms": latency._asdict(), "cpu_ms": cpu._asdict()}
+                for task, (latency, cpu) in self.profile.items()
+            },
+        }
+
+class OnnxBackend(InferenceBackend):
+    """
+    Runs the exported models from ONNX_MODEL_DIR through MedicalImageClassifier's model
+    registry, loaded on first use. Uploads are decoded straight to the input size, channel
+    count and dtype each model declares, and post-processed like MedicalImageClassifier/api.py.
+    """
+    name = "onnx"
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR):
+        # numpy and onnxruntime are only needed by this backend, so the mock server starts without them
+        from MedicalImageClassifier.common.registry import ModelRegistry
+
+        self.model_dir = model_dir
+        self.registry = ModelRegistry(
+            {task: {"model_path": os.path.join(model_dir, filename)} for task, filename in ONNX_MODEL_FILES.items()},
+            preload=False,
+            embeddings=False,
+        )
+
+    def classify(self, task, contents, image):
+        from MedicalImageClassifier.common.postprocess import top_k
+        from MedicalImageClassifier.common.preprocessing import preprocess_image
+        from MedicalImageClassifier.common.registry import run_session
+
+        session = self.registry.get(task)
+        spec = self.registry.input_spec(task)
+        trace = current_trace()
+        with trace.stage("decode"):
+            # JPEGs decode straight at a reduced scale
+            image_tensor = preprocess_image(contents, spec.size(), channels=spec.channels, dtype=spec.dtype)
+
+        with trace.stage("inference"):
+            best = top_k(run_session(session, image_tensor), k=1)
+        return int(best.classes[0, 0]), float(best.probabilities[0, 0] * 100.0)
+
+    def describe(self):
+        loaded = self.registry.status()["memory"]["loaded"]
+        return {"backend": self.name, "model_dir": self.model_dir, "loaded": sorted(loaded)}
+
+BACKENDS = {
+    "synthetic": SyntheticBackend,
+    "onnx": OnnxBackend,
+}
+
+def make_backend(name=INFERENCE_BACKEND) -> InferenceBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+inference_backend = make_backend()
+metrics.set("inference_backend_info", 1, backend=inference_backend.name)
+
+def classify_upload(task: str, contents: bytes):
+    """Validate the upload and classify it with the configured inference backend"""
+    with current_trace().stage("validate"):
+        # Format and size come from the file header, before anything is decoded
+        check_image_header(contents, complete=True)
+        try:
+            img = Image.open(io.BytesIO(contents))
+        except Exception:
+            raise InvalidImage("Unsupported or unrecognised image format", 415)
+
+    return inference_backend.classify(task, contents, img)
+
+def mock_predict(task: str, contents: bytes) -> dict:
+    """Decode the image and return a mock prediction for a known task"""
+    predicted_class, confidence = classify_upload(task, contents)
+    
+    # Generate LLM-enhanced explanation
+    class_name, class_desc = generate_llm_analysis(task, predicted_class, confidence)
+    
+    return {
+        "class_name": class_name,
+        "confidence": confidence,
+        "class_desc": class_desc,
+        "prediction": int(predicted_class)
+    }
+
+def mock_predict_compact(task: str, contents: bytes) -> dict:
+    """Classify without the analysis texts (compact responses)"""
+    return compact_prediction(*classify_upload(task, contents))
+
+def mock_predict_json(task: str, contents: bytes) -> bytes:
+    """Same as mock_predict, assembled from the pre-encoded analysis fragments"""
+    predicted_class, confidence = classify_upload(task, contents)
+    with current_trace().stage("analysis"):
+        entry = lookup_analysis(task, predicted_class, confidence)
+        return entry.head + dumps(confidence) + entry.tail
+
+def resolve_task(task: str) -> str:
+    if task not in class_descriptions:
+        raise InvalidImage(f"Unknown task type: {task}")
+    return task
 
 @app.post("/predict")
-async def predict(image: UploadFile = File(...), task: str = Form(...)):
+async def predict(request: Request, task: Optional[str] = None):
     """
-    Process the uploaded image and return prediction results with LLM-enhanced explanations
+    Process the uploaded image (an `image` file and a `task` field, or a `?task=` query
+    parameter) and return prediction results with LLM-enhanced explanations.
+    Compact, MessagePack and compressed responses are negotiated from the request headers.
     """
     try:
-        # Read and preprocess the image
-        contents = await image.read()
-        img = Image.open(io.BytesIO(contents)).convert("RGB")
-        
-        # In a real app, you would load and use your ONNX model here
-        # For now, we'll return mock prediction results
+        if task is not None:
+            task = resolve_task(task)
+
+        # The form is parsed as it streams in: an unknown task, a bad image header or an
+        # oversized body is refused without reading the rest, chunked uploads included
+        trace = current_trace()
+        with trace.stage("upload_read"):
+            fields, contents = await read_image_form(request, resolve_task, MAX_UPLOAD_BYTES)
+        task = task or fields.get("task")
+        if task is None:
+            raise InvalidImage("Missing 'task'")
+        trace.task = task
         
-        # Simulate model prediction with random values
-        if task in class_descriptions:
-            classes = list(class_descriptions[task].keys())
-            predicted_class = random.choice(classes)
-            confidence = random.uniform(70.0, 99.9)
-            
-            # Generate LLM-enhanced explanation
-            class_name, class_desc = generate_llm_analysis(task, predicted_class, confidence)
-            
-            return {
-                "class_name": class_name,
-                "confidence": confidence,
-                "class_desc": class_desc,
-                "prediction": int(predicted_class)
-            }
+        # Off the event loop: backends may decode, run a model or simulate one
+        fmt = response_format(request)
+        if fmt.compact:
+            body = encode_payload(await run_in_threadpool(mock_predict_compact, task, contents), fmt)
+            return await negotiated_response(body, fmt, headers=CATALOG_LINK)
+        if fmt.media_type == JSON:
+            body = await run_in_threadpool(mock_predict_json, task, contents)
         else:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Unknown task type: {task}"}
-            )
+            body = encode_payload(await run_in_threadpool(mock_predict, task, contents), fmt)
+        return await negotiated_response(body, fmt)
             
+    except InvalidImage as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
     except Exception as e:
         print(f"Error processing image: {str(e)}")
         return JSONResponse(
@@ -215,10 +542,76 @@ async def predict(image: UploadFile = File(...), task: str = Form(...)):
             content={"error": f"Error processing image: {str(e)}"}
         )
 
+@app.post("/predict/batch")
+async def predict_batch(
+    request: Request,
+    tasks: List[str] = Form(...),
+    images: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+):
+    """
+    Classify many images (or a zip/tar archive) in one request.
+    Send one `tasks` value for all images or one per image; results keep input order
+    and failures are reported per item. Responses are negotiated like /predict.
+    """
+    try:
+        items = [(upload.filename, await upload.read()) for upload in images or []]
+        if archive is not None:
+            items.extend(read_archive(await archive.read()))
+        if not items:
+            raise ValueError("No images submitted")
+        if len(tasks) == 1:
+            tasks = tasks * len(items)
+        elif len(tasks) != len(items):
+            expected = "1 task value" if len(items) == 1 else f"1 or {len(items)} task values"
+            raise ValueError(f"Expected {expected}, got {len(tasks)}")
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    fmt = response_format(request)
+    predict_one = mock_predict_compact if fmt.compact else mock_predict
+    results = []
+    for index, ((filename, contents), task) in enumerate(zip(items, tasks)):
+        result = {"index": index, "filename": filename, "task": task}
+        if task not in class_descriptions:
+            result["error"] = f"Unknown task type: {task}"
+        else:
+            try:
+                result.update(await run_in_threadpool(predict_one, task, contents))
+            except Exception as e:
+                result["error"] = f"Error processing image: {str(e)}"
+        results.append(result)
+    body = encode_payload({"results": results}, fmt)
+    return await negotiated_response(body, fmt, headers=CATALOG_LINK if fmt.compact else None)
+
+@app.get("/catalog")
+async def catalog(request: Request):
+    """
+    Class names and analyses by task, class id and confidence band, as referenced by
+    compact results. Send the ETag back in If-None-Match to revalidate.
+    """
+    fmt = response_format(request)
+    headers = {"ETag": CATALOG_ETAG, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), CATALOG_ETAG):
+        return Response(status_code=304, headers={**headers, "Vary": VARY})
+    body = CATALOG_BODIES.get(fmt.media_type)
+    if body is None:
+        body = CATALOG_BODIES[fmt.media_type] = encode_payload(CATALOG, fmt)
+    return await negotiated_response(body, fmt, headers=headers)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/backend")
+def backend():
+    """The configured inference backend and its settings"""
+    return inference_backend.describe()
+
 @app.get("/")
 def read_root():
     return {"message": "Medical Image Classification API with LLM Integration"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8503) 
\ No newline at end of file
+    uvicorn.run(app, host=os.environ.get("API_HOST", "0.0.0.0"), port=int(os.environ.get("API_PORT", "8503"))) 
\ No newline at end of file